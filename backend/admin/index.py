@@ -1,11 +1,817 @@
+import csv
+import io
 import json
 import os
-import psycopg2
 import random
-from typing import Dict, Any
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+import select
+from typing import Dict, Any, Callable, Iterator, List, Optional, Set, Tuple
+from datetime import datetime
+from decimal import Decimal
 
 ADMIN_PASSWORD = 'EE%adminA%%'
 
+DB_WARMUP_ON_IMPORT = os.environ.get('DB_WARMUP_ON_IMPORT') == '1'
+TIMING_SAMPLE_RATE = float(os.environ.get('TIMING_SAMPLE_RATE', '1'))
+TIMING_LOG = os.environ.get('TIMING_LOG') == '1'
+
+_timing = threading.local()
+
+
+class RequestTrace:
+    '''
+    Business: Where one sampled request spent its time: pool acquire, connect, each statement, the rest
+    '''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.acquire_ms = 0.0
+        self.connect_ms: Optional[float] = None
+        self.statements: List[Tuple[str, float]] = []
+
+    def record(self, statement: str, elapsed_ms: float) -> None:
+        self.statements.append((' '.join(statement.split())[:80], elapsed_ms))
+
+    def finish(self, event: Dict[str, Any], response: Dict[str, Any]) -> None:
+        total_ms = (time.perf_counter() - self.started) * 1000.0
+        db_ms = sum(ms for _, ms in self.statements)
+        app_ms = max(0.0, total_ms - db_ms - self.acquire_ms)
+        metrics = [f'acquire;dur={self.acquire_ms:.3f}']
+        if self.connect_ms is not None:
+            metrics.append(f'connect;dur={self.connect_ms:.3f}')
+        metrics += [
+            f'db;dur={db_ms:.3f};desc="{len(self.statements)} round trips"',
+            f'app;dur={app_ms:.3f}',
+            f'total;dur={total_ms:.3f}'
+        ]
+        headers = response.setdefault('headers', {})
+        headers['Server-Timing'] = ', '.join(metrics)
+        headers['Timing-Allow-Origin'] = '*'
+        
+        if TIMING_LOG:
+            print(json.dumps({
+                'event': 'request_timing',
+                'method': event.get('httpMethod'),
+                'action': (event.get('queryStringParameters') or {}).get('action'),
+                'status': response.get('statusCode'),
+                'totalMs': round(total_ms, 3),
+                'acquireMs': round(self.acquire_ms, 3),
+                'connectMs': round(self.connect_ms, 3) if self.connect_ms is not None else None,
+                'dbMs': round(db_ms, 3),
+                'roundTrips': len(self.statements),
+                'statements': [{'sql': sql, 'ms': round(ms, 3)} for sql, ms in self.statements]
+            }))
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return getattr(_timing, 'trace', None)
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    def execute(self, query: Any, vars: Any = None) -> Any:
+        trace = current_trace()
+        if trace is None:
+            return super().execute(query, vars)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            trace.record(query if isinstance(query, str) else query.decode(), (time.perf_counter() - started) * 1000.0)
+
+
+class TimedConnection(psycopg2.extensions.connection):
+    def cursor(self, *args: Any, **kwargs: Any) -> Any:
+        kwargs.setdefault('cursor_factory', TimedCursor)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self) -> None:
+        self._timed('COMMIT', super().commit)
+
+    def rollback(self) -> None:
+        self._timed('ROLLBACK', super().rollback)
+
+    def _timed(self, statement: str, end_transaction: Callable[[], None]) -> None:
+        trace = current_trace()
+        if trace is None or self.closed or self.get_transaction_status() == TRANSACTION_STATUS_IDLE:
+            end_transaction()
+            return
+        started = time.perf_counter()
+        try:
+            end_transaction()
+        finally:
+            trace.record(statement, (time.perf_counter() - started) * 1000.0)
+
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_HEALTHCHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTHCHECK_INTERVAL', '30'))
+POOL_ACQUIRE_TIMEOUT = float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT', '5'))
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class ConnectionPool:
+    '''
+    Business: Keep Postgres connections open across warm invocations of this function instance
+    Args: max_size caps open connections, idle ones older than healthcheck_interval seconds are pinged before reuse
+    '''
+
+    def __init__(self, max_size: int, healthcheck_interval: float, acquire_timeout: float,
+                 on_connect: Optional[Callable[[Any], None]] = None):
+        self.max_size = max_size
+        self.healthcheck_interval = healthcheck_interval
+        self.acquire_timeout = acquire_timeout
+        self.on_connect = on_connect
+        self.stats = {'hits': 0, 'misses': 0, 'reconnects': 0, 'waits': 0}
+        self._idle: List[Tuple[Any, float]] = []
+        self._leased: Set[int] = set()
+        self._open = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, dsn: str, timeout: Optional[float] = None) -> Any:
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        while True:
+            with self._cond:
+                while not self._idle and self._open >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhausted()
+                    self.stats['waits'] += 1
+                    self._cond.wait(remaining)
+                if not self._idle:
+                    self._open += 1
+                    break
+                conn, released_at = self._idle.pop()
+                self._leased.add(id(conn))
+            
+            # The liveness probe can be a network round trip, so it runs outside the
+            # lock; the connection counts as leased meanwhile
+            if self._is_alive(conn, released_at):
+                with self._cond:
+                    self.stats['hits'] += 1
+                return conn
+            with self._cond:
+                self._leased.discard(id(conn))
+                self._discard(conn)
+                self.stats['reconnects'] += 1
+                self._cond.notify()
+        
+        conn = None
+        started = time.perf_counter()
+        try:
+            conn = psycopg2.connect(dsn, connection_factory=TimedConnection)
+            if self.on_connect:
+                self.on_connect(conn)
+        except Exception:
+            if conn is not None:
+                conn.close()
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        
+        trace = current_trace()
+        if trace:
+            # Overview workers share the request's trace, so their connects add up
+            trace.connect_ms = (trace.connect_ms or 0.0) + (time.perf_counter() - started) * 1000.0
+        
+        with self._cond:
+            self.stats['misses'] += 1
+            self._leased.add(id(conn))
+        return conn
+
+    def release(self, conn: Any) -> None:
+        with self._cond:
+            if id(conn) not in self._leased:
+                return
+            self._leased.discard(id(conn))
+        
+        healthy = not conn.closed
+        if healthy and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                healthy = False
+        
+        with self._cond:
+            if healthy:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._discard(conn)
+            self._cond.notify()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(self.stats, open=self._open, idle=len(self._idle))
+
+    def close(self) -> None:
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+    def _is_alive(self, conn: Any, released_at: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - released_at < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn: Any) -> None:
+        self._open -= 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+SETTINGS_CACHE_TTL = float(os.environ.get('SETTINGS_CACHE_TTL', '5'))
+SETTINGS_CHANNEL = 'settings_updated'
+LONG_POLL_MAX_WAIT = float(os.environ.get('LONG_POLL_MAX_WAIT', '25'))
+PURCHASE_REQUESTS_CHANNEL = 'purchase_requests'
+# A poller wakes at least this often so a waiter whose deadline passed can return
+LISTENER_POLL_SLICE = float(os.environ.get('LISTENER_POLL_SLICE', '1'))
+LISTENER_MAX_EVENTS = int(os.environ.get('LISTENER_MAX_EVENTS', '1000'))
+
+# Realized P&L of a sell is measured against the average buy price up to that sell,
+# the same rule trading applies incrementally
+PORTFOLIOS_FROM_LEDGER = """
+    SELECT user_id,
+           COALESCE(SUM(amount) FILTER (WHERE type = 'buy'), 0) AS bought_amount,
+           COALESCE(SUM(amount * price) FILTER (WHERE type = 'buy'), 0) AS bought_cost,
+           COALESCE(SUM(amount) FILTER (WHERE type = 'sell'), 0) AS sold_amount,
+           COALESCE(SUM(amount * price) FILTER (WHERE type = 'sell'), 0) AS sold_proceeds,
+           COALESCE(SUM(commission), 0) AS fees_paid,
+           COALESCE(SUM(amount * price - commission - amount * COALESCE(buy_cost / NULLIF(buy_amount, 0), 0))
+                    FILTER (WHERE type = 'sell'), 0) AS realized_pnl
+    FROM (
+        SELECT user_id, type, amount, price, commission,
+               SUM(amount) FILTER (WHERE type = 'buy') OVER w AS buy_amount,
+               SUM(amount * price) FILTER (WHERE type = 'buy') OVER w AS buy_cost
+        FROM transactions_ledger
+        WHERE user_id IS NOT NULL
+        WINDOW w AS (PARTITION BY user_id ORDER BY id)
+    ) ledger
+    GROUP BY user_id
+"""
+
+# What each platform_counters total should be, aggregated from the tables themselves
+PLATFORM_COUNTERS_ACTUAL = """
+    SELECT 'users' AS name, COUNT(*)::numeric AS value FROM users
+    UNION ALL SELECT 'supply', COALESCE(SUM(crypto_balance), 0) FROM user_balances
+    UNION ALL SELECT 'pending_requests', COUNT(*) FROM purchase_requests WHERE status = 'pending'
+    UNION ALL SELECT 'commission', COALESCE(SUM(commission), 0) FROM transactions_ledger
+    UNION ALL SELECT type || '_count', COUNT(*) FROM transactions_ledger GROUP BY type
+    UNION ALL SELECT type || '_amount', SUM(amount) FROM transactions_ledger GROUP BY type
+    UNION ALL SELECT type || '_value', SUM(amount * price) FROM transactions_ledger GROUP BY type
+"""
+EXPORT_PAGE_ROWS = int(os.environ.get('EXPORT_PAGE_ROWS', '50000'))
+EXPORT_BATCH_ROWS = int(os.environ.get('EXPORT_BATCH_ROWS', '2000'))
+
+EXPORTS = {
+    'users': (
+        ['id', 'username', 'cryptoBalance', 'createdAt'],
+        """SELECT u.id, u.username, COALESCE(ub.crypto_balance, 0), u.created_at
+           FROM users u
+           LEFT JOIN user_balances ub ON u.id = ub.user_id
+           WHERE u.id > %s
+           ORDER BY u.id
+           LIMIT %s"""
+    ),
+    'transactions': (
+        ['id', 'userId', 'username', 'type', 'amount', 'price', 'commission', 'createdAt'],
+        """SELECT t.id, t.user_id, u.username, t.type, t.amount, t.price, t.commission, t.created_at
+           FROM transactions t
+           LEFT JOIN users u ON t.user_id = u.id
+           WHERE t.id > %s
+           ORDER BY t.id
+           LIMIT %s"""
+    ),
+    'purchases': (
+        ['id', 'userId', 'username', 'amount', 'price', 'signature', 'status', 'createdAt', 'approvedAt'],
+        """SELECT pr.id, pr.user_id, u.username, pr.amount, pr.price, pr.signature, pr.status,
+                  pr.created_at, pr.approved_at
+           FROM purchase_requests pr
+           LEFT JOIN users u ON pr.user_id = u.id
+           WHERE pr.id > %s
+           ORDER BY pr.id
+           LIMIT %s"""
+    )
+}
+
+
+class SettingsCache:
+    '''
+    Business: All settings rows loaded with one query, kept for ttl seconds or until a settings_updated notification arrives
+    Args: ttl in seconds, a backstop for notifications sent while this instance was frozen
+    '''
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        self._values: Dict[str, str] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get(self, conn: Any) -> Dict[str, str]:
+        self._drain_notifications(conn)
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                self.stats['hits'] += 1
+                return self._values
+        
+        with conn.cursor() as cur:
+            cur.execute("SELECT key, value FROM settings")
+            values = dict(cur.fetchall())
+        
+        with self._lock:
+            self.stats['misses'] += 1
+            self._values = values
+            self._loaded_at = time.monotonic()
+        return values
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.stats['invalidations'] += 1
+            self._loaded_at = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(self.stats, hitRatio=self.stats['hits'] / lookups if lookups else 0.0)
+
+    def _drain_notifications(self, conn: Any) -> None:
+        conn.poll()
+        if not conn.notifies:
+            return
+        stale = any(n.channel == SETTINGS_CHANNEL for n in conn.notifies)
+        del conn.notifies[:]
+        if stale:
+            self.invalidate()
+
+
+def listen_for_settings(conn: Any) -> None:
+    with conn.cursor() as cur:
+        cur.execute(f"LISTEN {SETTINGS_CHANNEL}")
+    conn.commit()
+
+
+TRANSACTIONS_PARTITIONS_AHEAD = int(os.environ.get('TRANSACTIONS_PARTITIONS_AHEAD', '3'))
+TRANSACTIONS_RETENTION_MONTHS = int(os.environ.get('TRANSACTIONS_RETENTION_MONTHS', '12'))
+TRANSACTIONS_ARCHIVE_CHUNK_ROWS = int(os.environ.get('TRANSACTIONS_ARCHIVE_CHUNK_ROWS', '10000'))
+PARTITION_CHECK_INTERVAL = float(os.environ.get('PARTITION_CHECK_INTERVAL', '3600'))
+
+
+class TransactionPartitions:
+    '''
+    Business: Keeps monthly transactions partitions created ahead of time and moves expired ones into transactions_archive
+    Args: months_ahead past the current one, retention_months kept live, archive_chunk_rows per archived chunk, check_interval seconds between creation checks
+    '''
+
+    def __init__(self, months_ahead: int, retention_months: int, archive_chunk_rows: int, check_interval: float):
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.archive_chunk_rows = archive_chunk_rows
+        self.check_interval = check_interval
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def due(self) -> bool:
+        with self._lock:
+            return self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval
+
+    def ensure(self, conn: Any) -> int:
+        with self._lock:
+            self._checked_at = time.monotonic()
+        with conn.cursor() as cur:
+            cur.execute("SELECT create_transactions_partitions(%s)", (self.months_ahead,))
+            created = cur.fetchone()[0]
+        conn.commit()
+        return created
+
+    def expired(self, conn: Any) -> List[Tuple[str, int]]:
+        # Partition names come back as regclass text, already quoted where needed
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT c.oid::regclass::text
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                CROSS JOIN LATERAL (
+                    SELECT (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \\(''([^'']+)''\\)'))[1]::timestamp AS upper
+                ) b
+                WHERE i.inhparent = 'transactions'::regclass
+                  AND b.upper <= date_trunc('month', LOCALTIMESTAMP) - make_interval(months => %s)
+                ORDER BY b.upper
+            """, (self.retention_months,))
+            names = [row[0] for row in cur.fetchall()]
+            partitions = []
+            for name in names:
+                cur.execute(f"SELECT COUNT(*) FROM {name}")
+                partitions.append((name, cur.fetchone()[0]))
+        conn.commit()
+        return partitions
+
+    def archive(self, conn: Any, name: str) -> None:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                INSERT INTO transactions_archive (month, chunk, row_count, min_id, max_id, rows)
+                SELECT month, chunk, COUNT(*), MIN(id), MAX(id),
+                       jsonb_agg(jsonb_build_array(id, user_id, type, amount, price, commission, created_at) ORDER BY id)
+                FROM (
+                    SELECT t.*, date_trunc('month', t.created_at) AS month,
+                           (row_number() OVER (PARTITION BY date_trunc('month', t.created_at) ORDER BY t.id) - 1) / %s AS chunk
+                    FROM {name} t
+                ) r
+                GROUP BY month, chunk
+            """, (self.archive_chunk_rows,))
+            cur.execute(f"ALTER TABLE transactions DETACH PARTITION {name}")
+            cur.execute(f"DROP TABLE {name}")
+        conn.commit()
+
+
+SETTINGS_CACHE = SettingsCache(SETTINGS_CACHE_TTL)
+TRANSACTION_PARTITIONS = TransactionPartitions(TRANSACTIONS_PARTITIONS_AHEAD, TRANSACTIONS_RETENTION_MONTHS,
+                                               TRANSACTIONS_ARCHIVE_CHUNK_ROWS, PARTITION_CHECK_INTERVAL)
+DB_POOL = ConnectionPool(POOL_MAX_SIZE, POOL_HEALTHCHECK_INTERVAL, POOL_ACQUIRE_TIMEOUT,
+                         on_connect=listen_for_settings)
+
+
+def purchase_requests_json(cur: Any, condition: str, args: Tuple) -> str:
+    cur.execute(f"""
+        SELECT COALESCE(json_agg(json_build_object(
+                    'id', pr.id, 'userId', pr.user_id, 'username', u.username, 'amount', pr.amount,
+                    'price', pr.price, 'signature', pr.signature, 'status', pr.status, 'createdAt', pr.created_at,
+                    'kind', pr.kind, 'orderId', pr.order_id
+                ) ORDER BY pr.created_at DESC), '[]')::text
+        FROM purchase_requests pr
+        JOIN users u ON pr.user_id = u.id
+        WHERE {condition}
+    """, args)
+    return cur.fetchone()[0]
+
+
+# The admin listings are serialised by Postgres and passed through as JSON text, so
+# building a large response costs no Python time and overlaps fully in load_overview
+def users_json(cur: Any) -> str:
+    cur.execute("""
+        SELECT COALESCE(json_agg(json_build_object(
+                    'id', u.id, 'name', u.username, 'cryptoBalance', COALESCE(ub.crypto_balance, 0)
+                ) ORDER BY u.created_at DESC), '[]')::text
+        FROM users u
+        LEFT JOIN user_balances ub ON u.id = ub.user_id
+    """)
+    return cur.fetchone()[0]
+
+
+def promotions_json(cur: Any) -> str:
+    cur.execute("""
+        SELECT COALESCE(json_agg(json_build_object(
+                    'id', id, 'title', title, 'description', description, 'discount', discount, 'active', active
+                ) ORDER BY created_at DESC), '[]')::text
+        FROM promotions
+    """)
+    return cur.fetchone()[0]
+
+
+def lotteries_json(cur: Any) -> str:
+    cur.execute("""
+        SELECT COALESCE(json_agg(json_build_object(
+                    'id', l.id, 'prize', l.prize, 'winnerId', l.winner_id, 'active', l.active,
+                    'winner', u.username, 'participantCount', l.participant_count
+                ) ORDER BY l.created_at DESC), '[]')::text
+        FROM lotteries l
+        LEFT JOIN users u ON l.winner_id = u.id
+    """)
+    return cur.fetchone()[0]
+
+
+OVERVIEW_SECTIONS: Dict[str, Callable[[Any], str]] = {
+    'users': users_json,
+    'promotions': promotions_json,
+    'lotteries': lotteries_json,
+    'requests': lambda cur: purchase_requests_json(cur, "pr.status = 'pending'", ())
+}
+OVERVIEW_EXECUTOR = ThreadPoolExecutor(max_workers=len(OVERVIEW_SECTIONS) - 1, thread_name_prefix='overview')
+
+
+def load_section_pooled(dsn: str, load: Callable[[Any], str],
+                        trace: Optional[RequestTrace]) -> Tuple[bool, Optional[str]]:
+    # The worker records into the request's trace, so its statements count towards
+    # the request's db time and round trips; overlapping sections can make db
+    # exceed the wall-clock total
+    _timing.trace = trace
+    try:
+        try:
+            conn = DB_POOL.acquire(dsn, timeout=0)
+        except PoolExhausted:
+            return False, None
+        try:
+            with conn.cursor() as cur:
+                return True, load(cur)
+        finally:
+            DB_POOL.release(conn)
+    finally:
+        _timing.trace = None
+
+
+def overview_json(conn: Any, dsn: str) -> str:
+    '''
+    Business: Load every admin dashboard listing at once, one query per pooled connection
+    Args: conn leased for this request, which runs the first query itself; dsn for the extra connections
+    Returns: JSON object of users, promotions, lotteries and pending requests, shaped like their single-action responses
+    '''
+    (first, load_first), *rest = OVERVIEW_SECTIONS.items()
+    # Workers take a spare connection without waiting; a section that finds the pool
+    # empty runs afterwards on this request's connection instead
+    trace = current_trace()
+    futures = {name: OVERVIEW_EXECUTOR.submit(load_section_pooled, dsn, load, trace) for name, load in rest}
+    
+    sections = {}
+    with conn.cursor() as cur:
+        sections[first] = load_first(cur)
+        for name, future in futures.items():
+            loaded, section = future.result()
+            sections[name] = section if loaded else OVERVIEW_SECTIONS[name](cur)
+    return '{' + ', '.join(f'"{name}": {section}' for name, section in sections.items()) + '}'
+
+
+class PurchaseRequestListener:
+    '''
+    Business: One LISTEN connection per instance, outside the pool, shared by every long-polling admin tab;
+              the first waiter polls it for everyone and settings notifications still reach SETTINGS_CACHE
+    Args: max_events purchase_requests notifications remembered for waiters between checks
+    '''
+
+    def __init__(self, max_events: int):
+        self.stats = {'notifications': 0, 'reconnects': 0}
+        self._conn: Any = None
+        self._seq = 0
+        self._events: 'deque[Tuple[int, int]]' = deque(maxlen=max_events)
+        self._polling = False
+        self._cond = threading.Condition()
+
+    def start(self, dsn: str) -> int:
+        '''
+        Returns: position to wait from; anything committed after this call is delivered to wait()
+        '''
+        with self._cond:
+            while True:
+                if self._conn is not None and not self._conn.closed:
+                    return self._seq
+                if not self._polling:
+                    break
+                self._cond.wait()
+            self._polling = True
+        try:
+            self._connect(dsn)
+        finally:
+            with self._cond:
+                self._polling = False
+                self._cond.notify_all()
+        with self._cond:
+            return self._seq
+
+    def wait(self, dsn: str, since: int, timeout: float) -> Set[int]:
+        '''
+        Returns: purchase request ids notified after since, empty on timeout
+        '''
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                changed = {request_id for seq, request_id in self._events if seq > since}
+                remaining = deadline - time.monotonic()
+                if changed or remaining <= 0:
+                    return changed
+                if self._polling:
+                    self._cond.wait(remaining)
+                    continue
+                self._polling = True
+            try:
+                self._poll(dsn, min(remaining, LISTENER_POLL_SLICE))
+            finally:
+                with self._cond:
+                    self._polling = False
+                    self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(self.stats, connected=self._conn is not None and not self._conn.closed)
+
+    def _connect(self, dsn: str) -> Any:
+        if self._conn is not None and not self._conn.closed:
+            return self._conn
+        if self._conn is not None:
+            self.stats['reconnects'] += 1
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {PURCHASE_REQUESTS_CHANNEL}; LISTEN {SETTINGS_CHANNEL}")
+        # Settings notifications sent while no listener was connected are lost
+        SETTINGS_CACHE.invalidate()
+        self._conn = conn
+        return conn
+
+    def _poll(self, dsn: str, timeout: float) -> None:
+        conn = self._connect(dsn)
+        try:
+            if select.select([conn], [], [], timeout) != ([], [], []):
+                conn.poll()
+        except (psycopg2.Error, OSError):
+            conn.close()
+            raise
+        notifies = list(conn.notifies)
+        del conn.notifies[:]
+        with self._cond:
+            for notify in notifies:
+                if notify.channel == SETTINGS_CHANNEL:
+                    SETTINGS_CACHE.invalidate()
+                elif notify.channel == PURCHASE_REQUESTS_CHANNEL:
+                    self._seq += 1
+                    self._events.append((self._seq, int(notify.payload)))
+                    self.stats['notifications'] += 1
+
+
+PURCHASE_REQUEST_LISTENER = PurchaseRequestListener(LISTENER_MAX_EVENTS)
+
+
+def long_poll_purchase_requests(dsn: str, after_id: int, wait: float) -> Dict[str, Any]:
+    '''
+    Business: Long-poll for purchase requests created after after_id or changed while waiting, holding a
+              pooled connection only for the queries before and after the wait
+    Args: dsn, after_id highest request id the client has, wait seconds to block
+    Returns: HTTP response with new pending requests or the notified rows (any status); 204 on timeout
+    '''
+    since = PURCHASE_REQUEST_LISTENER.start(dsn)
+    conn = DB_POOL.acquire(dsn)
+    try:
+        with conn.cursor() as cur:
+            requests = purchase_requests_json(cur, "pr.status = 'pending' AND pr.id > %s", (after_id,))
+    finally:
+        DB_POOL.release(conn)
+    
+    if requests == '[]':
+        changed = PURCHASE_REQUEST_LISTENER.wait(dsn, since, wait)
+        if not changed:
+            return {
+                'statusCode': 204,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': '',
+                'isBase64Encoded': False
+            }
+        conn = DB_POOL.acquire(dsn)
+        try:
+            with conn.cursor() as cur:
+                requests = purchase_requests_json(cur, "pr.id = ANY(%s)", (sorted(changed),))
+        finally:
+            DB_POOL.release(conn)
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': '{"requests": ' + requests + '}',
+        'isBase64Encoded': False
+    }
+
+
+def decide_purchase_requests(conn: Any, decisions: Dict[int, bool]) -> Dict[int, str]:
+    '''
+    Business: Approve or reject many pending purchase requests with set-based statements
+    Args: conn inside the caller's transaction, decisions mapping request id to approved flag
+    Returns: request id to 'approved', 'rejected' or 'not_found' (missing or no longer pending)
+    '''
+    cur = conn.cursor()
+    cur.execute(
+        """SELECT id, user_id, amount, price, kind FROM purchase_requests
+           WHERE id = ANY(%s) AND status = 'pending'
+           ORDER BY id
+           FOR UPDATE""",
+        (list(decisions),)
+    )
+    pending = cur.fetchall()
+    
+    outcomes = {request_id: 'not_found' for request_id in decisions}
+    # A buy order's request only releases the order to the trading engine, which
+    # credits the buyer and charges commission per fill, so nothing is minted here
+    approved_ids = [row[0] for row in pending if decisions[row[0]]]
+    approved_rows = [row[:4] for row in pending if decisions[row[0]] and row[4] == 'purchase']
+    rejected_ids = [row[0] for row in pending if not decisions[row[0]]]
+    
+    if approved_ids:
+        cur.execute(
+            "UPDATE purchase_requests SET status = 'approved', approved_at = CURRENT_TIMESTAMP WHERE id = ANY(%s)",
+            (approved_ids,)
+        )
+        for request_id in approved_ids:
+            outcomes[request_id] = 'approved'
+    
+    if approved_rows:
+        commission_percent = float(SETTINGS_CACHE.get(conn)['commission'])
+        
+        cur.execute("SELECT discount FROM promotions WHERE active = true ORDER BY discount DESC LIMIT 1")
+        discount_row = cur.fetchone()
+        discount = float(discount_row[0]) if discount_row else 0
+        
+        credits: Dict[int, float] = {}
+        ledger = []
+        for request_id, user_id, amount, price in approved_rows:
+            commission = float(amount) * float(price) * (commission_percent / 100.0)
+            final_amount = float(amount) * (1 + discount / 100.0)
+            credits[user_id] = credits.get(user_id, 0.0) + final_amount
+            ledger.append((user_id, final_amount, price, commission))
+        
+        from psycopg2.extras import execute_values
+        execute_values(
+            cur,
+            """UPDATE user_balances ub SET crypto_balance = ub.crypto_balance + v.amount
+               FROM (VALUES %s) AS v(user_id, amount)
+               WHERE ub.user_id = v.user_id""",
+            sorted(credits.items()),
+            template='(%s::integer, %s::numeric)'
+        )
+        
+        # Portfolio totals are summed from the ledger rows as stored, so they agree
+        # with what rebuild_portfolios recomputes
+        execute_values(
+            cur,
+            """WITH recorded AS (
+                   INSERT INTO transactions (user_id, type, amount, price, commission)
+                   VALUES %s
+                   RETURNING user_id, amount, price, commission
+               )
+               INSERT INTO user_portfolios AS p (user_id, bought_amount, bought_cost, fees_paid)
+               SELECT user_id, SUM(amount), SUM(amount * price), SUM(commission)
+               FROM recorded
+               GROUP BY user_id
+               ORDER BY user_id
+               ON CONFLICT (user_id) DO UPDATE
+               SET bought_amount = p.bought_amount + EXCLUDED.bought_amount,
+                   bought_cost = p.bought_cost + EXCLUDED.bought_cost,
+                   fees_paid = p.fees_paid + EXCLUDED.fees_paid,
+                   updated_at = CURRENT_TIMESTAMP""",
+            ledger,
+            template="(%s, 'buy', %s, %s, %s)"
+        )
+    
+    if rejected_ids:
+        cur.execute(
+            "UPDATE purchase_requests SET status = 'rejected' WHERE id = ANY(%s)",
+            (rejected_ids,)
+        )
+        for request_id in rejected_ids:
+            outcomes[request_id] = 'rejected'
+    
+    cur.close()
+    return outcomes
+
+
+def export_value(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def stream_export(conn: Any, entity: str, fmt: str, after_id: int, limit: int) -> Iterator[Tuple[str, int, int]]:
+    '''
+    Business: Yield one export page as NDJSON or CSV chunks read through a server-side cursor
+    Args: entity key of EXPORTS, fmt 'ndjson' or 'csv', after_id keyset cursor, limit rows in the page
+    Returns: (text, last id, row count) per batch of at most EXPORT_BATCH_ROWS rows
+    '''
+    columns, query = EXPORTS[entity]
+    cur = conn.cursor(name=f'export_{entity}')
+    try:
+        cur.execute(query, (after_id, limit))
+        if fmt == 'csv' and after_id == 0:
+            yield ','.join(columns) + '\r\n', after_id, 0
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH_ROWS)
+            if not rows:
+                break
+            values = [[export_value(v) for v in row] for row in rows]
+            if fmt == 'csv':
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(values)
+                text = buffer.getvalue()
+            else:
+                text = ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in values)
+            yield text, rows[-1][0], len(rows)
+    finally:
+        cur.close()
+
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Admin operations - manage price, promotions, lotteries, approve purchases
@@ -27,6 +833,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    # Platform keep-alive pings (timer triggers without httpMethod, or ?action=ping)
+    # keep the instance warm and must not touch the database
+    if 'httpMethod' not in event or (event.get('queryStringParameters') or {}).get('action') == 'ping':
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'ok': True}),
+            'isBase64Encoded': False
+        }
+    
     headers = event.get('headers', {})
     admin_password = headers.get('x-admin-password') or headers.get('X-Admin-Password')
     
@@ -47,124 +863,187 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(dsn)
+    params = event.get('queryStringParameters') or {}
+    if method == 'GET' and params.get('action') == 'purchase_requests' and params.get('wait'):
+        try:
+            wait = float(params['wait'])
+            after_id = int(params.get('afterId', 0))
+        except ValueError:
+            wait = after_id = -1
+        if not 0 <= wait < float('inf') or after_id < 0:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'wait must be a non-negative number of seconds and afterId a non-negative integer'}),
+                'isBase64Encoded': False
+            }
+    else:
+        wait = 0
+    if wait > 0:
+        # Long polls wait on the shared listener connection, not a pooled one. A
+        # failed listener poll has already closed it, so the next waiter reconnects
+        try:
+            return long_poll_purchase_requests(dsn, after_id, min(wait, LONG_POLL_MAX_WAIT))
+        except (PoolExhausted, psycopg2.Error, OSError):
+            return {
+                'statusCode': 503,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': '1'},
+                'body': json.dumps({'error': 'Database busy, retry later'}),
+                'isBase64Encoded': False
+            }
+    
+    trace = RequestTrace() if random.random() < TIMING_SAMPLE_RATE else None
+    _timing.trace = trace
+    try:
+        conn = DB_POOL.acquire(dsn)
+    except PoolExhausted:
+        _timing.trace = None
+        return {
+            'statusCode': 503,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': '1'},
+            'body': json.dumps({'error': 'Database busy, retry later'}),
+            'isBase64Encoded': False
+        }
+    
+    if trace:
+        trace.acquire_ms = (time.perf_counter() - trace.started) * 1000.0
+    
+    try:
+        response = route_request(method, event, conn)
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        if method != 'GET' or not conn.closed:
+            raise
+        # A reused connection was dropped by the server; reads are safe to replay once
+        DB_POOL.release(conn)
+        conn = DB_POOL.acquire(dsn)
+        response = route_request(method, event, conn)
+    finally:
+        DB_POOL.release(conn)
+        _timing.trace = None
+    
+    if trace:
+        trace.finish(event, response)
+    return response
+
+
+def route_request(method: str, event: Dict[str, Any], conn: Any) -> Dict[str, Any]:
+    # Future partitions are created ahead from admin traffic; a failure here must not
+    # fail the request, and maintain_transactions reports it instead
+    if TRANSACTION_PARTITIONS.due():
+        try:
+            TRANSACTION_PARTITIONS.ensure(conn)
+        except psycopg2.Error:
+            conn.rollback()
+    
     cur = conn.cursor()
     
     if method == 'GET':
         action = event.get('queryStringParameters', {}).get('action', 'users')
         
         if action == 'users':
-            cur.execute("""
-                SELECT u.id, u.username, COALESCE(ub.crypto_balance, 0)
-                FROM users u
-                LEFT JOIN user_balances ub ON u.id = ub.user_id
-                ORDER BY u.created_at DESC
-            """)
-            
-            users = []
-            for row in cur.fetchall():
-                users.append({
-                    'id': row[0],
-                    'name': row[1],
-                    'cryptoBalance': float(row[2])
-                })
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': '{"users": ' + users_json(cur) + '}',
+                'isBase64Encoded': False
+            }
+        
+        elif action == 'overview':
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': overview_json(conn, os.environ['DATABASE_URL']),
+                'isBase64Encoded': False
+            }
+        
+        elif action == 'stats':
+            # Rollup counters kept by triggers in the writing transactions; at most
+            # 16 shard rows per counter, whatever the table sizes
+            cur.execute("SELECT name, SUM(value) FROM platform_counters GROUP BY name")
+            counters = {name: float(value) for name, value in cur.fetchall()}
             
-            cur.close()
-            conn.close()
+            trades = {}
+            for trade_type in ('buy', 'sell'):
+                trades[trade_type] = {
+                    'count': int(counters.get(f'{trade_type}_count', 0)),
+                    'amount': counters.get(f'{trade_type}_amount', 0.0),
+                    'value': counters.get(f'{trade_type}_value', 0.0)
+                }
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'users': users}),
+                'body': json.dumps({
+                    'users': int(counters.get('users', 0)),
+                    'circulatingSupply': counters.get('supply', 0.0),
+                    'pendingRequests': int(counters.get('pending_requests', 0)),
+                    'tradingVolume': trades['buy']['value'] + trades['sell']['value'],
+                    'commissionRevenue': counters.get('commission', 0.0),
+                    'trades': trades
+                }),
                 'isBase64Encoded': False
             }
         
-        elif action == 'promotions':
-            cur.execute("""
-                SELECT id, title, description, discount, active
-                FROM promotions
-                ORDER BY created_at DESC
-            """)
+        elif action == 'export':
+            params = event.get('queryStringParameters', {})
+            entity = params.get('entity', 'users')
+            fmt = params.get('format', 'ndjson')
+            after_id = int(params.get('afterId', 0))
             
-            promotions = []
-            for row in cur.fetchall():
-                promotions.append({
-                    'id': row[0],
-                    'title': row[1],
-                    'description': row[2],
-                    'discount': float(row[3]),
-                    'active': row[4]
-                })
-            
-            cur.close()
-            conn.close()
+            if entity not in EXPORTS or fmt not in ('ndjson', 'csv'):
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'entity must be users, transactions or purchases; format ndjson or csv'}),
+                    'isBase64Encoded': False
+                }
+            
+            # A function response is one body, so exports are cut into keyset pages of
+            # EXPORT_PAGE_ROWS; within a page rows arrive in batches from a named cursor
+            chunks = []
+            last_id, rows = after_id, 0
+            for text, last_id, count in stream_export(conn, entity, fmt, after_id, EXPORT_PAGE_ROWS):
+                chunks.append(text)
+                rows += count
+            
+            headers = {
+                'Content-Type': 'text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson',
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Expose-Headers': 'X-Next-After-Id'
+            }
+            if rows == EXPORT_PAGE_ROWS:
+                headers['X-Next-After-Id'] = str(last_id)
             
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': ''.join(chunks),
+                'isBase64Encoded': False
+            }
+        
+        elif action == 'promotions':
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'promotions': promotions}),
+                'body': '{"promotions": ' + promotions_json(cur) + '}',
                 'isBase64Encoded': False
             }
         
         elif action == 'lotteries':
-            cur.execute("""
-                SELECT l.id, l.prize, l.winner_id, l.active, u.username as winner_name,
-                       (SELECT COUNT(*) FROM lottery_participants WHERE lottery_id = l.id) as participant_count
-                FROM lotteries l
-                LEFT JOIN users u ON l.winner_id = u.id
-                ORDER BY l.created_at DESC
-            """)
-            
-            lotteries = []
-            for row in cur.fetchall():
-                lotteries.append({
-                    'id': row[0],
-                    'prize': float(row[1]),
-                    'winnerId': row[2],
-                    'active': row[3],
-                    'winner': row[4],
-                    'participantCount': row[5]
-                })
-            
-            cur.close()
-            conn.close()
-            
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'lotteries': lotteries}),
+                'body': '{"lotteries": ' + lotteries_json(cur) + '}',
                 'isBase64Encoded': False
             }
         
         elif action == 'purchase_requests':
-            cur.execute("""
-                SELECT pr.id, pr.user_id, u.username, pr.amount, pr.price, pr.signature, pr.status, pr.created_at
-                FROM purchase_requests pr
-                JOIN users u ON pr.user_id = u.id
-                WHERE pr.status = 'pending'
-                ORDER BY pr.created_at DESC
-            """)
-            
-            requests = []
-            for row in cur.fetchall():
-                requests.append({
-                    'id': row[0],
-                    'userId': row[1],
-                    'username': row[2],
-                    'amount': float(row[3]),
-                    'price': float(row[4]),
-                    'signature': row[5],
-                    'status': row[6],
-                    'createdAt': row[7].isoformat()
-                })
-            
-            cur.close()
-            conn.close()
+            requests = purchase_requests_json(cur, "pr.status = 'pending'", ())
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'requests': requests}),
+                'body': '{"requests": ' + requests + '}',
                 'isBase64Encoded': False
             }
     
@@ -175,8 +1054,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if action == 'set_price':
             new_price = body_data.get('price')
             if not new_price or float(new_price) <= 0:
-                cur.close()
-                conn.close()
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -189,8 +1066,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 (str(new_price),)
             )
             conn.commit()
-            cur.close()
-            conn.close()
+            SETTINGS_CACHE.invalidate()
             
             return {
                 'statusCode': 200,
@@ -202,8 +1078,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         elif action == 'set_commission':
             commission = body_data.get('commission')
             if commission is None or float(commission) < 0:
-                cur.close()
-                conn.close()
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -216,8 +1090,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 (str(commission),)
             )
             conn.commit()
-            cur.close()
-            conn.close()
+            SETTINGS_CACHE.invalidate()
             
             return {
                 'statusCode': 200,
@@ -232,8 +1105,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             discount = body_data.get('discount')
             
             if not title or not discount:
-                cur.close()
-                conn.close()
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -247,8 +1118,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             )
             promo_id = cur.fetchone()[0]
             conn.commit()
-            cur.close()
-            conn.close()
             
             return {
                 'statusCode': 201,
@@ -260,8 +1129,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         elif action == 'toggle_promotion':
             promo_id = body_data.get('promoId')
             if not promo_id:
-                cur.close()
-                conn.close()
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -271,8 +1138,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             cur.execute("UPDATE promotions SET active = NOT active WHERE id = %s", (promo_id,))
             conn.commit()
-            cur.close()
-            conn.close()
             
             return {
                 'statusCode': 200,
@@ -284,8 +1149,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         elif action == 'create_lottery':
             prize = body_data.get('prize')
             if not prize or float(prize) <= 0:
-                cur.close()
-                conn.close()
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -299,8 +1162,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             )
             lottery_id = cur.fetchone()[0]
             conn.commit()
-            cur.close()
-            conn.close()
             
             return {
                 'statusCode': 201,
@@ -312,8 +1173,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         elif action == 'draw_winner':
             lottery_id = body_data.get('lotteryId')
             if not lottery_id:
-                cur.close()
-                conn.close()
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -321,48 +1180,79 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            cur.execute(
-                "SELECT user_id FROM lottery_participants WHERE lottery_id = %s",
-                (lottery_id,)
-            )
-            participants = [row[0] for row in cur.fetchall()]
-            
-            if not participants:
-                cur.close()
-                conn.close()
+            winner_count = int(body_data.get('winners', 1))
+            if winner_count < 1:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'No participants'}),
+                    'body': json.dumps({'error': 'winners must be at least 1'}),
                     'isBase64Encoded': False
                 }
             
-            winner_id = random.choice(participants)
-            
-            cur.execute("SELECT prize FROM lotteries WHERE id = %s", (lottery_id,))
-            prize = cur.fetchone()[0]
-            
-            cur.execute(
-                "UPDATE lotteries SET winner_id = %s, active = false, completed_at = CURRENT_TIMESTAMP WHERE id = %s",
-                (winner_id, lottery_id)
-            )
+            # ORDER BY random() LIMIT n keeps only n rows in a top-N heap, so the
+            # draw stays uniform without shipping every participant to Python
+            cur.execute("""
+                WITH lottery AS (
+                    SELECT id, prize FROM lotteries WHERE id = %s AND active = true FOR UPDATE
+                ), winners AS (
+                    SELECT drawn.user_id, row_number() OVER () AS place
+                    FROM (
+                        SELECT p.user_id
+                        FROM lottery_participants p
+                        JOIN lottery l ON p.lottery_id = l.id
+                        ORDER BY random()
+                        LIMIT %s
+                    ) drawn
+                ), closed AS (
+                    UPDATE lotteries
+                    SET winner_id = (SELECT user_id FROM winners WHERE place = 1),
+                        active = false,
+                        completed_at = CURRENT_TIMESTAMP
+                    WHERE id IN (SELECT id FROM lottery) AND EXISTS (SELECT 1 FROM winners)
+                    RETURNING prize / (SELECT COUNT(*) FROM winners) AS share
+                ), credited AS (
+                    UPDATE user_balances
+                    SET crypto_balance = crypto_balance + (SELECT share FROM closed)
+                    WHERE user_id IN (SELECT user_id FROM winners) AND EXISTS (SELECT 1 FROM closed)
+                    RETURNING user_id
+                )
+                SELECT
+                    EXISTS (SELECT 1 FROM lottery),
+                    (SELECT share FROM closed),
+                    (SELECT json_agg(json_build_object('winnerId', w.user_id, 'winner', u.username) ORDER BY w.place)
+                     FROM winners w LEFT JOIN users u ON u.id = w.user_id)
+            """, (lottery_id, winner_count))
+            is_active, share, winners = cur.fetchone()
             
-            cur.execute(
-                "UPDATE user_balances SET crypto_balance = crypto_balance + %s WHERE user_id = %s",
-                (prize, winner_id)
-            )
+            if not is_active:
+                conn.rollback()
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Lottery not active'}),
+                    'isBase64Encoded': False
+                }
             
-            cur.execute("SELECT username FROM users WHERE id = %s", (winner_id,))
-            winner_name = cur.fetchone()[0]
+            if not winners:
+                conn.rollback()
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'No participants'}),
+                    'isBase64Encoded': False
+                }
             
             conn.commit()
-            cur.close()
-            conn.close()
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'winnerId': winner_id, 'winner': winner_name}),
+                'body': json.dumps({
+                    'winnerId': winners[0]['winnerId'],
+                    'winner': winners[0]['winner'],
+                    'winners': winners,
+                    'prizeEach': float(share)
+                }),
                 'isBase64Encoded': False
             }
         
@@ -371,8 +1261,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             approved = body_data.get('approved', False)
             
             if not request_id:
-                cur.close()
-                conn.close()
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -380,15 +1268,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            cur.execute(
-                "SELECT user_id, amount, price FROM purchase_requests WHERE id = %s AND status = 'pending'",
-                (request_id,)
-            )
-            request_data = cur.fetchone()
+            outcome = decide_purchase_requests(conn, {int(request_id): bool(approved)})[int(request_id)]
             
-            if not request_data:
-                cur.close()
-                conn.close()
+            if outcome == 'not_found':
+                conn.rollback()
                 return {
                     'statusCode': 404,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -396,43 +1279,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            user_id, amount, price = request_data
-            
-            if approved:
-                cur.execute("SELECT value FROM settings WHERE key = 'commission'")
-                commission_percent = float(cur.fetchone()[0])
-                commission = float(amount) * float(price) * (commission_percent / 100.0)
-                
-                cur.execute("SELECT discount FROM promotions WHERE active = true ORDER BY discount DESC LIMIT 1")
-                discount_row = cur.fetchone()
-                discount = float(discount_row[0]) if discount_row else 0
-                
-                final_amount = float(amount) * (1 + discount / 100.0)
-                
-                cur.execute(
-                    "UPDATE user_balances SET crypto_balance = crypto_balance + %s WHERE user_id = %s",
-                    (final_amount, user_id)
-                )
-                
-                cur.execute(
-                    """INSERT INTO transactions (user_id, type, amount, price, commission)
-                       VALUES (%s, 'buy', %s, %s, %s)""",
-                    (user_id, final_amount, price, commission)
-                )
-                
-                cur.execute(
-                    "UPDATE purchase_requests SET status = 'approved', approved_at = CURRENT_TIMESTAMP WHERE id = %s",
-                    (request_id,)
-                )
-            else:
-                cur.execute(
-                    "UPDATE purchase_requests SET status = 'rejected' WHERE id = %s",
-                    (request_id,)
-                )
-            
             conn.commit()
-            cur.close()
-            conn.close()
             
             return {
                 'statusCode': 200,
@@ -441,13 +1288,42 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
+        elif action == 'approve_purchases':
+            decisions = body_data.get('decisions') or []
+            
+            # requestId must be a JSON integer within the id column's range; a string
+            # or float would otherwise be coerced or fail deep in the query
+            if not isinstance(decisions, list) or not decisions or not all(
+                isinstance(d, dict) and type(d.get('requestId')) is int and 0 < d['requestId'] < 2 ** 31
+                for d in decisions
+            ):
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'decisions must be a list of objects with an integer requestId'}),
+                    'isBase64Encoded': False
+                }
+            
+            outcomes = decide_purchase_requests(
+                conn,
+                {d['requestId']: bool(d.get('approved', False)) for d in decisions}
+            )
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'results': [{'requestId': rid, 'status': status} for rid, status in outcomes.items()]
+                }),
+                'isBase64Encoded': False
+            }
+        
         elif action == 'remove_crypto':
             user_id = body_data.get('userId')
             amount = body_data.get('amount')
             
             if not user_id or not amount:
-                cur.close()
-                conn.close()
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -461,8 +1337,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             )
             
             conn.commit()
-            cur.close()
-            conn.close()
             
             return {
                 'statusCode': 200,
@@ -470,12 +1344,178 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'success': True}),
                 'isBase64Encoded': False
             }
+        
+        elif action == 'repair_participant_counts':
+            dry_run = bool(body_data.get('dryRun', False))
+
+            # Joins lock their lottery row before inserting, so once every row is held
+            # no join is in flight and the count below, on a fresh snapshot, sees all
+            # committed ones. In one statement FOR UPDATE would re-check only the
+            # lottery row after a wait and keep a count taken before that join
+            cur.execute("SELECT id FROM lotteries ORDER BY id FOR UPDATE")
+            cur.execute("""
+                SELECT l.id, l.participant_count, COALESCE(c.total, 0)
+                FROM lotteries l
+                LEFT JOIN (
+                    SELECT lottery_id, COUNT(*) AS total
+                    FROM lottery_participants
+                    GROUP BY lottery_id
+                ) c ON c.lottery_id = l.id
+                WHERE l.participant_count <> COALESCE(c.total, 0)
+            """)
+            mismatches = [
+                {'lotteryId': row[0], 'stored': row[1], 'actual': row[2]}
+                for row in cur.fetchall()
+            ]
+            
+            if mismatches and not dry_run:
+                from psycopg2.extras import execute_values
+                execute_values(
+                    cur,
+                    """UPDATE lotteries l SET participant_count = v.actual
+                       FROM (VALUES %s) AS v(id, actual)
+                       WHERE l.id = v.id""",
+                    [(m['lotteryId'], m['actual']) for m in mismatches]
+                )
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'repaired': not dry_run, 'mismatches': mismatches}),
+                'isBase64Encoded': False
+            }
+        
+        elif action == 'rebuild_portfolios':
+            dry_run = bool(body_data.get('dryRun', False))
+            
+            # Blocks buys and sells until commit, so none lands between the ledger read
+            # and the overwrite
+            cur.execute("LOCK TABLE user_portfolios IN EXCLUSIVE MODE")
+            cur.execute(f"""
+                WITH ledger AS ({PORTFOLIOS_FROM_LEDGER})
+                SELECT l.user_id
+                FROM ledger l
+                LEFT JOIN user_portfolios p ON p.user_id = l.user_id
+                WHERE (p.bought_amount, p.bought_cost, p.sold_amount, p.sold_proceeds, p.fees_paid, p.realized_pnl)
+                      IS DISTINCT FROM
+                      (l.bought_amount, l.bought_cost, l.sold_amount, l.sold_proceeds, l.fees_paid, l.realized_pnl)
+                ORDER BY l.user_id
+            """)
+            stale_ids = [row[0] for row in cur.fetchall()]
+            
+            if stale_ids and not dry_run:
+                cur.execute(f"""
+                    INSERT INTO user_portfolios AS p
+                        (user_id, bought_amount, bought_cost, sold_amount, sold_proceeds, fees_paid, realized_pnl)
+                    SELECT * FROM ({PORTFOLIOS_FROM_LEDGER}) l
+                    WHERE l.user_id = ANY(%s)
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET bought_amount = EXCLUDED.bought_amount,
+                        bought_cost = EXCLUDED.bought_cost,
+                        sold_amount = EXCLUDED.sold_amount,
+                        sold_proceeds = EXCLUDED.sold_proceeds,
+                        fees_paid = EXCLUDED.fees_paid,
+                        realized_pnl = EXCLUDED.realized_pnl,
+                        updated_at = CURRENT_TIMESTAMP
+                """, (stale_ids,))
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'rebuilt': not dry_run, 'staleUserIds': stale_ids}),
+                'isBase64Encoded': False
+            }
+        
+        elif action == 'reconcile_stats':
+            dry_run = bool(body_data.get('dryRun', False))
+            
+            # Counters and aggregates come from one snapshot, so their difference is
+            # exact while writes continue; it is added as a correction in shard -1,
+            # which triggers never write
+            conn.commit()
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cur.execute(f"""
+                SELECT COALESCE(a.name, c.name), COALESCE(c.value, 0), COALESCE(a.value, 0)
+                FROM ({PLATFORM_COUNTERS_ACTUAL}) a
+                FULL JOIN (
+                    SELECT name, SUM(value) AS value FROM platform_counters GROUP BY name
+                ) c ON c.name = a.name
+                WHERE COALESCE(a.value, 0) <> COALESCE(c.value, 0)
+                ORDER BY 1
+            """)
+            drifts = cur.fetchall()
+            
+            if drifts and not dry_run:
+                from psycopg2.extras import execute_values
+                execute_values(
+                    cur,
+                    """INSERT INTO platform_counters AS c (name, shard, value)
+                       VALUES %s
+                       ON CONFLICT (name, shard) DO UPDATE SET value = c.value + EXCLUDED.value""",
+                    [(name, actual - stored) for name, stored, actual in drifts],
+                    template='(%s, -1, %s)'
+                )
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'reconciled': not dry_run,
+                    'drifts': [
+                        {'counter': name, 'stored': float(stored), 'actual': float(actual)}
+                        for name, stored, actual in drifts
+                    ]
+                }),
+                'isBase64Encoded': False
+            }
+        
+        elif action == 'maintain_transactions':
+            dry_run = bool(body_data.get('dryRun', False))
+            
+            created = 0 if dry_run else TRANSACTION_PARTITIONS.ensure(conn)
+            expired = TRANSACTION_PARTITIONS.expired(conn)
+            if not dry_run:
+                for name, _ in expired:
+                    TRANSACTION_PARTITIONS.archive(conn, name)
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'archived': not dry_run,
+                    'partitionsCreated': created,
+                    'expiredPartitions': [{'partition': name, 'rows': rows} for name, rows in expired]
+                }),
+                'isBase64Encoded': False
+            }
     
-    cur.close()
-    conn.close()
     return {
         'statusCode': 405,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
         'body': json.dumps({'error': 'Method not allowed'}),
         'isBase64Encoded': False
     }
+
+
+def warm_up() -> None:
+    '''
+    Business: Open a pooled connection at import time so the first request skips the connect handshake
+    '''
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        return
+    try:
+        conn = DB_POOL.acquire(dsn)
+    except (psycopg2.Error, PoolExhausted):
+        return
+    try:
+        SETTINGS_CACHE.get(conn)
+    finally:
+        DB_POOL.release(conn)
+
+
+if DB_WARMUP_ON_IMPORT:
+    warm_up()
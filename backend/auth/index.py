@@ -1,7 +1,234 @@
 import json
 import os
+import random
+import threading
+import time
 import psycopg2
-from typing import Dict, Any
+import psycopg2.extensions
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from typing import Dict, Any, Callable, List, Optional, Set, Tuple
+
+DB_WARMUP_ON_IMPORT = os.environ.get('DB_WARMUP_ON_IMPORT') == '1'
+TIMING_SAMPLE_RATE = float(os.environ.get('TIMING_SAMPLE_RATE', '1'))
+TIMING_LOG = os.environ.get('TIMING_LOG') == '1'
+
+_timing = threading.local()
+
+
+class RequestTrace:
+    '''
+    Business: Where one sampled request spent its time: pool acquire, connect, each statement, the rest
+    '''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.acquire_ms = 0.0
+        self.connect_ms: Optional[float] = None
+        self.statements: List[Tuple[str, float]] = []
+
+    def record(self, statement: str, elapsed_ms: float) -> None:
+        self.statements.append((' '.join(statement.split())[:80], elapsed_ms))
+
+    def finish(self, event: Dict[str, Any], response: Dict[str, Any]) -> None:
+        total_ms = (time.perf_counter() - self.started) * 1000.0
+        db_ms = sum(ms for _, ms in self.statements)
+        app_ms = max(0.0, total_ms - db_ms - self.acquire_ms)
+        metrics = [f'acquire;dur={self.acquire_ms:.3f}']
+        if self.connect_ms is not None:
+            metrics.append(f'connect;dur={self.connect_ms:.3f}')
+        metrics += [
+            f'db;dur={db_ms:.3f};desc="{len(self.statements)} round trips"',
+            f'app;dur={app_ms:.3f}',
+            f'total;dur={total_ms:.3f}'
+        ]
+        headers = response.setdefault('headers', {})
+        headers['Server-Timing'] = ', '.join(metrics)
+        headers['Timing-Allow-Origin'] = '*'
+        
+        if TIMING_LOG:
+            print(json.dumps({
+                'event': 'request_timing',
+                'method': event.get('httpMethod'),
+                'action': (event.get('queryStringParameters') or {}).get('action'),
+                'status': response.get('statusCode'),
+                'totalMs': round(total_ms, 3),
+                'acquireMs': round(self.acquire_ms, 3),
+                'connectMs': round(self.connect_ms, 3) if self.connect_ms is not None else None,
+                'dbMs': round(db_ms, 3),
+                'roundTrips': len(self.statements),
+                'statements': [{'sql': sql, 'ms': round(ms, 3)} for sql, ms in self.statements]
+            }))
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return getattr(_timing, 'trace', None)
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    def execute(self, query: Any, vars: Any = None) -> Any:
+        trace = current_trace()
+        if trace is None:
+            return super().execute(query, vars)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            trace.record(query if isinstance(query, str) else query.decode(), (time.perf_counter() - started) * 1000.0)
+
+
+class TimedConnection(psycopg2.extensions.connection):
+    def cursor(self, *args: Any, **kwargs: Any) -> Any:
+        kwargs.setdefault('cursor_factory', TimedCursor)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self) -> None:
+        self._timed('COMMIT', super().commit)
+
+    def rollback(self) -> None:
+        self._timed('ROLLBACK', super().rollback)
+
+    def _timed(self, statement: str, end_transaction: Callable[[], None]) -> None:
+        trace = current_trace()
+        if trace is None or self.closed or self.get_transaction_status() == TRANSACTION_STATUS_IDLE:
+            end_transaction()
+            return
+        started = time.perf_counter()
+        try:
+            end_transaction()
+        finally:
+            trace.record(statement, (time.perf_counter() - started) * 1000.0)
+
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_HEALTHCHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTHCHECK_INTERVAL', '30'))
+POOL_ACQUIRE_TIMEOUT = float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT', '5'))
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class ConnectionPool:
+    '''
+    Business: Keep Postgres connections open across warm invocations of this function instance
+    Args: max_size caps open connections, idle ones older than healthcheck_interval seconds are pinged before reuse
+    '''
+
+    def __init__(self, max_size: int, healthcheck_interval: float, acquire_timeout: float,
+                 on_connect: Optional[Callable[[Any], None]] = None):
+        self.max_size = max_size
+        self.healthcheck_interval = healthcheck_interval
+        self.acquire_timeout = acquire_timeout
+        self.on_connect = on_connect
+        self.stats = {'hits': 0, 'misses': 0, 'reconnects': 0, 'waits': 0}
+        self._idle: List[Tuple[Any, float]] = []
+        self._leased: Set[int] = set()
+        self._open = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, dsn: str) -> Any:
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._cond:
+                while not self._idle and self._open >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhausted()
+                    self.stats['waits'] += 1
+                    self._cond.wait(remaining)
+                if not self._idle:
+                    self._open += 1
+                    break
+                conn, released_at = self._idle.pop()
+                self._leased.add(id(conn))
+            
+            # The liveness probe can be a network round trip, so it runs outside the
+            # lock; the connection counts as leased meanwhile
+            if self._is_alive(conn, released_at):
+                with self._cond:
+                    self.stats['hits'] += 1
+                return conn
+            with self._cond:
+                self._leased.discard(id(conn))
+                self._discard(conn)
+                self.stats['reconnects'] += 1
+                self._cond.notify()
+        
+        conn = None
+        started = time.perf_counter()
+        try:
+            conn = psycopg2.connect(dsn, connection_factory=TimedConnection)
+            if self.on_connect:
+                self.on_connect(conn)
+        except Exception:
+            if conn is not None:
+                conn.close()
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        
+        trace = current_trace()
+        if trace:
+            trace.connect_ms = (time.perf_counter() - started) * 1000.0
+        
+        with self._cond:
+            self.stats['misses'] += 1
+            self._leased.add(id(conn))
+        return conn
+
+    def release(self, conn: Any) -> None:
+        with self._cond:
+            if id(conn) not in self._leased:
+                return
+            self._leased.discard(id(conn))
+        
+        healthy = not conn.closed
+        if healthy and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                healthy = False
+        
+        with self._cond:
+            if healthy:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._discard(conn)
+            self._cond.notify()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(self.stats, open=self._open, idle=len(self._idle))
+
+    def close(self) -> None:
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+    def _is_alive(self, conn: Any, released_at: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - released_at < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn: Any) -> None:
+        self._open -= 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+DB_POOL = ConnectionPool(POOL_MAX_SIZE, POOL_HEALTHCHECK_INTERVAL, POOL_ACQUIRE_TIMEOUT)
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -24,6 +251,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    # Platform keep-alive pings (timer triggers without httpMethod, or ?action=ping)
+    # keep the instance warm and must not touch the database
+    if 'httpMethod' not in event or (event.get('queryStringParameters') or {}).get('action') == 'ping':
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'ok': True}),
+            'isBase64Encoded': False
+        }
+    
     dsn = os.environ.get('DATABASE_URL')
     if not dsn:
         return {
@@ -33,7 +270,41 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(dsn)
+    trace = RequestTrace() if random.random() < TIMING_SAMPLE_RATE else None
+    _timing.trace = trace
+    try:
+        conn = DB_POOL.acquire(dsn)
+    except PoolExhausted:
+        _timing.trace = None
+        return {
+            'statusCode': 503,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': '1'},
+            'body': json.dumps({'error': 'Database busy, retry later'}),
+            'isBase64Encoded': False
+        }
+    
+    if trace:
+        trace.acquire_ms = (time.perf_counter() - trace.started) * 1000.0
+    
+    try:
+        response = route_request(method, event, conn)
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        if method != 'GET' or not conn.closed:
+            raise
+        # A reused connection was dropped by the server; reads are safe to replay once
+        DB_POOL.release(conn)
+        conn = DB_POOL.acquire(dsn)
+        response = route_request(method, event, conn)
+    finally:
+        DB_POOL.release(conn)
+        _timing.trace = None
+    
+    if trace:
+        trace.finish(event, response)
+    return response
+
+
+def route_request(method: str, event: Dict[str, Any], conn: Any) -> Dict[str, Any]:
     cur = conn.cursor()
     
     if method == 'POST':
@@ -41,8 +312,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         username = body_data.get('username', '').strip()
         
         if not username or len(username) < 2:
-            cur.close()
-            conn.close()
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -55,8 +324,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         if existing:
             user_id, user_name = existing
-            cur.close()
-            conn.close()
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -76,8 +343,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         )
         
         conn.commit()
-        cur.close()
-        conn.close()
         
         return {
             'statusCode': 201,
@@ -86,11 +351,27 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    cur.close()
-    conn.close()
     return {
         'statusCode': 405,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
         'body': json.dumps({'error': 'Method not allowed'}),
         'isBase64Encoded': False
     }
+
+
+def warm_up() -> None:
+    '''
+    Business: Open a pooled connection at import time so the first request skips the connect handshake
+    '''
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        return
+    try:
+        conn = DB_POOL.acquire(dsn)
+    except (psycopg2.Error, PoolExhausted):
+        return
+    DB_POOL.release(conn)
+
+
+if DB_WARMUP_ON_IMPORT:
+    warm_up()
@@ -1,7 +1,487 @@
 import json
+import math
 import os
+import random
+import threading
+import time
+from collections import OrderedDict
 import psycopg2
-from typing import Dict, Any
+import psycopg2.extensions
+from psycopg2.errorcodes import INVALID_SQL_STATEMENT_NAME
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from typing import Dict, Any, Callable, List, Optional, Set, Tuple
+
+DB_WARMUP_ON_IMPORT = os.environ.get('DB_WARMUP_ON_IMPORT') == '1'
+TIMING_SAMPLE_RATE = float(os.environ.get('TIMING_SAMPLE_RATE', '1'))
+TIMING_LOG = os.environ.get('TIMING_LOG') == '1'
+
+_timing = threading.local()
+
+
+class RequestTrace:
+    '''
+    Business: Where one sampled request spent its time: pool acquire, connect, each statement, the rest
+    '''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.acquire_ms = 0.0
+        self.connect_ms: Optional[float] = None
+        self.statements: List[Tuple[str, float]] = []
+
+    def record(self, statement: str, elapsed_ms: float) -> None:
+        self.statements.append((' '.join(statement.split())[:80], elapsed_ms))
+
+    def finish(self, event: Dict[str, Any], response: Dict[str, Any]) -> None:
+        total_ms = (time.perf_counter() - self.started) * 1000.0
+        db_ms = sum(ms for _, ms in self.statements)
+        app_ms = max(0.0, total_ms - db_ms - self.acquire_ms)
+        metrics = [f'acquire;dur={self.acquire_ms:.3f}']
+        if self.connect_ms is not None:
+            metrics.append(f'connect;dur={self.connect_ms:.3f}')
+        metrics += [
+            f'db;dur={db_ms:.3f};desc="{len(self.statements)} round trips"',
+            f'app;dur={app_ms:.3f}',
+            f'total;dur={total_ms:.3f}'
+        ]
+        headers = response.setdefault('headers', {})
+        headers['Server-Timing'] = ', '.join(metrics)
+        headers['Timing-Allow-Origin'] = '*'
+        
+        if TIMING_LOG:
+            print(json.dumps({
+                'event': 'request_timing',
+                'method': event.get('httpMethod'),
+                'action': (event.get('queryStringParameters') or {}).get('action'),
+                'status': response.get('statusCode'),
+                'totalMs': round(total_ms, 3),
+                'acquireMs': round(self.acquire_ms, 3),
+                'connectMs': round(self.connect_ms, 3) if self.connect_ms is not None else None,
+                'dbMs': round(db_ms, 3),
+                'roundTrips': len(self.statements),
+                'statements': [{'sql': sql, 'ms': round(ms, 3)} for sql, ms in self.statements]
+            }))
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return getattr(_timing, 'trace', None)
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    def execute(self, query: Any, vars: Any = None) -> Any:
+        trace = current_trace()
+        if trace is None:
+            return super().execute(query, vars)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            trace.record(query if isinstance(query, str) else query.decode(), (time.perf_counter() - started) * 1000.0)
+
+
+class TimedConnection(psycopg2.extensions.connection):
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        # Names PREPAREd in this session; a reconnect starts with an empty set
+        self.prepared: Set[str] = set()
+
+    def cursor(self, *args: Any, **kwargs: Any) -> Any:
+        kwargs.setdefault('cursor_factory', TimedCursor)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self) -> None:
+        self._timed('COMMIT', super().commit)
+
+    def rollback(self) -> None:
+        self._timed('ROLLBACK', super().rollback)
+
+    def _timed(self, statement: str, end_transaction: Callable[[], None]) -> None:
+        trace = current_trace()
+        if trace is None or self.closed or self.get_transaction_status() == TRANSACTION_STATUS_IDLE:
+            end_transaction()
+            return
+        started = time.perf_counter()
+        try:
+            end_transaction()
+        finally:
+            trace.record(statement, (time.perf_counter() - started) * 1000.0)
+
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_HEALTHCHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTHCHECK_INTERVAL', '30'))
+POOL_ACQUIRE_TIMEOUT = float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT', '5'))
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class ConnectionPool:
+    '''
+    Business: Keep Postgres connections open across warm invocations of this function instance
+    Args: max_size caps open connections, idle ones older than healthcheck_interval seconds are pinged before reuse
+    '''
+
+    def __init__(self, max_size: int, healthcheck_interval: float, acquire_timeout: float,
+                 on_connect: Optional[Callable[[Any], None]] = None):
+        self.max_size = max_size
+        self.healthcheck_interval = healthcheck_interval
+        self.acquire_timeout = acquire_timeout
+        self.on_connect = on_connect
+        self.stats = {'hits': 0, 'misses': 0, 'reconnects': 0, 'waits': 0}
+        self._idle: List[Tuple[Any, float]] = []
+        self._leased: Set[int] = set()
+        self._open = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, dsn: str) -> Any:
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._cond:
+                while not self._idle and self._open >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhausted()
+                    self.stats['waits'] += 1
+                    self._cond.wait(remaining)
+                if not self._idle:
+                    self._open += 1
+                    break
+                conn, released_at = self._idle.pop()
+                self._leased.add(id(conn))
+            
+            # The liveness probe can be a network round trip, so it runs outside the
+            # lock; the connection counts as leased meanwhile
+            if self._is_alive(conn, released_at):
+                with self._cond:
+                    self.stats['hits'] += 1
+                return conn
+            with self._cond:
+                self._leased.discard(id(conn))
+                self._discard(conn)
+                self.stats['reconnects'] += 1
+                self._cond.notify()
+        
+        conn = None
+        started = time.perf_counter()
+        try:
+            conn = psycopg2.connect(dsn, connection_factory=TimedConnection)
+            if self.on_connect:
+                self.on_connect(conn)
+        except Exception:
+            if conn is not None:
+                conn.close()
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        
+        trace = current_trace()
+        if trace:
+            trace.connect_ms = (time.perf_counter() - started) * 1000.0
+        
+        with self._cond:
+            self.stats['misses'] += 1
+            self._leased.add(id(conn))
+        return conn
+
+    def release(self, conn: Any) -> None:
+        with self._cond:
+            if id(conn) not in self._leased:
+                return
+            self._leased.discard(id(conn))
+        
+        healthy = not conn.closed
+        if healthy and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                healthy = False
+        
+        with self._cond:
+            if healthy:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._discard(conn)
+            self._cond.notify()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(self.stats, open=self._open, idle=len(self._idle))
+
+    def close(self) -> None:
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+    def _is_alive(self, conn: Any, released_at: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - released_at < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn: Any) -> None:
+        self._open -= 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+class PreparedStatements:
+    '''
+    Business: Hot statements PREPAREd once per pooled connection and run by name, so Postgres parses and plans them once
+    Args: statements maps a name to its parameter types and SQL with $n placeholders
+    '''
+
+    def __init__(self, statements: Dict[str, Tuple[Tuple[str, ...], str]]):
+        self.statements = statements
+        self.stats = {'prepares': 0, 'executions': 0, 'reprepares': 0}
+        self._lock = threading.Lock()
+
+    def prepare_all(self, conn: Any) -> None:
+        with conn.cursor() as cur:
+            self._prepare(cur, [name for name in self.statements if name not in conn.prepared])
+        conn.commit()
+
+    def execute(self, cur: Any, name: str, args: Tuple[Any, ...] = ()) -> None:
+        conn = cur.connection
+        if name not in conn.prepared:
+            self._prepare(cur, [name])
+        statement = f"EXECUTE {name} ({', '.join(['%s'] * len(args))})" if args else f"EXECUTE {name}"
+        retryable = conn.autocommit or conn.get_transaction_status() == TRANSACTION_STATUS_IDLE
+        try:
+            cur.execute(statement, args)
+        except psycopg2.Error as e:
+            # Something outside this pool reset the session (DISCARD ALL from a proxy,
+            # a failover). Nothing ran yet if the statement opened the transaction
+            if e.pgcode != INVALID_SQL_STATEMENT_NAME or not retryable:
+                raise
+            if not conn.autocommit:
+                conn.rollback()
+            cur.execute("DEALLOCATE ALL")
+            conn.prepared.clear()
+            with self._lock:
+                self.stats['reprepares'] += 1
+            self._prepare(cur, [name])
+            cur.execute(statement, args)
+        with self._lock:
+            self.stats['executions'] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, statements=len(self.statements))
+
+    def _prepare(self, cur: Any, names: List[str]) -> None:
+        if not names:
+            return
+        # PREPARE is not transactional, so a later rollback keeps the statements
+        cur.execute('; '.join(
+            f"PREPARE {name} ({', '.join(self.statements[name][0])}) AS {self.statements[name][1]}"
+            if self.statements[name][0] else f"PREPARE {name} AS {self.statements[name][1]}"
+            for name in names
+        ))
+        cur.connection.prepared.update(names)
+        with self._lock:
+            self.stats['prepares'] += len(names)
+
+
+RATE_LIMIT_SHARED = os.environ.get('RATE_LIMIT_SHARED') == '1'
+# Turns every per-user limit off, e.g. for load tests measuring latency
+RATE_LIMITS_DISABLED = os.environ.get('RATE_LIMITS_DISABLED') == '1'
+RATE_LIMIT_MAX_BUCKETS = int(os.environ.get('RATE_LIMIT_MAX_BUCKETS', '10000'))
+MAX_IN_FLIGHT = int(os.environ.get('MAX_IN_FLIGHT', str(POOL_MAX_SIZE * 2)))
+
+
+def rate_limits(defaults: Dict[str, Tuple[float, float]]) -> Dict[str, Tuple[float, float]]:
+    '''
+    Returns: defaults with RATE_LIMIT_<ACTION>=<tokens per second>,<burst> overrides applied, or no limits when RATE_LIMITS_DISABLED
+    '''
+    if RATE_LIMITS_DISABLED:
+        return {}
+    limits = {}
+    for action, limit in defaults.items():
+        value = os.environ.get(f'RATE_LIMIT_{action.upper()}')
+        if value:
+            rate, burst = value.split(',')
+            limit = (float(rate), float(burst))
+        limits[action] = limit
+    return limits
+
+
+# Tokens refilled per second and burst size for each write action, overridable
+# per action through the environment
+RATE_LIMITS: Dict[str, Tuple[float, float]] = rate_limits({
+    'join': (0.5, 3)
+})
+
+
+class RateLimiter:
+    '''
+    Business: Token bucket per user and action, kept in this instance and optionally also in the shared rate_limit_buckets table
+    Args: limits action -> (tokens per second, burst), max_buckets kept in memory before the least recently used is dropped, shared also checks Postgres
+    '''
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]], max_buckets: int, shared: bool):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self.shared = shared
+        self.stats = {'allowed': 0, 'limited': 0, 'sharedLimited': 0, 'evictions': 0}
+        self._buckets: 'OrderedDict[Tuple[int, str], Tuple[float, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, user_id: int, action: str) -> float:
+        '''
+        Returns: 0 when a token was taken, otherwise seconds until the next one
+        '''
+        rate, burst = self.limits[action]
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get((user_id, action), (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            self._buckets[(user_id, action)] = (tokens - 1 if wait == 0.0 else tokens, now)
+            self._buckets.move_to_end((user_id, action))
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+                self.stats['evictions'] += 1
+            self.stats['allowed' if wait == 0.0 else 'limited'] += 1
+        return wait
+
+    def take_shared(self, conn: Any, user_id: int, action: str) -> float:
+        rate, burst = self.limits[action]
+        params = {'user_id': user_id, 'action': action, 'rate': rate, 'burst': burst}
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO rate_limit_buckets AS b (user_id, action, tokens, updated_at)
+                    VALUES (%(user_id)s, %(action)s, %(burst)s - 1, clock_timestamp())
+                    ON CONFLICT (user_id, action) DO UPDATE
+                    SET tokens = LEAST(%(burst)s, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * %(rate)s) - 1,
+                        updated_at = clock_timestamp()
+                    WHERE LEAST(%(burst)s, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * %(rate)s) >= 1
+                    RETURNING tokens
+                """, params)
+                if cur.fetchone():
+                    return 0.0
+                cur.execute("""
+                    SELECT (1 - LEAST(%(burst)s, tokens + EXTRACT(EPOCH FROM clock_timestamp() - updated_at) * %(rate)s)) / %(rate)s
+                    FROM rate_limit_buckets
+                    WHERE user_id = %(user_id)s AND action = %(action)s
+                """, params)
+                row = cur.fetchone()
+        finally:
+            conn.autocommit = False
+        with self._lock:
+            self.stats['sharedLimited'] += 1
+        return max(float(row[0]), 0.0) if row else 1.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, buckets=len(self._buckets), shared=self.shared)
+
+
+class ConcurrencyLimit:
+    '''
+    Business: Caps requests in flight so excess load is refused at once instead of queueing for a pooled connection
+    Args: max_in_flight requests served concurrently by this instance
+    '''
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.stats = {'shed': 0, 'peak': 0}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def enter(self) -> bool:
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                self.stats['shed'] += 1
+                return False
+            self._in_flight += 1
+            self.stats['peak'] = max(self.stats['peak'], self._in_flight)
+            return True
+
+    def leave(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, inFlight=self._in_flight, maxInFlight=self.max_in_flight)
+
+
+def rate_limit_key(method: str, event: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+    if method != 'POST':
+        return None
+    try:
+        body_data = json.loads(event.get('body') or '{}')
+        action = 'join'
+        if action not in RATE_LIMITS or not body_data.get('userId'):
+            return None
+        return int(body_data['userId']), action
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def too_many_requests(wait: float) -> Dict[str, Any]:
+    return {
+        'statusCode': 429,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'Retry-After',
+            'Retry-After': str(max(1, math.ceil(wait)))
+        },
+        'body': json.dumps({'error': 'Too many requests, slow down'}),
+        'isBase64Encoded': False
+    }
+
+
+RATE_LIMITER = RateLimiter(RATE_LIMITS, RATE_LIMIT_MAX_BUCKETS, RATE_LIMIT_SHARED)
+IN_FLIGHT = ConcurrencyLimit(MAX_IN_FLIGHT)
+
+
+# The polled listing and the join; each pooled connection prepares them on connect
+# and runs them by name from then on
+HOT_STATEMENTS: Dict[str, Tuple[Tuple[str, ...], str]] = {
+    'lotteries_active': ((), """
+        SELECT l.id, l.prize, l.active, l.participant_count
+        FROM lotteries l
+        WHERE l.active = true
+        ORDER BY l.created_at DESC
+    """),
+    # Lock check, insert and counter bump run as one statement: a single round
+    # trip, and the row lock orders joins against draw_winner
+    'lottery_join': (('integer', 'integer'), """
+        WITH lottery AS (
+            SELECT id FROM lotteries WHERE id = $1 AND active = true FOR UPDATE
+        ), joined AS (
+            INSERT INTO lottery_participants (lottery_id, user_id)
+            SELECT id, $2 FROM lottery
+            ON CONFLICT (lottery_id, user_id) DO NOTHING
+            RETURNING lottery_id
+        ), counted AS (
+            UPDATE lotteries SET participant_count = participant_count + 1
+            WHERE id IN (SELECT lottery_id FROM joined)
+            RETURNING id
+        )
+        SELECT EXISTS (SELECT 1 FROM lottery), EXISTS (SELECT 1 FROM counted)
+    """)
+}
+
+PREPARED = PreparedStatements(HOT_STATEMENTS)
+DB_POOL = ConnectionPool(POOL_MAX_SIZE, POOL_HEALTHCHECK_INTERVAL, POOL_ACQUIRE_TIMEOUT,
+                         on_connect=PREPARED.prepare_all)
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -24,6 +504,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    # Platform keep-alive pings (timer triggers without httpMethod, or ?action=ping)
+    # keep the instance warm and must not touch the database
+    if 'httpMethod' not in event or (event.get('queryStringParameters') or {}).get('action') == 'ping':
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'ok': True}),
+            'isBase64Encoded': False
+        }
+    
     dsn = os.environ.get('DATABASE_URL')
     if not dsn:
         return {
@@ -33,17 +523,77 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(dsn)
+    # Writes over a user's budget are refused before they cost a connection, and
+    # beyond MAX_IN_FLIGHT requests the instance sheds load instead of queueing
+    limit_key = rate_limit_key(method, event)
+    if limit_key:
+        wait = RATE_LIMITER.take(*limit_key)
+        if wait:
+            return too_many_requests(wait)
+    
+    if not IN_FLIGHT.enter():
+        return {
+            'statusCode': 503,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': '1'},
+            'body': json.dumps({'error': 'Server busy, retry later'}),
+            'isBase64Encoded': False
+        }
+    try:
+        return serve_request(method, event, dsn)
+    finally:
+        IN_FLIGHT.leave()
+
+
+def serve_request(method: str, event: Dict[str, Any], dsn: str) -> Dict[str, Any]:
+    '''
+    Business: Route one request on a pooled connection, replaying a read once if its connection was dropped
+    '''
+    trace = RequestTrace() if random.random() < TIMING_SAMPLE_RATE else None
+    _timing.trace = trace
+    try:
+        conn = DB_POOL.acquire(dsn)
+    except PoolExhausted:
+        _timing.trace = None
+        return {
+            'statusCode': 503,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': '1'},
+            'body': json.dumps({'error': 'Database busy, retry later'}),
+            'isBase64Encoded': False
+        }
+    
+    if trace:
+        trace.acquire_ms = (time.perf_counter() - trace.started) * 1000.0
+    
+    try:
+        response = route_request(method, event, conn)
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        if method != 'GET' or not conn.closed:
+            raise
+        # A reused connection was dropped by the server; reads are safe to replay once
+        DB_POOL.release(conn)
+        conn = DB_POOL.acquire(dsn)
+        response = route_request(method, event, conn)
+    finally:
+        DB_POOL.release(conn)
+        _timing.trace = None
+    
+    if trace:
+        trace.finish(event, response)
+    return response
+
+
+def route_request(method: str, event: Dict[str, Any], conn: Any) -> Dict[str, Any]:
+    if RATE_LIMITER.shared:
+        limit_key = rate_limit_key(method, event)
+        if limit_key:
+            wait = RATE_LIMITER.take_shared(conn, *limit_key)
+            if wait:
+                return too_many_requests(wait)
+    
     cur = conn.cursor()
     
     if method == 'GET':
-        cur.execute("""
-            SELECT l.id, l.prize, l.active,
-                   (SELECT COUNT(*) FROM lottery_participants WHERE lottery_id = l.id) as participant_count
-            FROM lotteries l
-            WHERE l.active = true
-            ORDER BY l.created_at DESC
-        """)
+        PREPARED.execute(cur, 'lotteries_active')
         
         lotteries = []
         for row in cur.fetchall():
@@ -54,9 +604,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'participantCount': row[3]
             })
         
-        cur.close()
-        conn.close()
-        
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -70,8 +617,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         user_id = body_data.get('userId')
         
         if not lottery_id or not user_id:
-            cur.close()
-            conn.close()
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -79,12 +624,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        cur.execute("SELECT active FROM lotteries WHERE id = %s", (lottery_id,))
-        lottery_row = cur.fetchone()
+        conn.autocommit = True
+        try:
+            PREPARED.execute(cur, 'lottery_join', (int(lottery_id), int(user_id)))
+            is_active, is_joined = cur.fetchone()
+        finally:
+            conn.autocommit = False
         
-        if not lottery_row or not lottery_row[0]:
-            cur.close()
-            conn.close()
+        if not is_active:
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -92,14 +639,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        cur.execute(
-            "SELECT id FROM lottery_participants WHERE lottery_id = %s AND user_id = %s",
-            (lottery_id, user_id)
-        )
-        
-        if cur.fetchone():
-            cur.close()
-            conn.close()
+        if not is_joined:
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -107,15 +647,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        cur.execute(
-            "INSERT INTO lottery_participants (lottery_id, user_id) VALUES (%s, %s)",
-            (lottery_id, user_id)
-        )
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -123,11 +654,27 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    cur.close()
-    conn.close()
     return {
         'statusCode': 405,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
         'body': json.dumps({'error': 'Method not allowed'}),
         'isBase64Encoded': False
     }
+
+
+def warm_up() -> None:
+    '''
+    Business: Open a pooled connection at import time so the first request skips the connect handshake
+    '''
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        return
+    try:
+        conn = DB_POOL.acquire(dsn)
+    except (psycopg2.Error, PoolExhausted):
+        return
+    DB_POOL.release(conn)
+
+
+if DB_WARMUP_ON_IMPORT:
+    warm_up()
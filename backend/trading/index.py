@@ -1,9 +1,1451 @@
+import hashlib
+import heapq
 import json
+import math
 import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
 import psycopg2
-from typing import Dict, Any
+import psycopg2.extensions
+from psycopg2.errorcodes import INVALID_SQL_STATEMENT_NAME
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from typing import Dict, Any, Callable, List, Optional, Set, Tuple
+from datetime import datetime, timedelta
 from decimal import Decimal
 
+DB_WARMUP_ON_IMPORT = os.environ.get('DB_WARMUP_ON_IMPORT') == '1'
+TIMING_SAMPLE_RATE = float(os.environ.get('TIMING_SAMPLE_RATE', '1'))
+TIMING_LOG = os.environ.get('TIMING_LOG') == '1'
+
+_timing = threading.local()
+
+
+class RequestTrace:
+    '''
+    Business: Where one sampled request spent its time: pool acquire, connect, each statement, the rest
+    '''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.acquire_ms = 0.0
+        self.connect_ms: Optional[float] = None
+        self.statements: List[Tuple[str, float]] = []
+
+    def record(self, statement: str, elapsed_ms: float) -> None:
+        self.statements.append((' '.join(statement.split())[:80], elapsed_ms))
+
+    def finish(self, event: Dict[str, Any], response: Dict[str, Any]) -> None:
+        total_ms = (time.perf_counter() - self.started) * 1000.0
+        db_ms = sum(ms for _, ms in self.statements)
+        app_ms = max(0.0, total_ms - db_ms - self.acquire_ms)
+        metrics = [f'acquire;dur={self.acquire_ms:.3f}']
+        if self.connect_ms is not None:
+            metrics.append(f'connect;dur={self.connect_ms:.3f}')
+        metrics += [
+            f'db;dur={db_ms:.3f};desc="{len(self.statements)} round trips"',
+            f'app;dur={app_ms:.3f}',
+            f'total;dur={total_ms:.3f}'
+        ]
+        headers = response.setdefault('headers', {})
+        headers['Server-Timing'] = ', '.join(metrics)
+        headers['Timing-Allow-Origin'] = '*'
+        
+        if TIMING_LOG:
+            print(json.dumps({
+                'event': 'request_timing',
+                'method': event.get('httpMethod'),
+                'action': (event.get('queryStringParameters') or {}).get('action'),
+                'status': response.get('statusCode'),
+                'totalMs': round(total_ms, 3),
+                'acquireMs': round(self.acquire_ms, 3),
+                'connectMs': round(self.connect_ms, 3) if self.connect_ms is not None else None,
+                'dbMs': round(db_ms, 3),
+                'roundTrips': len(self.statements),
+                'statements': [{'sql': sql, 'ms': round(ms, 3)} for sql, ms in self.statements]
+            }))
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return getattr(_timing, 'trace', None)
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    def execute(self, query: Any, vars: Any = None) -> Any:
+        trace = current_trace()
+        if trace is None:
+            return super().execute(query, vars)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            trace.record(query if isinstance(query, str) else query.decode(), (time.perf_counter() - started) * 1000.0)
+
+
+class TimedConnection(psycopg2.extensions.connection):
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        # Names PREPAREd in this session; a reconnect starts with an empty set
+        self.prepared: Set[str] = set()
+
+    def cursor(self, *args: Any, **kwargs: Any) -> Any:
+        kwargs.setdefault('cursor_factory', TimedCursor)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self) -> None:
+        self._timed('COMMIT', super().commit)
+
+    def rollback(self) -> None:
+        self._timed('ROLLBACK', super().rollback)
+
+    def _timed(self, statement: str, end_transaction: Callable[[], None]) -> None:
+        trace = current_trace()
+        if trace is None or self.closed or self.get_transaction_status() == TRANSACTION_STATUS_IDLE:
+            end_transaction()
+            return
+        started = time.perf_counter()
+        try:
+            end_transaction()
+        finally:
+            trace.record(statement, (time.perf_counter() - started) * 1000.0)
+
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_HEALTHCHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTHCHECK_INTERVAL', '30'))
+POOL_ACQUIRE_TIMEOUT = float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT', '5'))
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class ConnectionPool:
+    '''
+    Business: Keep Postgres connections open across warm invocations of this function instance
+    Args: max_size caps open connections, idle ones older than healthcheck_interval seconds are pinged before reuse
+    '''
+
+    def __init__(self, max_size: int, healthcheck_interval: float, acquire_timeout: float,
+                 on_connect: Optional[Callable[[Any], None]] = None):
+        self.max_size = max_size
+        self.healthcheck_interval = healthcheck_interval
+        self.acquire_timeout = acquire_timeout
+        self.on_connect = on_connect
+        self.stats = {'hits': 0, 'misses': 0, 'reconnects': 0, 'waits': 0}
+        self._idle: List[Tuple[Any, float]] = []
+        self._leased: Set[int] = set()
+        self._open = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, dsn: str) -> Any:
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._cond:
+                while not self._idle and self._open >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhausted()
+                    self.stats['waits'] += 1
+                    self._cond.wait(remaining)
+                if not self._idle:
+                    self._open += 1
+                    break
+                conn, released_at = self._idle.pop()
+                self._leased.add(id(conn))
+            
+            # The liveness probe can be a network round trip, so it runs outside the
+            # lock; the connection counts as leased meanwhile
+            if self._is_alive(conn, released_at):
+                with self._cond:
+                    self.stats['hits'] += 1
+                return conn
+            with self._cond:
+                self._leased.discard(id(conn))
+                self._discard(conn)
+                self.stats['reconnects'] += 1
+                self._cond.notify()
+        
+        conn = None
+        started = time.perf_counter()
+        try:
+            conn = psycopg2.connect(dsn, connection_factory=TimedConnection)
+            if self.on_connect:
+                self.on_connect(conn)
+        except Exception:
+            if conn is not None:
+                conn.close()
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        
+        trace = current_trace()
+        if trace:
+            trace.connect_ms = (time.perf_counter() - started) * 1000.0
+        
+        with self._cond:
+            self.stats['misses'] += 1
+            self._leased.add(id(conn))
+        return conn
+
+    def release(self, conn: Any) -> None:
+        with self._cond:
+            if id(conn) not in self._leased:
+                return
+            self._leased.discard(id(conn))
+        
+        healthy = not conn.closed
+        if healthy and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                healthy = False
+        
+        with self._cond:
+            if healthy:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._discard(conn)
+            self._cond.notify()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(self.stats, open=self._open, idle=len(self._idle))
+
+    def close(self) -> None:
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+    def _is_alive(self, conn: Any, released_at: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - released_at < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn: Any) -> None:
+        self._open -= 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+class PreparedStatements:
+    '''
+    Business: Hot statements PREPAREd once per pooled connection and run by name, so Postgres parses and plans them once
+    Args: statements maps a name to its parameter types and SQL with $n placeholders
+    '''
+
+    def __init__(self, statements: Dict[str, Tuple[Tuple[str, ...], str]]):
+        self.statements = statements
+        self.stats = {'prepares': 0, 'executions': 0, 'reprepares': 0}
+        self._lock = threading.Lock()
+
+    def prepare_all(self, conn: Any) -> None:
+        with conn.cursor() as cur:
+            self._prepare(cur, [name for name in self.statements if name not in conn.prepared])
+        conn.commit()
+
+    def execute(self, cur: Any, name: str, args: Tuple[Any, ...] = ()) -> None:
+        conn = cur.connection
+        if name not in conn.prepared:
+            self._prepare(cur, [name])
+        statement = f"EXECUTE {name} ({', '.join(['%s'] * len(args))})" if args else f"EXECUTE {name}"
+        retryable = conn.autocommit or conn.get_transaction_status() == TRANSACTION_STATUS_IDLE
+        try:
+            cur.execute(statement, args)
+        except psycopg2.Error as e:
+            # Something outside this pool reset the session (DISCARD ALL from a proxy,
+            # a failover). Nothing ran yet if the statement opened the transaction
+            if e.pgcode != INVALID_SQL_STATEMENT_NAME or not retryable:
+                raise
+            if not conn.autocommit:
+                conn.rollback()
+            cur.execute("DEALLOCATE ALL")
+            conn.prepared.clear()
+            with self._lock:
+                self.stats['reprepares'] += 1
+            self._prepare(cur, [name])
+            cur.execute(statement, args)
+        with self._lock:
+            self.stats['executions'] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, statements=len(self.statements))
+
+    def _prepare(self, cur: Any, names: List[str]) -> None:
+        if not names:
+            return
+        # PREPARE is not transactional, so a later rollback keeps the statements
+        cur.execute('; '.join(
+            f"PREPARE {name} ({', '.join(self.statements[name][0])}) AS {self.statements[name][1]}"
+            if self.statements[name][0] else f"PREPARE {name} AS {self.statements[name][1]}"
+            for name in names
+        ))
+        cur.connection.prepared.update(names)
+        with self._lock:
+            self.stats['prepares'] += len(names)
+
+
+RATE_LIMIT_SHARED = os.environ.get('RATE_LIMIT_SHARED') == '1'
+# Turns every per-user limit off, e.g. for load tests measuring latency
+RATE_LIMITS_DISABLED = os.environ.get('RATE_LIMITS_DISABLED') == '1'
+RATE_LIMIT_MAX_BUCKETS = int(os.environ.get('RATE_LIMIT_MAX_BUCKETS', '10000'))
+MAX_IN_FLIGHT = int(os.environ.get('MAX_IN_FLIGHT', str(POOL_MAX_SIZE * 2)))
+
+
+def rate_limits(defaults: Dict[str, Tuple[float, float]]) -> Dict[str, Tuple[float, float]]:
+    '''
+    Returns: defaults with RATE_LIMIT_<ACTION>=<tokens per second>,<burst> overrides applied, or no limits when RATE_LIMITS_DISABLED
+    '''
+    if RATE_LIMITS_DISABLED:
+        return {}
+    limits = {}
+    for action, limit in defaults.items():
+        value = os.environ.get(f'RATE_LIMIT_{action.upper()}')
+        if value:
+            rate, burst = value.split(',')
+            limit = (float(rate), float(burst))
+        limits[action] = limit
+    return limits
+
+
+# Tokens refilled per second and burst size for each write action, overridable
+# per action through the environment
+RATE_LIMITS: Dict[str, Tuple[float, float]] = rate_limits({
+    'add_clicks': (2.0, 10),
+    'sell': (1.0, 5),
+    'purchase_request': (0.2, 3),
+    'place_order': (5.0, 20),
+    # A buy order files a purchase request, so it gets the same budget
+    'place_buy_order': (0.2, 3),
+    'cancel_order': (5.0, 20)
+})
+
+
+class RateLimiter:
+    '''
+    Business: Token bucket per user and action, kept in this instance and optionally also in the shared rate_limit_buckets table
+    Args: limits action -> (tokens per second, burst), max_buckets kept in memory before the least recently used is dropped, shared also checks Postgres
+    '''
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]], max_buckets: int, shared: bool):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self.shared = shared
+        self.stats = {'allowed': 0, 'limited': 0, 'sharedLimited': 0, 'evictions': 0}
+        self._buckets: 'OrderedDict[Tuple[int, str], Tuple[float, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, user_id: int, action: str) -> float:
+        '''
+        Returns: 0 when a token was taken, otherwise seconds until the next one
+        '''
+        rate, burst = self.limits[action]
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get((user_id, action), (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            self._buckets[(user_id, action)] = (tokens - 1 if wait == 0.0 else tokens, now)
+            self._buckets.move_to_end((user_id, action))
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+                self.stats['evictions'] += 1
+            self.stats['allowed' if wait == 0.0 else 'limited'] += 1
+        return wait
+
+    def take_shared(self, conn: Any, user_id: int, action: str) -> float:
+        rate, burst = self.limits[action]
+        params = {'user_id': user_id, 'action': action, 'rate': rate, 'burst': burst}
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO rate_limit_buckets AS b (user_id, action, tokens, updated_at)
+                    VALUES (%(user_id)s, %(action)s, %(burst)s - 1, clock_timestamp())
+                    ON CONFLICT (user_id, action) DO UPDATE
+                    SET tokens = LEAST(%(burst)s, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * %(rate)s) - 1,
+                        updated_at = clock_timestamp()
+                    WHERE LEAST(%(burst)s, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * %(rate)s) >= 1
+                    RETURNING tokens
+                """, params)
+                if cur.fetchone():
+                    return 0.0
+                cur.execute("""
+                    SELECT (1 - LEAST(%(burst)s, tokens + EXTRACT(EPOCH FROM clock_timestamp() - updated_at) * %(rate)s)) / %(rate)s
+                    FROM rate_limit_buckets
+                    WHERE user_id = %(user_id)s AND action = %(action)s
+                """, params)
+                row = cur.fetchone()
+        finally:
+            conn.autocommit = False
+        with self._lock:
+            self.stats['sharedLimited'] += 1
+        return max(float(row[0]), 0.0) if row else 1.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, buckets=len(self._buckets), shared=self.shared)
+
+
+class ConcurrencyLimit:
+    '''
+    Business: Caps requests in flight so excess load is refused at once instead of queueing for a pooled connection
+    Args: max_in_flight requests served concurrently by this instance
+    '''
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.stats = {'shed': 0, 'peak': 0}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def enter(self) -> bool:
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                self.stats['shed'] += 1
+                return False
+            self._in_flight += 1
+            self.stats['peak'] = max(self.stats['peak'], self._in_flight)
+            return True
+
+    def leave(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, inFlight=self._in_flight, maxInFlight=self.max_in_flight)
+
+
+def rate_limit_key(method: str, event: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+    if method != 'POST':
+        return None
+    try:
+        body_data = json.loads(event.get('body') or '{}')
+        action = body_data.get('action')
+        if action == 'place_order' and body_data.get('side') == 'buy':
+            action = 'place_buy_order'
+        if action not in RATE_LIMITS or not body_data.get('userId'):
+            return None
+        return int(body_data['userId']), action
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def too_many_requests(wait: float) -> Dict[str, Any]:
+    return {
+        'statusCode': 429,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'Retry-After',
+            'Retry-After': str(max(1, math.ceil(wait)))
+        },
+        'body': json.dumps({'error': 'Too many requests, slow down'}),
+        'isBase64Encoded': False
+    }
+
+
+RATE_LIMITER = RateLimiter(RATE_LIMITS, RATE_LIMIT_MAX_BUCKETS, RATE_LIMIT_SHARED)
+IN_FLIGHT = ConcurrencyLimit(MAX_IN_FLIGHT)
+
+
+SETTINGS_CACHE_TTL = float(os.environ.get('SETTINGS_CACHE_TTL', '5'))
+SETTINGS_CHANNEL = 'settings_updated'
+
+
+class SettingsCache:
+    '''
+    Business: All settings rows loaded with one query, kept for ttl seconds or until a settings_updated notification arrives
+    Args: ttl in seconds, a backstop for notifications sent while this instance was frozen
+    '''
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        self._values: Dict[str, str] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get(self, conn: Any) -> Dict[str, str]:
+        self._drain_notifications(conn)
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                self.stats['hits'] += 1
+                return self._values
+        
+        with conn.cursor() as cur:
+            PREPARED.execute(cur, 'settings_all')
+            values = dict(cur.fetchall())
+        
+        with self._lock:
+            self.stats['misses'] += 1
+            self._values = values
+            self._loaded_at = time.monotonic()
+        return values
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.stats['invalidations'] += 1
+            self._loaded_at = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(self.stats, hitRatio=self.stats['hits'] / lookups if lookups else 0.0)
+
+    def _drain_notifications(self, conn: Any) -> None:
+        drain_notifications(conn)
+
+
+BALANCE_CACHE_SIZE = int(os.environ.get('BALANCE_CACHE_SIZE', '10000'))
+BALANCE_CACHE_TTL = float(os.environ.get('BALANCE_CACHE_TTL', '30'))
+BALANCE_CHANNEL = 'balance_updated'
+
+
+class BalanceCache:
+    '''
+    Business: LRU of stored crypto balances by user id, written through by this instance and invalidated by balance_updated notifications from others
+    Args: max_size entries kept before the least recently used is evicted, ttl in seconds as a backstop for missed notifications
+    '''
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'invalidations': 0, 'evictions': 0, 'staleFills': 0}
+        self._entries: 'OrderedDict[int, Tuple[Decimal, float]]' = OrderedDict()
+        # Per-user count of writes and invalidations, so a miss that read the row
+        # before one of them does not cache what it read; the least recently
+        # written are forgotten past max_size, counted in _forgotten
+        self._generations: 'OrderedDict[int, int]' = OrderedDict()
+        self._forgotten = 0
+        self._lock = threading.Lock()
+
+    def get(self, conn: Any, user_id: int) -> Optional[Decimal]:
+        drain_notifications(conn)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.stats['hits'] += 1
+                return entry[0]
+            generation = (self._generations.get(user_id), self._forgotten)
+        
+        with conn.cursor() as cur:
+            PREPARED.execute(cur, 'balance_get', (user_id,))
+            row = cur.fetchone()
+        
+        with self._lock:
+            self.stats['misses'] += 1
+            if row is None:
+                return None
+            current = self._generations.get(user_id)
+            if current is not None or generation[0] is not None:
+                fresh = current == generation[0]
+            else:
+                fresh = self._forgotten == generation[1]
+            if fresh:
+                self._store(user_id, row[0])
+            else:
+                self.stats['staleFills'] += 1
+        return row[0]
+
+    def put(self, user_id: int, balance: Decimal) -> None:
+        with self._lock:
+            self._bump(user_id)
+            self._store(user_id, balance)
+            self.stats['writes'] += 1
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._bump(user_id)
+            if self._entries.pop(user_id, None) is not None:
+                self.stats['invalidations'] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(self.stats, size=len(self._entries),
+                        hitRatio=self.stats['hits'] / lookups if lookups else 0.0)
+
+    def _store(self, user_id: int, balance: Decimal) -> None:
+        self._entries[user_id] = (balance, time.monotonic())
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _bump(self, user_id: int) -> None:
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        self._generations.move_to_end(user_id)
+        while len(self._generations) > self.max_size:
+            self._generations.popitem(last=False)
+            self._forgotten += 1
+
+
+# Backend pids of this instance's pooled connections; balance notifications they
+# raise are skipped because the write already went through the cache. A pid reused
+# by another session after a discard only costs a stale entry until BALANCE_CACHE_TTL
+_local_backend_pids: Set[int] = set()
+
+
+def listen_for_changes(conn: Any) -> None:
+    with conn.cursor() as cur:
+        cur.execute(f"LISTEN {SETTINGS_CHANNEL}; LISTEN {BALANCE_CHANNEL}")
+    conn.commit()
+    _local_backend_pids.add(conn.get_backend_pid())
+
+
+def drain_notifications(conn: Any) -> None:
+    conn.poll()
+    if not conn.notifies:
+        return
+    notifies = list(conn.notifies)
+    del conn.notifies[:]
+    for notify in notifies:
+        if notify.channel == SETTINGS_CHANNEL:
+            SETTINGS_CACHE.invalidate()
+        elif notify.channel == BALANCE_CHANNEL and notify.pid not in _local_backend_pids:
+            BALANCE_CACHE.invalidate(int(notify.payload))
+
+
+CLICK_FLUSH_MAX_PENDING = int(os.environ.get('CLICK_FLUSH_MAX_PENDING', '200'))
+CLICK_FLUSH_INTERVAL = float(os.environ.get('CLICK_FLUSH_INTERVAL', '2'))
+# Caps on one add_clicks request; the client sends about a second of clicking at a time
+CLICK_MAX_AMOUNT = Decimal(os.environ.get('CLICK_MAX_AMOUNT', '1000'))
+CLICK_MAX_CLICKS = int(os.environ.get('CLICK_MAX_CLICKS', '1000'))
+CLICK_AMOUNT_QUANTUM = Decimal('0.0001')
+
+
+class ClickBuffer:
+    '''
+    Business: Write-behind buffer that merges clicker accruals per user and writes them with one multi-row UPDATE
+    Args: max_pending accruals or flush_interval seconds since the oldest one, whichever comes first, trigger a flush
+    '''
+
+    def __init__(self, max_pending: int, flush_interval: float):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.stats = {'accruals': 0, 'clicks': 0, 'flushes': 0, 'rowsWritten': 0, 'failedFlushes': 0,
+                      'droppedUsers': 0, 'lastFlushMs': 0.0, 'maxFlushMs': 0.0}
+        self._pending: Dict[int, Decimal] = {}
+        self._pending_accruals = 0
+        self._oldest_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add(self, user_id: int, amount: Decimal, clicks: int) -> None:
+        with self._lock:
+            self._pending[user_id] = self._pending.get(user_id, Decimal(0)) + amount
+            self._pending_accruals += 1
+            if self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+            self.stats['accruals'] += 1
+            self.stats['clicks'] += clicks
+
+    def pending_for(self, user_id: int) -> Decimal:
+        with self._lock:
+            return self._pending.get(user_id, Decimal(0))
+
+    def due(self) -> bool:
+        with self._lock:
+            if self._oldest_at is None:
+                return False
+            return (self._pending_accruals >= self.max_pending
+                    or time.monotonic() - self._oldest_at >= self.flush_interval)
+
+    def flush(self, conn: Any) -> None:
+        with self._lock:
+            pending, accruals = self._pending, self._pending_accruals
+            self._pending, self._pending_accruals, self._oldest_at = {}, 0, None
+        if not pending:
+            return
+        
+        started = time.perf_counter()
+        try:
+            balances = self._credit(conn, pending)
+        except psycopg2.DataError:
+            # Some user's row cannot take the accrual (a balance past the column's
+            # range); credit one user at a time so only that user's clicks are lost
+            rollback_quietly(conn)
+            balances = []
+            user_ids = sorted(pending)
+            for n, user_id in enumerate(user_ids):
+                try:
+                    balances += self._credit(conn, {user_id: pending[user_id]})
+                except psycopg2.DataError as e:
+                    rollback_quietly(conn)
+                    with self._lock:
+                        self.stats['droppedUsers'] += 1
+                    print(json.dumps({'clickFlushDropped': {'userId': user_id, 'amount': str(pending[user_id]),
+                                                            'error': str(e).strip()}}))
+                except Exception:
+                    rollback_quietly(conn)
+                    self._requeue({user_id: pending[user_id] for user_id in user_ids[n:]}, accruals)
+                    raise
+        except Exception:
+            rollback_quietly(conn)
+            self._requeue(pending, accruals)
+            raise
+        
+        for user_id, balance in balances:
+            BALANCE_CACHE.put(user_id, balance)
+        
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        with self._lock:
+            self.stats['flushes'] += 1
+            self.stats['rowsWritten'] += len(pending)
+            self.stats['lastFlushMs'] = round(elapsed_ms, 3)
+            self.stats['maxFlushMs'] = round(max(self.stats['maxFlushMs'], elapsed_ms), 3)
+
+    def _credit(self, conn: Any, pending: Dict[int, Decimal]) -> List[Tuple[int, Decimal]]:
+        with conn.cursor() as cur:
+            # Arrays keep the statement text fixed whatever the batch size,
+            # so one prepared plan serves every flush
+            user_ids = sorted(pending)
+            PREPARED.execute(cur, 'balance_credit', (user_ids, [pending[user_id] for user_id in user_ids]))
+            balances = cur.fetchall()
+        conn.commit()
+        return balances
+
+    def _requeue(self, pending: Dict[int, Decimal], accruals: int) -> None:
+        with self._lock:
+            for user_id, amount in pending.items():
+                self._pending[user_id] = self._pending.get(user_id, Decimal(0)) + amount
+            self._pending_accruals += accruals
+            if self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+            self.stats['failedFlushes'] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            written = self.stats['rowsWritten']
+            return dict(self.stats, pendingUsers=len(self._pending),
+                        mergeRatio=self.stats['accruals'] / written if written else 0.0)
+
+
+CLICK_BUFFER = ClickBuffer(CLICK_FLUSH_MAX_PENDING, CLICK_FLUSH_INTERVAL)
+
+
+def rollback_quietly(conn: Any) -> None:
+    try:
+        conn.rollback()
+    except psycopg2.Error:
+        pass
+
+
+def flush_clicks(conn: Any) -> None:
+    '''
+    Business: Write buffered clicks on behalf of whichever request noticed they are due; a failed
+              flush keeps its accruals for the next attempt and does not fail that request
+    '''
+    try:
+        CLICK_BUFFER.flush(conn)
+    except psycopg2.Error:
+        pass
+
+
+def click_accrual(body_data: Dict[str, Any]) -> Optional[Tuple[Decimal, int]]:
+    '''
+    Returns: (amount, clicks) of an add_clicks body, or None unless both are positive and within the per-request caps
+    '''
+    try:
+        amount = Decimal(str(body_data.get('amount')))
+        clicks = int(body_data.get('clicks', 1))
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+    if not amount.is_finite() or not 0 < amount <= CLICK_MAX_AMOUNT or not 0 < clicks <= CLICK_MAX_CLICKS:
+        return None
+    amount = amount.quantize(CLICK_AMOUNT_QUANTUM)
+    return (amount, clicks) if amount else None
+
+# transactions is partitioned by month on created_at; bounding the live feed to
+# recent trades lets Postgres skip every older partition
+FEED_LOOKBACK = timedelta(days=int(os.environ.get('FEED_LOOKBACK_DAYS', '31')))
+# created_at is the inserting transaction's start, so a trade can commit after
+# younger ones; the floor stays this far below the oldest trade it was taken from
+FEED_FLOOR_SLACK = timedelta(seconds=int(os.environ.get('FEED_FLOOR_SLACK_SECONDS', '300')))
+
+
+class FeedFloor:
+    '''
+    Business: How far back the newest FEED_LIMIT trades reach, so the live feed scans only the partitions holding them
+    Args: slack subtracted from the oldest created_at of a full feed; until one is seen the statements fall back to FEED_LOOKBACK
+    '''
+
+    def __init__(self, slack: timedelta):
+        self.slack = slack
+        self.stats = {'updates': 0}
+        self._floor: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[datetime]:
+        with self._lock:
+            return self._floor
+
+    def observe(self, created_at: List[datetime]) -> None:
+        # Only a full feed proves there are FEED_LIMIT trades since its oldest one
+        if len(created_at) < FEED_LIMIT:
+            return
+        floor = min(created_at) - self.slack
+        with self._lock:
+            if self._floor is None or floor > self._floor:
+                self._floor = floor
+                self.stats['updates'] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, floor=self._floor.isoformat() if self._floor else None)
+
+
+CANDLE_INTERVALS = {'1m': timedelta(minutes=1), '1h': timedelta(hours=1), '1d': timedelta(days=1)}
+CANDLES_MAX_BUCKETS = int(os.environ.get('CANDLES_MAX_BUCKETS', '500'))
+
+# orders.price is DECIMAL(10,2) and orders.amount DECIMAL(10,4); the book works in
+# whole cents and ten-thousandths so matching never touches Decimal
+PRICE_SCALE = 100
+AMOUNT_SCALE = 10000
+ORDER_UNITS_LIMIT = 10 ** 10
+ORDER_BOOK_MAX_DEPTH = int(os.environ.get('ORDER_BOOK_MAX_DEPTH', '100'))
+# Key of the transaction-scoped advisory lock serializing matching across instances
+ORDER_BOOK_LOCK_KEY = 4_242_001
+
+
+def order_units(value: Any, scale: int) -> Optional[int]:
+    '''
+    Returns: value in whole units of 1/scale, or None unless it is positive, fits the column and has no finer precision
+    '''
+    try:
+        units = Decimal(str(value)) * scale
+    except (ArithmeticError, ValueError):
+        return None
+    if not units.is_finite() or units != units.to_integral_value() or not 0 < units < ORDER_UNITS_LIMIT:
+        return None
+    return int(units)
+
+
+class Order:
+    __slots__ = ('id', 'user_id', 'side', 'price', 'remaining')
+
+    def __init__(self, order_id: int, user_id: int, side: str, price: int, remaining: int):
+        self.id = order_id
+        self.user_id = user_id
+        self.side = side
+        self.price = price
+        self.remaining = remaining
+
+
+class OrderBook:
+    '''
+    Business: Price-time priority limit order book held in memory, prices in cents and amounts in ten-thousandths
+    '''
+
+    def __init__(self):
+        self.orders: Dict[int, Order] = {}
+        # Per side: price -> resting orders oldest first, and a heap of the level
+        # prices keyed best first (bids negated). Removed orders stay in their level
+        # until matching reaches them or they make up half of it; an order is live
+        # while self.orders holds it, and every level keeps at least one live order
+        self._levels: Dict[str, Dict[int, 'deque[Order]']] = {'buy': {}, 'sell': {}}
+        self._prices: Dict[str, List[int]] = {'buy': [], 'sell': []}
+        self._removed: Dict[str, Dict[int, int]] = {'buy': {}, 'sell': {}}
+
+    def add(self, order: Order) -> None:
+        levels = self._levels[order.side]
+        level = levels.get(order.price)
+        if level is None:
+            level = levels[order.price] = deque()
+            heapq.heappush(self._prices[order.side], -order.price if order.side == 'buy' else order.price)
+        level.append(order)
+        self.orders[order.id] = order
+
+    def remove(self, order_id: int) -> Optional[Order]:
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        levels, removed = self._levels[order.side], self._removed[order.side]
+        dead = removed.get(order.price, 0) + 1
+        if dead * 2 <= len(levels[order.price]):
+            removed[order.price] = dead
+            return order
+        # Mostly removed orders: keep the live ones, so cancels cannot pile up in a level
+        live = deque(o for o in levels[order.price] if self.orders.get(o.id) is o)
+        removed.pop(order.price, None)
+        if live:
+            levels[order.price] = live
+        else:
+            del levels[order.price]
+            prices = self._prices[order.side]
+            prices.remove(-order.price if order.side == 'buy' else order.price)
+            heapq.heapify(prices)
+        return order
+
+    def place(self, taker: Order) -> Tuple[List[Tuple[Order, int, int]], bool]:
+        '''
+        Business: Fill taker against the best opposite prices, then rest what is left of it
+        Returns: (maker, price, amount) fills at the makers' prices, and whether matching stopped at the taker's own order
+        '''
+        fills = []
+        opposite = 'sell' if taker.side == 'buy' else 'buy'
+        levels, prices, orders = self._levels[opposite], self._prices[opposite], self.orders
+        removed = self._removed[opposite]
+        sign = 1 if opposite == 'sell' else -1
+        limit = taker.price * sign
+        while taker.remaining and prices and prices[0] <= limit:
+            price = prices[0] * sign
+            level = levels[price]
+            while level and taker.remaining:
+                maker = level[0]
+                if orders.get(maker.id) is not maker:
+                    level.popleft()
+                    removed[price] -= 1
+                    continue
+                if maker.user_id == taker.user_id:
+                    # Self-trade prevention: the incoming order is cancelled, the resting one keeps its place
+                    return fills, True
+                amount = min(maker.remaining, taker.remaining)
+                maker.remaining -= amount
+                taker.remaining -= amount
+                fills.append((maker, price, amount))
+                if not maker.remaining:
+                    level.popleft()
+                    del orders[maker.id]
+            if len(level) == removed.get(price, 0):
+                # Only removed orders are left behind the filled ones
+                level.clear()
+            if not level:
+                del levels[price]
+                removed.pop(price, None)
+                heapq.heappop(prices)
+        if taker.remaining:
+            self.add(taker)
+        return fills, False
+
+    def depth(self, side: str, max_levels: int) -> List[Tuple[int, int, int]]:
+        '''
+        Returns: up to max_levels (price, amount, orders) of resting orders, best price first
+        '''
+        levels, orders = self._levels[side], self.orders
+        result = []
+        for price in sorted(levels, reverse=side == 'buy')[:max_levels]:
+            live = [order.remaining for order in levels[price] if orders.get(order.id) is order]
+            result.append((price, sum(live), len(live)))
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'orders': len(self.orders), 'bidLevels': len(self._levels['buy']),
+                'askLevels': len(self._levels['sell'])}
+
+
+class OrderCommand:
+    __slots__ = ('kind', 'user_id', 'side', 'price', 'amount', 'order_id', 'request_id', 'result', 'error', 'done')
+
+    def __init__(self, kind: str, user_id: int, side: Optional[str] = None, price: int = 0, amount: int = 0,
+                 order_id: Optional[int] = None, request_id: Optional[int] = None):
+        self.kind = kind
+        self.user_id = user_id
+        self.side = side
+        self.price = price
+        self.amount = amount
+        self.order_id = order_id
+        # The approved purchase request a released buy order was paid through
+        self.request_id = request_id
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[Exception] = None
+        self.done = False
+
+
+class OrderEngine:
+    '''
+    Business: Keep this instance's OrderBook in step with the orders table and group-commit order commands
+    Args: lock_key of the advisory lock that lets one instance at a time match and write
+    '''
+
+    def __init__(self, lock_key: int):
+        self.lock_key = lock_key
+        self.book = OrderBook()
+        self.version: Optional[int] = None
+        self.stats = {'batches': 0, 'commands': 0, 'fills': 0, 'rebuilds': 0, 'failedBatches': 0,
+                      'maxBatchSize': 0, 'lastBatchMs': 0.0, 'maxBatchMs': 0.0}
+        self._queue: List[OrderCommand] = []
+        self._queue_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def submit(self, conn: Any, command: OrderCommand) -> Optional[Dict[str, Any]]:
+        '''
+        Business: Queue a command; whichever request gets the engine first runs everything queued as one batch
+        Returns: the command's result, None for a cancel of an order that is not open
+        '''
+        with self._queue_lock:
+            self._queue.append(command)
+        with self._lock:
+            if not command.done:
+                with self._queue_lock:
+                    batch, self._queue = self._queue, []
+                self.process(conn, batch)
+        if command.error is not None:
+            raise command.error
+        return command.result
+
+    def process(self, conn: Any, commands: List[OrderCommand], release: bool = True) -> None:
+        '''
+        Business: Match commands in order and persist orders, fills, ledger rows, balances and portfolios in one transaction;
+                  the caller holds the engine, as submit does
+        Args: release enters buy orders approved since the last batch ahead of commands
+        '''
+        started = time.perf_counter()
+        try:
+            commission_percent = Decimal(SETTINGS_CACHE.get(conn).get('commission', '0'))
+            with conn.cursor() as cur:
+                PREPARED.execute(cur, 'order_book_lock', (self.lock_key,))
+                self._sync(cur)
+                if release:
+                    # The approved payment was the buy order's only gate, so from here its
+                    # fills settle both sides like any other
+                    PREPARED.execute(cur, 'order_book_released')
+                    commands = [
+                        OrderCommand('place', user_id, 'buy', int(price * PRICE_SCALE), int(amount * AMOUNT_SCALE),
+                                     request_id=request_id)
+                        for request_id, user_id, amount, price in cur.fetchall()
+                    ] + commands
+                written = self._apply(cur, commands, commission_percent)
+            conn.commit()
+        except Exception as e:
+            rollback_quietly(conn)
+            # Matching already changed the book, so it is rebuilt on the next sync
+            self.book, self.version = OrderBook(), None
+            self.stats['failedBatches'] += 1
+            if len(commands) > 1:
+                # Retry one by one so a single bad order only fails its own request
+                for command in commands:
+                    self.process(conn, [command], release=False)
+                return
+            if commands[0].request_id is not None:
+                self._fail_release(conn, commands[0].request_id, e)
+            commands[0].result, commands[0].error, commands[0].done = None, e, True
+            return
+        
+        version, user_ids, balances, fills = written
+        if version is not None:
+            self.version = version
+        for user_id, balance in zip(user_ids or [], balances or []):
+            BALANCE_CACHE.put(user_id, balance)
+        for command in commands:
+            command.done = True
+        
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        self.stats['batches'] += 1
+        self.stats['commands'] += len(commands)
+        self.stats['fills'] += fills
+        self.stats['maxBatchSize'] = max(self.stats['maxBatchSize'], len(commands))
+        self.stats['lastBatchMs'] = round(elapsed_ms, 3)
+        self.stats['maxBatchMs'] = round(max(self.stats['maxBatchMs'], elapsed_ms), 3)
+
+    def depth(self, conn: Any, max_levels: int) -> Dict[str, Any]:
+        with self._lock:
+            with conn.cursor() as cur:
+                self._sync(cur)
+                PREPARED.execute(cur, 'order_book_released')
+                released = cur.fetchone() is not None
+            if released:
+                # Buy orders approved since the last batch enter the book before it is shown
+                self.process(conn, [])
+            return {
+                'bids': [order_level(level) for level in self.book.depth('buy', max_levels)],
+                'asks': [order_level(level) for level in self.book.depth('sell', max_levels)],
+                'version': self.version
+            }
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, **self.book.snapshot(), version=self.version)
+
+    def _fail_release(self, conn: Any, request_id: int, error: Exception) -> None:
+        # A released order that cannot be entered on its own would fail every later
+        # batch, so its request leaves the approved queue for an admin to look at
+        try:
+            with conn.cursor() as cur:
+                cur.execute("UPDATE purchase_requests SET status = 'failed' WHERE id = %s", (request_id,))
+            conn.commit()
+        except psycopg2.Error:
+            rollback_quietly(conn)
+            return
+        print(json.dumps({'orderReleaseFailed': {'requestId': request_id, 'error': str(error)}}))
+
+    def _sync(self, cur: Any) -> None:
+        if self.version is None:
+            PREPARED.execute(cur, 'orders_open')
+            book = OrderBook()
+            version = 0
+            for order_id, user_id, side, price, remaining, version in cur.fetchall():
+                if order_id is not None:
+                    book.add(Order(order_id, user_id, side, int(price * PRICE_SCALE), int(remaining * AMOUNT_SCALE)))
+            self.book, self.version = book, version
+            self.stats['rebuilds'] += 1
+            return
+        
+        PREPARED.execute(cur, 'orders_changed', (self.version,))
+        book = self.book
+        for order_id, user_id, side, price, remaining, status, version in cur.fetchall():
+            order = book.orders.get(order_id)
+            if status != 'open':
+                book.remove(order_id)
+            elif order is not None:
+                order.remaining = int(remaining * AMOUNT_SCALE)
+            else:
+                # Ids are taken under the advisory lock, so another instance's new
+                # order is younger than everything already resting here
+                book.add(Order(order_id, user_id, side, int(price * PRICE_SCALE), int(remaining * AMOUNT_SCALE)))
+            self.version = max(self.version, version)
+
+    def _apply(self, cur: Any, commands: List[OrderCommand], commission_percent: Decimal) -> Tuple[Any, ...]:
+        book = self.book
+        sellers = sorted({c.user_id for c in commands if c.kind == 'place' and c.side == 'sell'})
+        available: Dict[int, int] = {}
+        if sellers:
+            PREPARED.execute(cur, 'order_book_balances', (sellers,))
+            available = {user_id: int((balance or 0) * AMOUNT_SCALE) for user_id, balance in cur.fetchall()}
+        places = sum(1 for c in commands if c.kind == 'place')
+        order_ids: List[Tuple[int]] = []
+        if places:
+            PREPARED.execute(cur, 'order_book_ids', (places,))
+            order_ids = cur.fetchall()
+        next_ids = iter(order_ids)
+        
+        placed: Dict[int, Tuple[Order, int]] = {}
+        touched: Dict[int, Order] = {}
+        cancelled: Set[int] = set()
+        deltas: Dict[int, int] = {}
+        ledger: List[Tuple[int, str, int, int]] = []
+        for command in commands:
+            if command.kind == 'cancel':
+                order = book.orders.get(command.order_id)
+                if order is None or order.user_id != command.user_id:
+                    continue
+                book.remove(order.id)
+                cancelled.add(order.id)
+                touched[order.id] = order
+                if order.side == 'sell':
+                    # Resting sells hold their crypto; cancelling returns what is left
+                    deltas[order.user_id] = deltas.get(order.user_id, 0) + order.remaining
+                command.result = {'orderId': order.id, 'status': 'cancelled',
+                                  'remaining': float(Decimal(order.remaining).scaleb(-4))}
+                continue
+            
+            if command.side == 'sell':
+                if available.get(command.user_id, 0) < command.amount:
+                    command.result = {'error': 'Insufficient crypto balance'}
+                    continue
+                available[command.user_id] -= command.amount
+                deltas[command.user_id] = deltas.get(command.user_id, 0) - command.amount
+            
+            taker = Order(next(next_ids)[0], command.user_id, command.side, command.price, command.amount)
+            placed[taker.id] = (taker, command.amount)
+            fills, self_trade = book.place(taker)
+            for maker, price, amount in fills:
+                touched[maker.id] = maker
+                buyer, seller = (taker.user_id, maker.user_id) if taker.side == 'buy' else (maker.user_id, taker.user_id)
+                deltas[buyer] = deltas.get(buyer, 0) + amount
+                ledger.append((buyer, 'buy', amount, price))
+                ledger.append((seller, 'sell', amount, price))
+            if self_trade:
+                cancelled.add(taker.id)
+                if taker.side == 'sell':
+                    deltas[taker.user_id] += taker.remaining
+                    available[taker.user_id] += taker.remaining
+            command.result = {
+                'orderId': taker.id,
+                'filled': float(Decimal(command.amount - taker.remaining).scaleb(-4)),
+                'remaining': float(Decimal(taker.remaining).scaleb(-4)),
+                'fills': [{'price': float(Decimal(price).scaleb(-2)), 'amount': float(Decimal(amount).scaleb(-4))}
+                          for _, price, amount in fills]
+            }
+        
+        def status(order: Order) -> str:
+            if order.id in cancelled:
+                return 'cancelled'
+            return 'open' if order.remaining else 'filled'
+        
+        for command in commands:
+            if command.kind == 'place' and command.result and 'orderId' in command.result:
+                command.result['status'] = status(placed[command.result['orderId']][0])
+        
+        new_orders = list(placed.values())
+        updated = [order for order_id, order in touched.items() if order_id not in placed]
+        balance_users = sorted(user_id for user_id, delta in deltas.items() if delta)
+        if not new_orders and not updated:
+            return None, None, None, 0
+        
+        PREPARED.execute(cur, 'order_book_write', (
+            [order.id for order, _ in new_orders],
+            [order.user_id for order, _ in new_orders],
+            [order.side for order, _ in new_orders],
+            [Decimal(order.price).scaleb(-2) for order, _ in new_orders],
+            [Decimal(amount).scaleb(-4) for _, amount in new_orders],
+            [Decimal(order.remaining).scaleb(-4) for order, _ in new_orders],
+            [status(order) for order, _ in new_orders],
+            [order.id for order in updated],
+            [Decimal(order.remaining).scaleb(-4) for order in updated],
+            [status(order) for order in updated],
+            [user_id for user_id, _, _, _ in ledger],
+            [side for _, side, _, _ in ledger],
+            [Decimal(amount).scaleb(-4) for _, _, amount, _ in ledger],
+            [Decimal(price).scaleb(-2) for _, _, _, price in ledger],
+            commission_percent,
+            balance_users,
+            [Decimal(deltas[user_id]).scaleb(-4) for user_id in balance_users],
+            [c.request_id for c in commands if c.request_id is not None],
+            [c.result['orderId'] for c in commands if c.request_id is not None]
+        ))
+        version, user_ids, balances = cur.fetchone()
+        return version, user_ids, balances, len(ledger) // 2
+
+
+def order_level(level: Tuple[int, int, int]) -> Dict[str, Any]:
+    price, amount, orders = level
+    return {'price': float(Decimal(price).scaleb(-2)), 'amount': float(Decimal(amount).scaleb(-4)), 'orders': orders}
+
+
+FEED_COLUMNS = """
+    SELECT t.id, t.type, t.amount, t.price, t.commission, t.created_at, u.username
+    FROM transactions t
+    JOIN users u ON t.user_id = u.id
+"""
+FEED_LIMIT = 50
+FEED_FLOOR = FeedFloor(FEED_FLOOR_SLACK)
+
+
+def feed_window(floor: str, lookback: str) -> str:
+    return f"t.created_at >= COALESCE({floor}, LOCALTIMESTAMP - {lookback})"
+
+
+def live_feed(floor: str, lookback: str) -> str:
+    # The newest FEED_LIMIT trades, looked for above the cached floor (or within
+    # lookback before one is known) so older partitions are skipped. Only when that
+    # comes up short, as on a feed with fewer trades than that in the window, the
+    # unbounded scan behind the one-time filter runs instead, so the feed never
+    # goes empty; its rows then set the floor for the next poll
+    return f"""
+        WITH recent AS ({FEED_COLUMNS}
+            WHERE {feed_window(floor, lookback)}
+            ORDER BY t.id DESC
+            LIMIT {FEED_LIMIT}
+        )
+        SELECT * FROM recent WHERE (SELECT COUNT(*) FROM recent) = {FEED_LIMIT}
+        UNION ALL
+        ({FEED_COLUMNS}
+            WHERE (SELECT COUNT(*) FROM recent) < {FEED_LIMIT}
+            ORDER BY t.id DESC
+            LIMIT {FEED_LIMIT})
+        ORDER BY id DESC
+    """
+
+
+# The statements behind the polled endpoints, the clicker flush, sells and the order
+# book; each pooled connection prepares them on connect and runs them by name from then on
+HOT_STATEMENTS: Dict[str, Tuple[Tuple[str, ...], str]] = {
+    'settings_all': ((), "SELECT key, value FROM settings"),
+    'balance_get': (('integer',), "SELECT crypto_balance FROM user_balances WHERE user_id = $1"),
+    'balance_credit': (('integer[]', 'numeric[]'), """
+        UPDATE user_balances ub SET crypto_balance = ub.crypto_balance + v.amount
+        FROM unnest($1, $2) AS v(user_id, amount)
+        WHERE ub.user_id = v.user_id
+        RETURNING ub.user_id, ub.crypto_balance
+    """),
+    'feed_latest': (('timestamp', 'interval'), live_feed('$1', '$2')),
+    # Trades after a cursor are the newest ones, so the window alone always holds them
+    'feed_since': (('integer', 'timestamp', 'interval'), FEED_COLUMNS + f"""
+        WHERE t.id > $1 AND {feed_window('$2', '$3')}
+        ORDER BY t.id DESC
+        LIMIT {FEED_LIMIT}
+    """),
+    'feed_before': (('integer',), FEED_COLUMNS + f"""
+        WHERE t.id < $1
+        ORDER BY t.id DESC
+        LIMIT {FEED_LIMIT}
+    """),
+    'snapshot': (('integer', 'timestamp', 'interval'), """
+        SELECT
+            (SELECT json_object_agg(key, value) FROM settings),
+            (SELECT crypto_balance FROM user_balances WHERE user_id = $1),
+            (SELECT COALESCE(json_agg(json_build_object(
+                        'id', f.id, 'type', f.type, 'amount', f.amount, 'price', f.price,
+                        'commission', f.commission, 'timestamp', f.created_at, 'user', f.username
+                    ) ORDER BY f.id DESC), '[]'::json)
+             FROM (""" + live_feed('$2', '$3') + """) f),
+            (SELECT COALESCE(json_agg(json_build_object(
+                        'id', l.id, 'prize', l.prize, 'active', l.active,
+                        'participantCount', l.participant_count
+                    ) ORDER BY l.created_at DESC), '[]'::json)
+             FROM lotteries l
+             WHERE l.active = true)
+    """),
+    # The guarded UPDATE locks the balance row and re-checks it after the lock,
+    # so concurrent sells cannot overdraw; pricing, debit, ledger insert and
+    # portfolio update run as one statement
+    'sell': (('integer', 'numeric'), """
+        WITH quote AS (
+            SELECT price, $2 * price * commission_percent / 100.0 AS commission
+            FROM (
+                SELECT MAX(value) FILTER (WHERE key = 'current_price')::numeric AS price,
+                       MAX(value) FILTER (WHERE key = 'commission')::numeric AS commission_percent
+                FROM settings
+            ) s
+        ), debited AS (
+            UPDATE user_balances
+            SET crypto_balance = crypto_balance - $2
+            WHERE user_id = $1 AND crypto_balance >= $2
+            RETURNING user_id, crypto_balance
+        ), recorded AS (
+            INSERT INTO transactions (user_id, type, amount, price, commission)
+            SELECT d.user_id, 'sell', $2, q.price, q.commission
+            FROM debited d, quote q
+            RETURNING id, user_id, amount, price, commission
+        ), summarized AS (
+            INSERT INTO user_portfolios AS p (user_id, sold_amount, sold_proceeds, fees_paid, realized_pnl)
+            SELECT r.user_id, r.amount, r.amount * r.price, r.commission, r.amount * r.price - r.commission
+            FROM recorded r
+            ON CONFLICT (user_id) DO UPDATE
+            SET sold_amount = p.sold_amount + EXCLUDED.sold_amount,
+                sold_proceeds = p.sold_proceeds + EXCLUDED.sold_proceeds,
+                fees_paid = p.fees_paid + EXCLUDED.fees_paid,
+                realized_pnl = p.realized_pnl + EXCLUDED.realized_pnl
+                    - EXCLUDED.sold_amount * COALESCE(p.bought_cost / NULLIF(p.bought_amount, 0), 0),
+                updated_at = CURRENT_TIMESTAMP
+        )
+        SELECT q.commission, d.crypto_balance
+        FROM quote q, debited d
+        WHERE EXISTS (SELECT 1 FROM recorded)
+    """),
+    'order_book_lock': (('bigint',), "SELECT pg_advisory_xact_lock($1)"),
+    'orders_open': ((), """
+        SELECT o.id, o.user_id, o.side, o.price, o.remaining, m.version
+        FROM (SELECT COALESCE(MAX(version), 0) AS version FROM orders) m
+        LEFT JOIN orders o ON o.status = 'open'
+        ORDER BY o.id
+    """),
+    'orders_changed': (('bigint',), """
+        SELECT id, user_id, side, price, remaining, status, version
+        FROM orders
+        WHERE version > $1
+        ORDER BY id
+    """),
+    'order_book_balances': (('integer[]',), """
+        SELECT user_id, crypto_balance
+        FROM user_balances
+        WHERE user_id = ANY($1)
+        ORDER BY user_id
+        FOR UPDATE
+    """),
+    'order_book_ids': (('integer',), "SELECT nextval('orders_id_seq') FROM generate_series(1, $1)"),
+    'order_book_released': ((), """
+        SELECT id, user_id, amount, price
+        FROM purchase_requests
+        WHERE kind = 'order' AND status = 'approved' AND order_id IS NULL
+        ORDER BY approved_at, id
+    """),
+    # New orders are inserted in their end-of-batch state, so no row is written twice,
+    # and released buy orders are linked to the purchase requests that paid for them.
+    # Realized P&L of each sell uses the average buy price up to it, buys earlier in
+    # the batch included, the same way admin's rebuild_portfolios replays the ledger
+    'order_book_write': (('integer[]', 'integer[]', 'varchar[]', 'numeric[]', 'numeric[]', 'numeric[]', 'varchar[]',
+                          'integer[]', 'numeric[]', 'varchar[]',
+                          'integer[]', 'varchar[]', 'numeric[]', 'numeric[]', 'numeric',
+                          'integer[]', 'numeric[]',
+                          'integer[]', 'integer[]'), """
+        WITH placed AS (
+            INSERT INTO orders (id, user_id, side, price, amount, remaining, status)
+            SELECT * FROM unnest($1, $2, $3, $4, $5, $6, $7)
+            RETURNING version
+        ), updated AS (
+            UPDATE orders o
+            SET remaining = v.remaining, status = v.status,
+                version = nextval('orders_version_seq'), updated_at = CURRENT_TIMESTAMP
+            FROM unnest($8, $9, $10) AS v(id, remaining, status)
+            WHERE o.id = v.id
+            RETURNING o.version
+        ), recorded AS (
+            INSERT INTO transactions (user_id, type, amount, price, commission)
+            SELECT user_id, type, amount, price, amount * price * $15 / 100.0
+            FROM unnest($11, $12, $13, $14) WITH ORDINALITY AS f(user_id, type, amount, price, n)
+            ORDER BY n
+            RETURNING id, user_id, type, amount, price, commission
+        ), summarized AS (
+            INSERT INTO user_portfolios AS p
+                (user_id, bought_amount, bought_cost, sold_amount, sold_proceeds, fees_paid, realized_pnl)
+            SELECT user_id,
+                   COALESCE(SUM(amount) FILTER (WHERE type = 'buy'), 0),
+                   COALESCE(SUM(amount * price) FILTER (WHERE type = 'buy'), 0),
+                   COALESCE(SUM(amount) FILTER (WHERE type = 'sell'), 0),
+                   COALESCE(SUM(amount * price) FILTER (WHERE type = 'sell'), 0),
+                   SUM(commission),
+                   COALESCE(SUM(amount * price - commission - amount * COALESCE(buy_cost / NULLIF(buy_amount, 0), 0))
+                            FILTER (WHERE type = 'sell'), 0)
+            FROM (
+                SELECT r.user_id, r.type, r.amount, r.price, r.commission,
+                       COALESCE(e.bought_amount, 0)
+                           + COALESCE(SUM(r.amount) FILTER (WHERE r.type = 'buy') OVER w, 0) AS buy_amount,
+                       COALESCE(e.bought_cost, 0)
+                           + COALESCE(SUM(r.amount * r.price) FILTER (WHERE r.type = 'buy') OVER w, 0) AS buy_cost
+                FROM recorded r
+                LEFT JOIN user_portfolios e ON e.user_id = r.user_id
+                WINDOW w AS (PARTITION BY r.user_id ORDER BY r.id)
+            ) ledger
+            GROUP BY user_id
+            ORDER BY user_id
+            ON CONFLICT (user_id) DO UPDATE
+            SET bought_amount = p.bought_amount + EXCLUDED.bought_amount,
+                bought_cost = p.bought_cost + EXCLUDED.bought_cost,
+                sold_amount = p.sold_amount + EXCLUDED.sold_amount,
+                sold_proceeds = p.sold_proceeds + EXCLUDED.sold_proceeds,
+                fees_paid = p.fees_paid + EXCLUDED.fees_paid,
+                realized_pnl = p.realized_pnl + EXCLUDED.realized_pnl,
+                updated_at = CURRENT_TIMESTAMP
+        ), released AS (
+            UPDATE purchase_requests pr SET order_id = v.order_id
+            FROM unnest($18, $19) AS v(id, order_id)
+            WHERE pr.id = v.id
+        ), balanced AS (
+            INSERT INTO user_balances AS b (user_id, crypto_balance)
+            SELECT * FROM unnest($16, $17)
+            ON CONFLICT (user_id) DO UPDATE
+            SET crypto_balance = b.crypto_balance + EXCLUDED.crypto_balance
+            RETURNING user_id, crypto_balance
+        )
+        SELECT w.version, c.user_ids, c.balances
+        FROM (SELECT MAX(version) AS version
+              FROM (SELECT version FROM placed UNION ALL SELECT version FROM updated) v) w,
+             (SELECT array_agg(user_id ORDER BY user_id) AS user_ids,
+                     array_agg(crypto_balance ORDER BY user_id) AS balances
+              FROM balanced) c
+    """)
+}
+
+
+def setup_connection(conn: Any) -> None:
+    PREPARED.prepare_all(conn)
+    listen_for_changes(conn)
+
+
+PREPARED = PreparedStatements(HOT_STATEMENTS)
+ORDER_ENGINE = OrderEngine(ORDER_BOOK_LOCK_KEY)
+SETTINGS_CACHE = SettingsCache(SETTINGS_CACHE_TTL)
+BALANCE_CACHE = BalanceCache(BALANCE_CACHE_SIZE, BALANCE_CACHE_TTL)
+DB_POOL = ConnectionPool(POOL_MAX_SIZE, POOL_HEALTHCHECK_INTERVAL, POOL_ACQUIRE_TIMEOUT,
+                         on_connect=setup_connection)
+
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Trading operations - get price, submit purchase requests, create transactions
@@ -25,6 +1467,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    # Platform keep-alive pings (timer triggers without httpMethod, or ?action=ping)
+    # keep the instance warm and must not touch the database
+    if 'httpMethod' not in event or (event.get('queryStringParameters') or {}).get('action') == 'ping':
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'ok': True}),
+            'isBase64Encoded': False
+        }
+    
     dsn = os.environ.get('DATABASE_URL')
     if not dsn:
         return {
@@ -34,28 +1486,90 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(dsn)
+    # Writes over a user's budget are refused before they cost a connection, and
+    # beyond MAX_IN_FLIGHT requests the instance sheds load instead of queueing
+    limit_key = rate_limit_key(method, event)
+    if limit_key:
+        wait = RATE_LIMITER.take(*limit_key)
+        if wait:
+            return too_many_requests(wait)
+    
+    if not IN_FLIGHT.enter():
+        return {
+            'statusCode': 503,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': '1'},
+            'body': json.dumps({'error': 'Server busy, retry later'}),
+            'isBase64Encoded': False
+        }
+    try:
+        return serve_request(method, event, dsn)
+    finally:
+        IN_FLIGHT.leave()
+
+
+def serve_request(method: str, event: Dict[str, Any], dsn: str) -> Dict[str, Any]:
+    '''
+    Business: Route one request on a pooled connection, replaying a read once if its connection was dropped
+    '''
+    trace = RequestTrace() if random.random() < TIMING_SAMPLE_RATE else None
+    _timing.trace = trace
+    try:
+        conn = DB_POOL.acquire(dsn)
+    except PoolExhausted:
+        _timing.trace = None
+        return {
+            'statusCode': 503,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': '1'},
+            'body': json.dumps({'error': 'Database busy, retry later'}),
+            'isBase64Encoded': False
+        }
+    
+    if trace:
+        trace.acquire_ms = (time.perf_counter() - trace.started) * 1000.0
+    
+    try:
+        response = route_request(method, event, conn)
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        if method != 'GET' or not conn.closed:
+            raise
+        # A reused connection was dropped by the server; reads are safe to replay once
+        DB_POOL.release(conn)
+        conn = DB_POOL.acquire(dsn)
+        response = route_request(method, event, conn)
+    finally:
+        DB_POOL.release(conn)
+        _timing.trace = None
+    
+    if trace:
+        trace.finish(event, response)
+    return response
+
+
+def route_request(method: str, event: Dict[str, Any], conn: Any) -> Dict[str, Any]:
+    if RATE_LIMITER.shared:
+        limit_key = rate_limit_key(method, event)
+        if limit_key:
+            wait = RATE_LIMITER.take_shared(conn, *limit_key)
+            if wait:
+                return too_many_requests(wait)
+    
+    if CLICK_BUFFER.due():
+        flush_clicks(conn)
+    
     cur = conn.cursor()
     
     if method == 'GET':
         action = event.get('queryStringParameters', {}).get('action', 'price')
         
         if action == 'price':
-            cur.execute("SELECT value FROM settings WHERE key = 'current_price'")
-            price_row = cur.fetchone()
-            
-            cur.execute("SELECT value FROM settings WHERE key = 'commission'")
-            commission_row = cur.fetchone()
-            
-            cur.close()
-            conn.close()
+            settings = SETTINGS_CACHE.get(conn)
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                 'body': json.dumps({
-                    'price': float(price_row[0]) if price_row else 42.50,
-                    'commission': float(commission_row[0]) if commission_row else 0
+                    'price': float(settings.get('current_price', 42.50)),
+                    'commission': float(settings.get('commission', 0))
                 }),
                 'isBase64Encoded': False
             }
@@ -63,8 +1577,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         elif action == 'balance':
             user_id = event.get('queryStringParameters', {}).get('userId')
             if not user_id:
-                cur.close()
-                conn.close()
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -72,35 +1584,39 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            cur.execute(
-                "SELECT crypto_balance FROM user_balances WHERE user_id = %s",
-                (user_id,)
-            )
-            balance_row = cur.fetchone()
-            
-            cur.close()
-            conn.close()
+            balance = BALANCE_CACHE.get(conn, int(user_id))
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                 'body': json.dumps({
-                    'cryptoBalance': float(balance_row[0]) if balance_row else 0.0
+                    'cryptoBalance': float(balance + CLICK_BUFFER.pending_for(int(user_id))) if balance is not None else 0.0
                 }),
                 'isBase64Encoded': False
             }
         
         elif action == 'transactions':
-            cur.execute("""
-                SELECT t.id, t.type, t.amount, t.price, t.commission, t.created_at, u.username
-                FROM transactions t
-                JOIN users u ON t.user_id = u.id
-                ORDER BY t.created_at DESC
-                LIMIT 50
-            """)
+            params = event.get('queryStringParameters', {})
+            since_id = params.get('sinceId')
+            before_id = params.get('beforeId')
+            
+            # Ids are assigned in insert order, so keyset cursors on the primary key
+            # replace the unindexed sort on created_at. Only scrolling back with
+            # beforeId, or a feed with fewer than FEED_LIMIT trades in the window,
+            # reaches into older partitions
+            if since_id:
+                PREPARED.execute(cur, 'feed_since', (int(since_id), FEED_FLOOR.get(), FEED_LOOKBACK))
+            elif before_id:
+                PREPARED.execute(cur, 'feed_before', (int(before_id),))
+            else:
+                PREPARED.execute(cur, 'feed_latest', (FEED_FLOOR.get(), FEED_LOOKBACK))
+            
+            rows = cur.fetchall()
+            if not before_id:
+                FEED_FLOOR.observe([row[5] for row in rows])
             
             transactions = []
-            for row in cur.fetchall():
+            for row in rows:
                 transactions.append({
                     'id': row[0],
                     'type': row[1],
@@ -111,15 +1627,179 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'user': row[6]
                 })
             
-            cur.close()
-            conn.close()
-            
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                 'body': json.dumps({'transactions': transactions}),
                 'isBase64Encoded': False
             }
+        
+        elif action == 'candles':
+            params = event.get('queryStringParameters', {})
+            interval = params.get('interval', '1m')
+            try:
+                range_from = datetime.fromisoformat(params['from']) if params.get('from') else None
+                range_to = datetime.fromisoformat(params['to']) if params.get('to') else None
+            except ValueError:
+                range_from = range_to = interval = None
+            
+            if interval not in CANDLE_INTERVALS:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'interval must be 1m, 1h or 1d; from/to ISO timestamps'}),
+                    'isBase64Encoded': False
+                }
+            
+            # price_candles is rolled up by trigger as ticks arrive, so a chart range is
+            # a primary-key range scan; each bucket's shard rows, at most 16, merge into
+            # one candle and at most CANDLES_MAX_BUCKETS candles come back
+            cur.execute("""
+                SELECT bucket,
+                       (array_agg(open ORDER BY open_at, shard))[1],
+                       MAX(high), MIN(low),
+                       (array_agg(close ORDER BY close_at DESC, shard))[1],
+                       SUM(volume), SUM(trades)
+                FROM price_candles
+                WHERE interval = %(interval)s
+                  AND bucket <= COALESCE(%(to)s::timestamp, LOCALTIMESTAMP)
+                  AND bucket >= COALESCE(%(from)s::timestamp, COALESCE(%(to)s::timestamp, LOCALTIMESTAMP) - %(span)s)
+                GROUP BY bucket
+                ORDER BY bucket DESC
+                LIMIT %(limit)s
+            """, {'interval': interval, 'from': range_from, 'to': range_to,
+                  'span': CANDLE_INTERVALS[interval] * CANDLES_MAX_BUCKETS, 'limit': CANDLES_MAX_BUCKETS})
+            
+            candles = []
+            for row in reversed(cur.fetchall()):
+                candles.append({
+                    'time': row[0].isoformat(),
+                    'open': float(row[1]),
+                    'high': float(row[2]),
+                    'low': float(row[3]),
+                    'close': float(row[4]),
+                    'volume': float(row[5]),
+                    'trades': int(row[6])
+                })
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'interval': interval, 'candles': candles}),
+                'isBase64Encoded': False
+            }
+        
+        elif action == 'portfolio':
+            user_id = event.get('queryStringParameters', {}).get('userId')
+            if not user_id:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'userId required'}),
+                    'isBase64Encoded': False
+                }
+            
+            cur.execute(
+                """SELECT bought_amount, bought_cost, sold_amount, sold_proceeds, fees_paid, realized_pnl
+                   FROM user_portfolios
+                   WHERE user_id = %s""",
+                (user_id,)
+            )
+            bought_amount, bought_cost, sold_amount, sold_proceeds, fees_paid, realized_pnl = cur.fetchone() or (0,) * 6
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'boughtAmount': float(bought_amount),
+                    'boughtCost': float(bought_cost),
+                    'averageBuyPrice': float(bought_cost / bought_amount) if bought_amount else 0.0,
+                    'soldAmount': float(sold_amount),
+                    'soldProceeds': float(sold_proceeds),
+                    'feesPaid': float(fees_paid),
+                    'realizedPnl': float(realized_pnl)
+                }),
+                'isBase64Encoded': False
+            }
+        
+        elif action == 'snapshot':
+            params = event.get('queryStringParameters', {})
+            user_id = params.get('userId')
+            if not user_id:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'userId required'}),
+                    'isBase64Encoded': False
+                }
+            
+            PREPARED.execute(cur, 'snapshot', (int(user_id), FEED_FLOOR.get(), FEED_LOOKBACK))
+            settings, balance, transactions, lotteries = cur.fetchone()
+            FEED_FLOOR.observe([datetime.fromisoformat(t['timestamp']) for t in transactions])
+            settings = settings or {}
+            
+            snapshot = {
+                'price': float(settings.get('current_price', 42.50)),
+                'commission': float(settings.get('commission', 0)),
+                'cryptoBalance': float(balance + CLICK_BUFFER.pending_for(int(user_id))) if balance is not None else 0.0,
+                'transactions': transactions,
+                'lotteries': lotteries
+            }
+            body = json.dumps(snapshot, sort_keys=True)
+            version = hashlib.sha1(body.encode()).hexdigest()[:16]
+            
+            if params.get('version') == version:
+                return {
+                    'statusCode': 304,
+                    'headers': {'Access-Control-Allow-Origin': '*', 'ETag': version},
+                    'body': '',
+                    'isBase64Encoded': False
+                }
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'ETag': version},
+                'body': json.dumps(dict(snapshot, version=version)),
+                'isBase64Encoded': False
+            }
+        
+        elif action == 'order_book':
+            try:
+                depth = min(max(int(event.get('queryStringParameters', {}).get('depth', '20')), 1), ORDER_BOOK_MAX_DEPTH)
+            except ValueError:
+                depth = None
+            if depth is None:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'depth must be a number'}),
+                    'isBase64Encoded': False
+                }
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps(ORDER_ENGINE.depth(conn, depth)),
+                'isBase64Encoded': False
+            }
+        
+        elif action == 'cache_stats':
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'pool': DB_POOL.snapshot(),
+                    'settings': SETTINGS_CACHE.snapshot(),
+                    'balances': BALANCE_CACHE.snapshot(),
+                    'clicks': CLICK_BUFFER.snapshot(),
+                    'rateLimits': RATE_LIMITER.snapshot(),
+                    'inFlight': IN_FLIGHT.snapshot(),
+                    'prepared': PREPARED.snapshot(),
+                    'orderBook': ORDER_ENGINE.snapshot(),
+                    'feedFloor': FEED_FLOOR.snapshot()
+                }),
+                'isBase64Encoded': False
+            }
     
     elif method == 'POST':
         body_data = json.loads(event.get('body', '{}'))
@@ -131,8 +1811,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             signature = body_data.get('signature', '').strip()
             
             if not user_id or not amount or not signature:
-                cur.close()
-                conn.close()
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -140,8 +1818,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            cur.execute("SELECT value FROM settings WHERE key = 'current_price'")
-            price = float(cur.fetchone()[0])
+            price = float(SETTINGS_CACHE.get(conn)['current_price'])
             
             cur.execute(
                 """INSERT INTO purchase_requests (user_id, amount, price, signature, status)
@@ -152,8 +1829,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             request_id = cur.fetchone()[0]
             
             conn.commit()
-            cur.close()
-            conn.close()
             
             return {
                 'statusCode': 201,
@@ -167,8 +1842,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             amount = body_data.get('amount')
             
             if not user_id or not amount:
-                cur.close()
-                conn.close()
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -176,12 +1849,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            cur.execute("SELECT crypto_balance FROM user_balances WHERE user_id = %s", (user_id,))
-            balance_row = cur.fetchone()
+            if CLICK_BUFFER.pending_for(int(user_id)):
+                flush_clicks(conn)
             
-            if not balance_row or float(balance_row[0]) < float(amount):
-                cur.close()
-                conn.close()
+            conn.autocommit = True
+            try:
+                PREPARED.execute(cur, 'sell', (int(user_id), amount))
+                sold = cur.fetchone()
+            finally:
+                conn.autocommit = False
+            
+            if not sold:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -189,70 +1867,169 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            cur.execute("SELECT value FROM settings WHERE key = 'current_price'")
-            price = float(cur.fetchone()[0])
-            
-            cur.execute("SELECT value FROM settings WHERE key = 'commission'")
-            commission_percent = float(cur.fetchone()[0])
-            commission = float(amount) * price * (commission_percent / 100.0)
+            BALANCE_CACHE.put(int(user_id), sold[1])
+            commission = float(sold[0])
             
-            cur.execute(
-                "UPDATE user_balances SET crypto_balance = crypto_balance - %s WHERE user_id = %s",
-                (amount, user_id)
-            )
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'success': True, 'commission': commission}),
+                'isBase64Encoded': False
+            }
+        
+        elif action == 'add_clicks':
+            user_id = body_data.get('userId')
+            accrual = click_accrual(body_data)
             
-            cur.execute(
-                """INSERT INTO transactions (user_id, type, amount, price, commission)
-                   VALUES (%s, 'sell', %s, %s, %s)""",
-                (user_id, amount, price, commission)
-            )
+            if not user_id or not accrual:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': f'userId and amount required; amount up to {CLICK_MAX_AMOUNT}, clicks up to {CLICK_MAX_CLICKS} per request'}),
+                    'isBase64Encoded': False
+                }
             
-            conn.commit()
-            cur.close()
-            conn.close()
+            # Accruals are buffered and merged per user; a flush happens once enough
+            # are pending or the oldest has waited CLICK_FLUSH_INTERVAL seconds
+            CLICK_BUFFER.add(int(user_id), *accrual)
+            if CLICK_BUFFER.due():
+                flush_clicks(conn)
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'commission': commission}),
+                'body': json.dumps({'success': True}),
                 'isBase64Encoded': False
             }
         
-        elif action == 'add_clicks':
+        elif action == 'place_order':
             user_id = body_data.get('userId')
-            amount = body_data.get('amount')
+            side = body_data.get('side')
+            price = order_units(body_data.get('price'), PRICE_SCALE)
+            amount = order_units(body_data.get('amount'), AMOUNT_SCALE)
             
-            if not user_id or not amount:
-                cur.close()
-                conn.close()
+            if not user_id or side not in ('buy', 'sell') or price is None or amount is None:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'userId and amount required'}),
+                    'body': json.dumps({'error': 'userId, side (buy or sell), price (2 decimals) and amount (4 decimals) required'}),
                     'isBase64Encoded': False
                 }
             
-            cur.execute(
-                "UPDATE user_balances SET crypto_balance = crypto_balance + %s WHERE user_id = %s",
-                (amount, user_id)
-            )
+            if side == 'buy':
+                # There is no cash balance, so a buy is paid off-platform first: it waits
+                # as a purchase request at its limit price, and the engine enters it once
+                # an admin approves the payment
+                signature = (body_data.get('signature') or '').strip()
+                if not signature:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'signature required for buy orders'}),
+                        'isBase64Encoded': False
+                    }
+                
+                cur.execute(
+                    """INSERT INTO purchase_requests (user_id, amount, price, signature, status, kind)
+                       VALUES (%s, %s, %s, %s, 'pending', 'order')
+                       ON CONFLICT (signature) WHERE kind = 'order' DO NOTHING
+                       RETURNING id""",
+                    (int(user_id), Decimal(amount).scaleb(-4), Decimal(price).scaleb(-2), signature)
+                )
+                row = cur.fetchone()
+                conn.commit()
+                
+                # One payment pays for one order
+                if not row:
+                    return {
+                        'statusCode': 409,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'signature already used for another buy order'}),
+                        'isBase64Encoded': False
+                    }
+                request_id = row[0]
+                
+                return {
+                    'statusCode': 202,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'requestId': request_id, 'status': 'pending'}),
+                    'isBase64Encoded': False
+                }
             
-            conn.commit()
-            cur.close()
-            conn.close()
+            if CLICK_BUFFER.pending_for(int(user_id)):
+                flush_clicks(conn)
+            
+            # Resting sells hold the seller's crypto until they fill or are cancelled
+            placed = ORDER_ENGINE.submit(conn, OrderCommand('place', int(user_id), side, price, amount))
+            
+            if 'error' in placed:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps(placed),
+                    'isBase64Encoded': False
+                }
+            
+            return {
+                'statusCode': 201,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps(placed),
+                'isBase64Encoded': False
+            }
+        
+        elif action == 'cancel_order':
+            user_id = body_data.get('userId')
+            order_id = body_data.get('orderId')
+            
+            if not user_id or not order_id:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'userId and orderId required'}),
+                    'isBase64Encoded': False
+                }
+            
+            cancelled = ORDER_ENGINE.submit(conn, OrderCommand('cancel', int(user_id), order_id=int(order_id)))
+            
+            if cancelled is None:
+                return {
+                    'statusCode': 404,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Order not found or no longer open'}),
+                    'isBase64Encoded': False
+                }
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True}),
+                'body': json.dumps(dict(cancelled, success=True)),
                 'isBase64Encoded': False
             }
     
-    cur.close()
-    conn.close()
     return {
         'statusCode': 405,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
         'body': json.dumps({'error': 'Method not allowed'}),
         'isBase64Encoded': False
-    }
\ No newline at end of file
+    }
+
+
+def warm_up() -> None:
+    '''
+    Business: Open a pooled connection at import time so the first request skips the connect handshake
+    '''
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        return
+    try:
+        conn = DB_POOL.acquire(dsn)
+    except (psycopg2.Error, PoolExhausted):
+        return
+    try:
+        SETTINGS_CACHE.get(conn)
+    finally:
+        DB_POOL.release(conn)
+
+
+if DB_WARMUP_ON_IMPORT:
+    warm_up()
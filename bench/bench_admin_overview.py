@@ -0,0 +1,109 @@
+'''
+Business: Compare admin?action=overview with the four listing calls the admin page used to make one after another
+Args: --rows seeded per listing, --repeat calls per measurement, --rtt-ms modeled network round trip per statement;
+      needs DATABASE_URL of a scratch database
+Returns: JSON with latency percentiles for each single listing, their serial sum and the concurrent overview
+'''
+import argparse
+import json
+import os
+import time
+
+import psycopg2
+
+from common import ADMIN_PASSWORD, load_function, make_event, require_dsn, summarize, time_calls
+
+LISTINGS = ('users', 'promotions', 'lotteries', 'purchase_requests')
+
+
+def seed(conn, rows: int) -> None:
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO users (username)
+            SELECT 'bench_overview_' || g FROM generate_series(1, %s) g
+            ON CONFLICT (username) DO NOTHING
+        """, (rows,))
+        cur.execute("""
+            INSERT INTO user_balances (user_id, crypto_balance)
+            SELECT id, 1 FROM users WHERE username LIKE 'bench_overview_%%'
+            ON CONFLICT (user_id) DO NOTHING
+        """)
+        cur.execute("""
+            INSERT INTO purchase_requests (user_id, amount, price, signature, status)
+            SELECT id, 1, 42.50, 'bench', 'pending' FROM users WHERE username LIKE 'bench_overview_%%'
+        """)
+        cur.execute("""
+            INSERT INTO promotions (title, description, discount, active)
+            SELECT 'bench_overview', 'seeded', 0, false FROM generate_series(1, %s)
+        """, (rows,))
+        cur.execute("""
+            INSERT INTO lotteries (prize, active)
+            SELECT 0.01, false FROM generate_series(1, %s)
+        """, (rows,))
+        conn.commit()
+        cur.execute("ANALYZE")
+        conn.commit()
+
+
+def cleanup(conn) -> None:
+    with conn.cursor() as cur:
+        cur.execute("""
+            DELETE FROM purchase_requests
+            WHERE user_id IN (SELECT id FROM users WHERE username LIKE 'bench_overview_%%')
+        """)
+        cur.execute("""
+            DELETE FROM user_balances
+            WHERE user_id IN (SELECT id FROM users WHERE username LIKE 'bench_overview_%%')
+        """)
+        cur.execute("DELETE FROM users WHERE username LIKE 'bench_overview_%%'")
+        cur.execute("DELETE FROM promotions WHERE title = 'bench_overview'")
+        cur.execute("DELETE FROM lotteries WHERE prize = 0.01 AND active = false AND winner_id IS NULL")
+    conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=50)
+    # A local database on the same few cores cannot run four queries in parallel with
+    # the client; a sleeping round trip models the managed Postgres the functions use
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    dsn = require_dsn()
+    conn = psycopg2.connect(dsn)
+    seed(conn, args.rows)
+
+    admin = load_function('admin')
+    if args.rtt_ms:
+        execute = admin.TimedCursor.execute
+
+        def remote_execute(cursor, query, vars=None):
+            time.sleep(args.rtt_ms / 1000.0)
+            return execute(cursor, query, vars)
+
+        admin.TimedCursor.execute = remote_execute
+    headers = {'X-Admin-Password': ADMIN_PASSWORD}
+    events = {action: make_event('GET', {'action': action}, headers=headers) for action in LISTINGS}
+    overview_event = make_event('GET', {'action': 'overview'}, headers=headers)
+
+    # Warm the pool so every measurement reuses connections
+    admin.handler(overview_event, None)
+
+    def serial() -> None:
+        for event in events.values():
+            admin.handler(event, None)
+
+    result = {'rows': args.rows, 'rttMs': args.rtt_ms, 'cpus': os.cpu_count()}
+    for action, event in events.items():
+        result[action] = summarize(time_calls(lambda: admin.handler(event, None), args.repeat))
+    result['serialFourCalls'] = summarize(time_calls(serial, args.repeat))
+    result['overview'] = summarize(time_calls(lambda: admin.handler(overview_event, None), args.repeat))
+    print(json.dumps(result))
+
+    cleanup(conn)
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
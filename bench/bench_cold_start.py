@@ -0,0 +1,73 @@
+'''
+Business: Measure each function's cold start: module import time and time to first and second response
+Args: --runs fresh interpreters per function and mode; needs DATABASE_URL for the first-response timings
+Returns: one JSON line per function and warm-up mode with median timings in ms
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from common import BACKEND_DIR, FUNCTIONS
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PROBE = '''
+import json, sys, time
+sys.path.insert(0, {bench_dir!r})
+started = time.perf_counter()
+from common import load_function, make_event
+module = load_function({name!r})
+imported = time.perf_counter()
+event = make_event({method!r}, {query!r}, {body!r}, {headers!r})
+module.handler(event, None)
+first = time.perf_counter()
+module.handler(event, None)
+second = time.perf_counter()
+print(json.dumps({{
+    'importMs': (imported - started) * 1000.0,
+    'firstResponseMs': (first - imported) * 1000.0,
+    'secondResponseMs': (second - first) * 1000.0
+}}))
+'''
+
+
+def first_scenario(name: str) -> dict:
+    with open(os.path.join(BACKEND_DIR, name, 'tests.json')) as f:
+        test = json.load(f)['tests'][0]
+    path, _, query = test.get('path', '/').partition('?')
+    return {
+        'method': test.get('method', 'GET'),
+        'query': dict(pair.split('=', 1) for pair in query.split('&') if pair),
+        'body': test.get('body'),
+        'headers': test.get('headers', {})
+    }
+
+
+def probe(name: str, warmup: bool) -> dict:
+    scenario = first_scenario(name)
+    code = PROBE.format(bench_dir=BENCH_DIR, name=name, **scenario)
+    env = dict(os.environ, DB_WARMUP_ON_IMPORT='1' if warmup else '0')
+    output = subprocess.check_output([sys.executable, '-c', code], env=env, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    for name in FUNCTIONS:
+        for warmup in (False, True):
+            samples = [probe(name, warmup) for _ in range(args.runs)]
+            print(json.dumps({
+                'function': name,
+                'warmupOnImport': warmup,
+                **{key: round(statistics.median(s[key] for s in samples), 3) for key in samples[0]}
+            }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+'''
+Business: Fire thousands of concurrent joins at one lottery and check throughput and correctness
+Args: --users distinct joiners, --duplicates repeated joins per user, --workers threads; needs DATABASE_URL of a scratch database
+Returns: JSON with joins/sec, latency percentiles and outcome counts; exits non-zero if the counts disagree
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+from common import load_function, make_event, require_dsn, summarize
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--duplicates', type=int, default=2)
+    parser.add_argument('--workers', type=int, default=64)
+    args = parser.parse_args()
+
+    dsn = require_dsn()
+    os.environ['DB_POOL_MAX_SIZE'] = str(args.workers)
+    lottery = load_function('lottery')
+
+    conn = psycopg2.connect(dsn)
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO lotteries (prize) VALUES (100) RETURNING id")
+        lottery_id = cur.fetchone()[0]
+    conn.commit()
+
+    user_ids = [1_000_000 + n for n in range(args.users)] * args.duplicates
+    random.shuffle(user_ids)
+
+    def join(user_id: int):
+        event = make_event('POST', body={'lotteryId': lottery_id, 'userId': user_id})
+        started = time.perf_counter()
+        response = lottery.handler(event, None)
+        elapsed = (time.perf_counter() - started) * 1000.0
+        outcome = 'joined' if response['statusCode'] == 200 else json.loads(response['body'])['error']
+        return outcome, elapsed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(join, user_ids))
+    wall = time.perf_counter() - started
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM lottery_participants WHERE lottery_id = %s", (lottery_id,))
+        stored_rows = cur.fetchone()[0]
+        cur.execute("SELECT participant_count FROM lotteries WHERE id = %s", (lottery_id,))
+        stored_count = cur.fetchone()[0]
+        cur.execute("DELETE FROM lottery_participants WHERE lottery_id = %s", (lottery_id,))
+        cur.execute("DELETE FROM lotteries WHERE id = %s", (lottery_id,))
+    conn.commit()
+    conn.close()
+
+    outcomes = Counter(outcome for outcome, _ in results)
+    report = {
+        'joins': len(results),
+        'joinsPerSec': round(len(results) / wall, 1),
+        'latencyMs': summarize([elapsed for _, elapsed in results]),
+        'outcomes': dict(outcomes),
+        'participantRows': stored_rows,
+        'participantCount': stored_count
+    }
+    print(json.dumps(report))
+
+    if not (outcomes['joined'] == stored_rows == stored_count == args.users):
+        sys.exit('participant rows, stored count and successful joins disagree')
+
+
+if __name__ == '__main__':
+    main()
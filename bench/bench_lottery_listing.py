@@ -0,0 +1,73 @@
+'''
+Business: Compare lottery listings backed by lotteries.participant_count with the old correlated COUNT(*)
+Args: --participants entrants seeded into one active lottery, --repeat calls per measurement; needs DATABASE_URL of a scratch database
+Returns: JSON with latency percentiles for the legacy query, lottery GET and admin?action=lotteries
+'''
+import argparse
+import json
+
+import psycopg2
+
+from common import ADMIN_PASSWORD, load_function, make_event, require_dsn, summarize, time_calls
+
+LEGACY_LISTING = """
+    SELECT l.id, l.prize, l.active,
+           (SELECT COUNT(*) FROM lottery_participants WHERE lottery_id = l.id) as participant_count
+    FROM lotteries l
+    WHERE l.active = true
+    ORDER BY l.created_at DESC
+"""
+
+
+def seed_lottery(conn, participants: int) -> int:
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO lotteries (prize) VALUES (1000) RETURNING id")
+        lottery_id = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO lottery_participants (lottery_id, user_id)
+            SELECT %s, g FROM generate_series(1, %s) g
+        """, (lottery_id, participants))
+        cur.execute("UPDATE lotteries SET participant_count = %s WHERE id = %s", (participants, lottery_id))
+        conn.commit()
+        cur.execute("ANALYZE lottery_participants")
+        conn.commit()
+    return lottery_id
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--participants', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    dsn = require_dsn()
+    conn = psycopg2.connect(dsn)
+    lottery_id = seed_lottery(conn, args.participants)
+
+    def legacy() -> None:
+        with conn.cursor() as cur:
+            cur.execute(LEGACY_LISTING)
+            cur.fetchall()
+        conn.rollback()
+
+    lottery = load_function('lottery')
+    admin = load_function('admin')
+    public_event = make_event('GET')
+    admin_event = make_event('GET', {'action': 'lotteries'}, headers={'X-Admin-Password': ADMIN_PASSWORD})
+
+    print(json.dumps({
+        'participants': args.participants,
+        'legacyCorrelatedCount': summarize(time_calls(legacy, args.repeat)),
+        'lotteryGet': summarize(time_calls(lambda: lottery.handler(public_event, None), args.repeat)),
+        'adminLotteries': summarize(time_calls(lambda: admin.handler(admin_event, None), args.repeat))
+    }))
+
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM lottery_participants WHERE lottery_id = %s", (lottery_id,))
+        cur.execute("DELETE FROM lotteries WHERE id = %s", (lottery_id,))
+    conn.commit()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+'''
+Business: Measure the trading order book - in-memory matching alone, then matching persisted in batches of several sizes
+Args: --orders for the in-memory run, --cancel-ratio of commands that cancel a resting order, --batch-sizes and
+      --batches for the persisted runs, --users seeded traders; the persisted runs need DATABASE_URL of a scratch database
+Returns: one JSON line per run with commands per second, fills and resting orders
+'''
+import argparse
+import json
+import os
+import random
+import time
+
+import psycopg2
+
+from common import load_function, require_dsn
+
+MID_PRICE = 4250
+SPREAD = 50
+
+
+def random_order(rng: random.Random, user_ids: list) -> tuple:
+    side = rng.choice(('buy', 'sell'))
+    # Buys lean below the mid and sells above it, so most orders rest and some cross
+    offset = int(rng.triangular(-SPREAD, SPREAD, -SPREAD // 4 if side == 'buy' else SPREAD // 4))
+    return rng.choice(user_ids), side, MID_PRICE + offset, rng.randint(1, 200) * 100
+
+
+def bench_engine(trading, orders: int, cancel_ratio: float, seed: int) -> dict:
+    rng = random.Random(seed)
+    user_ids = list(range(1, 1001))
+    commands = []
+    for _ in range(orders):
+        if rng.random() < cancel_ratio:
+            commands.append(None)
+        else:
+            commands.append(random_order(rng, user_ids))
+
+    book = trading.OrderBook()
+    resting = []
+    fills = 0
+    started = time.perf_counter()
+    for order_id, command in enumerate(commands, 1):
+        if command is None:
+            if resting:
+                book.remove(resting.pop(rng.randrange(len(resting))))
+            continue
+        user_id, side, price, amount = command
+        order = trading.Order(order_id, user_id, side, price, amount)
+        matched, _ = book.place(order)
+        fills += len(matched)
+        if order.remaining:
+            resting.append(order_id)
+    elapsed = time.perf_counter() - started
+    return {
+        'run': 'engine',
+        'commands': orders,
+        'commandsPerSec': round(orders / elapsed, 1),
+        'fills': fills,
+        'restingOrders': len(book.orders)
+    }
+
+
+def seed_users(conn, users: int) -> list:
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO users (username)
+            SELECT 'bench_orders_' || g FROM generate_series(1, %s) g
+            ON CONFLICT (username) DO NOTHING
+        """, (users,))
+        cur.execute("SELECT id FROM users WHERE username LIKE 'bench_orders_%%' ORDER BY id LIMIT %s", (users,))
+        user_ids = [row[0] for row in cur.fetchall()]
+        cur.execute("""
+            INSERT INTO user_balances (user_id, crypto_balance)
+            SELECT unnest(%s::integer[]), 100000
+            ON CONFLICT (user_id) DO UPDATE SET crypto_balance = 100000
+        """, (user_ids,))
+    conn.commit()
+    return user_ids
+
+
+def bench_persisted(trading, conn, user_ids: list, batch_size: int, batches: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    engine = trading.ORDER_ENGINE
+    fills_before = engine.stats['fills']
+    failed_before = engine.stats['failedBatches']
+    started = time.perf_counter()
+    for _ in range(batches):
+        commands = [trading.OrderCommand('place', *random_order(rng, user_ids)) for _ in range(batch_size)]
+        engine.process(conn, commands)
+    elapsed = time.perf_counter() - started
+    return {
+        'run': 'persisted',
+        'batchSize': batch_size,
+        'commands': batch_size * batches,
+        'commandsPerSec': round(batch_size * batches / elapsed, 1),
+        'fills': engine.stats['fills'] - fills_before,
+        'failedBatches': engine.stats['failedBatches'] - failed_before,
+        'restingOrders': len(engine.book.orders)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=200000)
+    parser.add_argument('--cancel-ratio', type=float, default=0.1)
+    parser.add_argument('--batch-sizes', default='1,10,100,1000')
+    parser.add_argument('--batches', type=int, default=20)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--engine-only', action='store_true')
+    args = parser.parse_args()
+
+    trading = load_function('trading')
+    print(json.dumps(dict(bench_engine(trading, args.orders, args.cancel_ratio, args.seed), cpus=os.cpu_count())))
+    if args.engine_only:
+        return
+
+    dsn = require_dsn()
+    conn = psycopg2.connect(dsn, connection_factory=trading.TimedConnection)
+    user_ids = seed_users(conn, args.users)
+    for batch_size in (int(size) for size in args.batch_sizes.split(',')):
+        print(json.dumps(bench_persisted(trading, conn, user_ids, batch_size, args.batches, args.seed)))
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+'''
+Business: Compare the hot read statements run through PREPARED.execute with the same SQL sent as text by cur.execute
+Args: --seconds spent on each statement and mode, --user-id for the per-user statements; needs DATABASE_URL of a
+      scratch database with db_migrations applied
+Returns: JSON with statements per second and latency percentiles for each statement, plain and prepared
+'''
+import argparse
+import json
+import re
+import time
+from typing import Any, Callable, List, Tuple
+
+import psycopg2
+
+from common import load_function, require_dsn, summarize
+
+PLACEHOLDER = re.compile(r'\$(\d+)')
+
+
+def plain_sql(sql: str) -> str:
+    # $n placeholders become named psycopg2 ones so repeated parameters keep working
+    return PLACEHOLDER.sub(lambda match: f'%(p{match.group(1)})s', sql)
+
+
+def run_for(seconds: float, statement: Callable[[], Any]) -> Tuple[float, List[float]]:
+    samples = []
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        call_started = time.perf_counter()
+        statement()
+        samples.append((time.perf_counter() - call_started) * 1000.0)
+    return len(samples) / (time.perf_counter() - started), samples
+
+
+def measure(conn: Any, registry: Any, name: str, args: Tuple[Any, ...], seconds: float) -> dict:
+    sql = plain_sql(registry.statements[name][1])
+    params = {f'p{i}': arg for i, arg in enumerate(args, 1)}
+    cur = conn.cursor()
+
+    def plain() -> None:
+        cur.execute(sql, params)
+        cur.fetchall()
+
+    def prepared() -> None:
+        registry.execute(cur, name, args)
+        cur.fetchall()
+
+    # Both modes run once first so neither pays for catalog or buffer cache misses
+    plain()
+    prepared()
+    conn.rollback()
+
+    result = {}
+    for mode, statement in (('plain', plain), ('prepared', prepared)):
+        per_second, samples = run_for(seconds, statement)
+        conn.rollback()
+        result[mode] = dict(summarize(samples), perSecond=round(per_second, 1))
+    result['speedup'] = round(result['prepared']['perSecond'] / result['plain']['perSecond'], 2)
+    cur.close()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--user-id', type=int, default=1)
+    args = parser.parse_args()
+
+    dsn = require_dsn()
+    trading = load_function('trading')
+    lottery = load_function('lottery')
+
+    # The writes (sell, balance_credit, lottery_join) share the same machinery but
+    # would change the database, so only the polled reads are measured
+    cases = [
+        (trading, 'settings_all', ()),
+        (trading, 'balance_get', (args.user_id,)),
+        (trading, 'feed_latest', (trading.FEED_LOOKBACK,)),
+        (trading, 'feed_since', (0, trading.FEED_LOOKBACK)),
+        (trading, 'snapshot', (args.user_id, trading.FEED_LOOKBACK)),
+        (lottery, 'lotteries_active', ())
+    ]
+
+    result = {'seconds': args.seconds}
+    for module in (trading, lottery):
+        conn = psycopg2.connect(dsn, connection_factory=module.TimedConnection)
+        for case_module, name, case_args in cases:
+            if case_module is module:
+                result[name] = measure(conn, module.PREPARED, name, case_args, args.seconds)
+        conn.close()
+    print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
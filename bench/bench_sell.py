@@ -0,0 +1,116 @@
+'''
+Business: Compare sells/sec and overdraw safety of the single-statement sell with the old five-round-trip sell
+Args: --sells per variant, --users sellers sharing the load, --workers threads; needs DATABASE_URL of a scratch database
+Returns: JSON per variant with sells/sec, latency percentiles, accepted sells and balances that went negative
+'''
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+from common import load_function, make_event, require_dsn, summarize
+
+SELL_AMOUNT = 1
+
+
+def legacy_sell(dsn: str, local: threading.local, user_id: int) -> bool:
+    if not hasattr(local, 'conn'):
+        local.conn = psycopg2.connect(dsn)
+    conn = local.conn
+    cur = conn.cursor()
+    cur.execute("SELECT crypto_balance FROM user_balances WHERE user_id = %s", (user_id,))
+    balance_row = cur.fetchone()
+    if not balance_row or float(balance_row[0]) < SELL_AMOUNT:
+        conn.rollback()
+        return False
+    cur.execute("SELECT value FROM settings WHERE key = 'current_price'")
+    price = float(cur.fetchone()[0])
+    cur.execute("SELECT value FROM settings WHERE key = 'commission'")
+    commission = SELL_AMOUNT * price * float(cur.fetchone()[0]) / 100.0
+    cur.execute(
+        "UPDATE user_balances SET crypto_balance = crypto_balance - %s WHERE user_id = %s",
+        (SELL_AMOUNT, user_id)
+    )
+    cur.execute(
+        "INSERT INTO transactions (user_id, type, amount, price, commission) VALUES (%s, 'sell', %s, %s, %s)",
+        (user_id, SELL_AMOUNT, price, commission)
+    )
+    conn.commit()
+    return True
+
+
+def seed_users(conn, users: int, balance: int) -> list:
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO users (username)
+            SELECT 'bench_sell_' || g FROM generate_series(1, %s) g
+            ON CONFLICT (username) DO NOTHING
+        """, (users,))
+        cur.execute("SELECT id FROM users WHERE username LIKE 'bench_sell_%%' ORDER BY id LIMIT %s", (users,))
+        user_ids = [row[0] for row in cur.fetchall()]
+        cur.execute("DELETE FROM user_balances WHERE user_id = ANY(%s)", (user_ids,))
+        cur.execute(
+            "INSERT INTO user_balances (user_id, crypto_balance) SELECT unnest(%s::integer[]), %s",
+            (user_ids, balance)
+        )
+    conn.commit()
+    return user_ids
+
+
+def run(name: str, sell, user_ids: list, sells: int, workers: int, conn) -> dict:
+    def timed(n: int):
+        started = time.perf_counter()
+        accepted = sell(user_ids[n % len(user_ids)])
+        return accepted, (time.perf_counter() - started) * 1000.0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(timed, range(sells)))
+    wall = time.perf_counter() - started
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM user_balances WHERE user_id = ANY(%s) AND crypto_balance < 0", (user_ids,))
+        negative = cur.fetchone()[0]
+    conn.rollback()
+    return {
+        'variant': name,
+        'sellsPerSec': round(sells / wall, 1),
+        'latencyMs': summarize([elapsed for _, elapsed in results]),
+        'accepted': sum(1 for accepted, _ in results if accepted),
+        'negativeBalances': negative
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sells', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=32)
+    args = parser.parse_args()
+
+    dsn = require_dsn()
+    os.environ['DB_POOL_MAX_SIZE'] = str(args.workers)
+    trading = load_function('trading')
+    conn = psycopg2.connect(dsn)
+    # Balances cover only half of the sells so both variants hit the overdraw edge
+    balance = args.sells // args.users // 2
+
+    local = threading.local()
+    user_ids = seed_users(conn, args.users, balance)
+    print(json.dumps(run('legacy', lambda uid: legacy_sell(dsn, local, uid), user_ids, args.sells, args.workers, conn)))
+
+    def atomic_sell(user_id: int) -> bool:
+        event = make_event('POST', body={'action': 'sell', 'userId': user_id, 'amount': SELL_AMOUNT})
+        return trading.handler(event, None)['statusCode'] == 200
+
+    user_ids = seed_users(conn, args.users, balance)
+    print(json.dumps(run('atomic', atomic_sell, user_ids, args.sells, args.workers, conn)))
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+'''
+Business: Show that trading?action=transactions stays flat while the transactions table grows
+Args: --sizes table sizes to measure at, --repeat calls per measurement; needs DATABASE_URL of a scratch database
+Returns: one JSON line per size with latency percentiles for the latest, sinceId and beforeId feeds
+'''
+import argparse
+import json
+
+import psycopg2
+
+from common import load_function, make_event, require_dsn, summarize, time_calls
+
+SEED_CHUNK = 1_000_000
+
+
+def grow_transactions(conn, target: int) -> int:
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO users (username) VALUES ('bench_feed') ON CONFLICT (username) DO NOTHING")
+        cur.execute("SELECT id FROM users WHERE username = 'bench_feed'")
+        user_id = cur.fetchone()[0]
+        cur.execute("SELECT COUNT(*) FROM transactions")
+        current = cur.fetchone()[0]
+        while current < target:
+            batch = min(SEED_CHUNK, target - current)
+            cur.execute("""
+                INSERT INTO transactions (user_id, type, amount, price, commission, created_at)
+                SELECT %s, CASE WHEN g %% 2 = 0 THEN 'buy' ELSE 'sell' END, 1.5, 42.50, 0.1,
+                       CURRENT_TIMESTAMP - make_interval(secs => %s - g)
+                FROM generate_series(1, %s) g
+            """, (user_id, batch, batch))
+            conn.commit()
+            current += batch
+        cur.execute("ANALYZE transactions")
+        conn.commit()
+        cur.execute("SELECT MIN(id), MAX(id) FROM transactions")
+        return cur.fetchone()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100000,1000000,10000000,30000000')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    dsn = require_dsn()
+    trading = load_function('trading')
+    conn = psycopg2.connect(dsn)
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        min_id, max_id = grow_transactions(conn, size)
+        scenarios = {
+            'latest': {'action': 'transactions'},
+            'sinceId': {'action': 'transactions', 'sinceId': max_id - 10},
+            'beforeId': {'action': 'transactions', 'beforeId': (min_id + max_id) // 2}
+        }
+        result = {'rows': size}
+        for name, query in scenarios.items():
+            event = make_event('GET', query)
+            result[name] = summarize(time_calls(lambda: trading.handler(event, None), args.repeat))
+        print(json.dumps(result))
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+FUNCTIONS = ('auth', 'trading', 'lottery', 'admin')
+ADMIN_PASSWORD = 'EE%adminA%%'
+
+
+def load_function(name: str) -> Any:
+    '''
+    Business: Import backend/<name>/index.py as its own module so several handlers can live in one process
+    Args: name of the function directory
+    Returns: the loaded module, exposing handler()
+    '''
+    path = os.path.join(BACKEND_DIR, name, 'index.py')
+    spec = importlib.util.spec_from_file_location(f'backend_{name}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_event(method: str = 'GET', query: Dict[str, Any] = None, body: Dict[str, Any] = None,
+               headers: Dict[str, str] = None) -> Dict[str, Any]:
+    return {
+        'httpMethod': method,
+        'headers': headers or {},
+        'queryStringParameters': {k: str(v) for k, v in (query or {}).items()},
+        'body': json.dumps(body) if body is not None else '',
+        'isBase64Encoded': False
+    }
+
+
+def require_dsn() -> str:
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        sys.exit('DATABASE_URL must point at a scratch Postgres database with db_migrations applied')
+    return dsn
+
+
+def time_calls(fn: Callable[[], Any], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000.0)
+    return samples
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        'p50': round(percentile(samples, 50), 3),
+        'p95': round(percentile(samples, 95), 3),
+        'p99': round(percentile(samples, 99), 3),
+        'mean': round(statistics.fmean(samples), 3)
+    }
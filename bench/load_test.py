@@ -0,0 +1,234 @@
+'''
+Business: Replay weighted mixes of the functions' tests.json scenarios at a target concurrency
+Args: --mix file from bench/mixes, --concurrency, --duration, --target in-process or a bench/local_host.py URL
+Returns: per-action p50/p95/p99 latency, requests/sec and DB round trips per request, with rate-limited (429)
+         responses counted apart and left out of latency; saves and compares baselines
+'''
+import argparse
+import copy
+import http.client
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from common import BACKEND_DIR, FUNCTIONS, load_function, make_event, percentile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(BENCH_DIR, 'baselines')
+
+ROUND_TRIPS = re.compile(r'db;dur=[0-9.]+;desc="(\d+) round trips"')
+
+
+def round_trips_from(headers: Dict[str, str]) -> Optional[int]:
+    match = ROUND_TRIPS.search(headers.get('Server-Timing') or headers.get('server-timing') or '')
+    return int(match.group(1)) if match else None
+
+
+def load_scenarios() -> Dict[str, Dict[str, Any]]:
+    scenarios = {}
+    for name in FUNCTIONS:
+        with open(os.path.join(BACKEND_DIR, name, 'tests.json')) as f:
+            for test in json.load(f)['tests']:
+                scenarios[f'{name}:{test["name"]}'] = dict(test, function=name)
+    return scenarios
+
+
+def load_mix(path: str, scenarios: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        mix = json.load(f)
+    requests = []
+    for entry in mix['requests']:
+        if 'scenario' in entry:
+            spec = dict(scenarios[entry['scenario']], weight=entry['weight'])
+            spec['label'] = entry['scenario']
+        else:
+            spec = dict(entry, label=f'{entry["function"]}:{entry["name"]}')
+        requests.append(spec)
+    return requests
+
+
+def personalize(spec: Dict[str, Any], user_id: int) -> Tuple[str, Dict[str, str], Optional[Dict[str, Any]]]:
+    url = urlsplit(spec.get('path', '/'))
+    query = dict(parse_qsl(url.query))
+    if 'userId' in query:
+        query['userId'] = str(user_id)
+    body = copy.deepcopy(spec.get('body'))
+    if isinstance(body, dict) and 'userId' in body:
+        body['userId'] = user_id
+    return spec.get('method', 'GET'), query, body
+
+
+class InProcessTarget:
+    '''
+    Business: Call handlers directly in this process, with every request timed
+    '''
+
+    def __init__(self, concurrency: int, rate_limits: bool):
+        os.environ.setdefault('DB_POOL_MAX_SIZE', str(concurrency))
+        # A few simulated users send far more writes than the per-user limits allow
+        if not rate_limits:
+            os.environ.setdefault('RATE_LIMITS_DISABLED', '1')
+        os.environ['TIMING_SAMPLE_RATE'] = '1'
+        self.functions = {name: load_function(name) for name in FUNCTIONS}
+
+    def call(self, function: str, method: str, query: Dict[str, str], body: Any,
+             headers: Dict[str, str]) -> Tuple[int, Optional[int], str]:
+        response = self.functions[function].handler(make_event(method, query, body, headers), None)
+        return response['statusCode'], round_trips_from(response.get('headers') or {}), response['body']
+
+
+class HttpTarget:
+    '''
+    Business: Send requests to bench/local_host.py (or any host exposing /<function>) over keep-alive connections
+    '''
+
+    def __init__(self, base_url: str):
+        self.base = urlsplit(base_url)
+        self._local = threading.local()
+
+    def call(self, function: str, method: str, query: Dict[str, str], body: Any,
+             headers: Dict[str, str]) -> Tuple[int, Optional[int], str]:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.base.hostname, self.base.port or 80)
+        path = f'/{function}' + (f'?{urlencode(query)}' if query else '')
+        payload = json.dumps(body) if body is not None else None
+        conn.request(method, path, body=payload, headers=dict(headers, **{'Content-Type': 'application/json'}))
+        response = conn.getresponse()
+        text = response.read().decode()
+        return response.status, round_trips_from(dict(response.getheaders())), text
+
+
+def seed_users(target: Any, count: int) -> List[int]:
+    user_ids = []
+    for n in range(count):
+        status, _, body = target.call('auth', 'POST', {}, {'username': f'bench_user_{n}'}, {})
+        if status in (200, 201):
+            user_ids.append(json.loads(body)['id'])
+    if not user_ids:
+        sys.exit('could not register bench users through auth')
+    return user_ids
+
+
+def run(target: Any, mix: List[Dict[str, Any]], user_ids: List[int], concurrency: int,
+        duration: float) -> Dict[str, List[Tuple[float, int, Optional[int]]]]:
+    samples: Dict[str, List[Tuple[float, int, Optional[int]]]] = defaultdict(list)
+    lock = threading.Lock()
+    weights = [spec['weight'] for spec in mix]
+    deadline = time.monotonic() + duration
+
+    def worker(seed: int) -> None:
+        rng = random.Random(seed)
+        local: Dict[str, List[Tuple[float, int, Optional[int]]]] = defaultdict(list)
+        while time.monotonic() < deadline:
+            spec = rng.choices(mix, weights)[0]
+            method, query, body = personalize(spec, rng.choice(user_ids))
+            started = time.perf_counter()
+            status, round_trips, _ = target.call(spec['function'], method, query, body, spec.get('headers') or {})
+            local[spec['label']].append(((time.perf_counter() - started) * 1000.0, status, round_trips))
+        with lock:
+            for label, rows in local.items():
+                samples[label].extend(rows)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    return samples
+
+
+def report(samples: Dict[str, List[Tuple[float, int, Optional[int]]]], duration: float) -> Dict[str, Any]:
+    actions = {}
+    for label, rows in sorted(samples.items()):
+        # A 429 returns before any work, so it would only flatter the latency
+        served = [row for row in rows if row[1] != 429]
+        latencies = [row[0] for row in served]
+        round_trips = [row[2] for row in served if row[2] is not None]
+        actions[label] = {
+            'requests': len(rows),
+            'rps': round(len(rows) / duration, 1),
+            'p50': round(percentile(latencies, 50), 3) if latencies else None,
+            'p95': round(percentile(latencies, 95), 3) if latencies else None,
+            'p99': round(percentile(latencies, 99), 3) if latencies else None,
+            'errors': sum(1 for row in served if row[1] >= 400),
+            'rateLimited': len(rows) - len(served),
+            'dbRoundTrips': round(sum(round_trips) / len(round_trips), 2) if round_trips else None
+        }
+    total = sum(len(rows) for rows in samples.values())
+    return {'rps': round(total / duration, 1), 'actions': actions}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    regressions = []
+    for label, stats in current['actions'].items():
+        before = baseline['actions'].get(label)
+        if not before:
+            continue
+        for metric in ('p95', 'p99', 'dbRoundTrips'):
+            if stats.get(metric) is None or not before.get(metric):
+                continue
+            change = (stats[metric] - before[metric]) / before[metric]
+            line = f'{label} {metric}: {before[metric]} -> {stats[metric]} ({change:+.1%})'
+            print(line)
+            if change > threshold:
+                regressions.append(line)
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mix', default=os.path.join(BENCH_DIR, 'mixes', 'trading_page.json'))
+    parser.add_argument('--target', default='in-process', help="'in-process' or a base URL such as http://127.0.0.1:8000")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--rate-limits', action='store_true',
+                        help='keep the per-user rate limits in-process; an HTTP target uses its own settings')
+    parser.add_argument('--save', action='store_true', help='write bench/baselines/<mix>-<git revision>.json')
+    parser.add_argument('--compare', help='baseline file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative increase reported as a regression')
+    args = parser.parse_args()
+
+    if args.target == 'in-process':
+        if not os.environ.get('DATABASE_URL'):
+            sys.exit('DATABASE_URL must point at a scratch Postgres database with db_migrations applied')
+        target = InProcessTarget(args.concurrency, args.rate_limits)
+    else:
+        target = HttpTarget(args.target)
+
+    mix = load_mix(args.mix, load_scenarios())
+    user_ids = seed_users(target, args.users)
+    result = report(run(target, mix, user_ids, args.concurrency, args.duration), args.duration)
+    result.update(mix=os.path.basename(args.mix), concurrency=args.concurrency, revision=git_revision())
+    print(json.dumps(result, indent=2))
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f'{os.path.splitext(result["mix"])[0]}-{result["revision"]}.json')
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f'baseline saved to {path}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(f'{len(regressions)} regression(s) above {args.threshold:.0%}')
+
+
+if __name__ == '__main__':
+    main()
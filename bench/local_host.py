@@ -0,0 +1,143 @@
+'''
+Business: Serve the backend functions locally so they can be load-tested on one Linux box
+Args: --port, --mode thread|process, --workers, --recycle-after and --idle-timeout to model cold starts
+Returns: HTTP server mounting every function from backend/func2url.json under /<name>
+'''
+import argparse
+import base64
+import json
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from common import BACKEND_DIR, load_function
+
+_instances = threading.local()
+
+
+class Instance:
+    '''
+    Business: One warm copy of a function module, like a platform container that has served requests
+    '''
+
+    def __init__(self, name: str):
+        started = time.perf_counter()
+        self.module = load_function(name)
+        self.import_ms = (time.perf_counter() - started) * 1000.0
+        self.served = 0
+        self.last_used = time.monotonic()
+
+
+def invoke(name: str, event: Dict[str, Any], recycle_after: int, idle_timeout: float) -> Tuple[Dict[str, Any], bool, float]:
+    '''
+    Business: Run one event on this worker's instance of the function, replacing it first if it expired
+    Args: name of the function, event dict, recycle_after requests per instance, idle_timeout seconds
+    Returns: handler response, whether this call paid a cold start, handler time in ms
+    '''
+    instances = getattr(_instances, 'by_name', None)
+    if instances is None:
+        instances = _instances.by_name = {}
+
+    instance = instances.get(name)
+    expired = instance is not None and (
+        (recycle_after and instance.served >= recycle_after)
+        or (idle_timeout and time.monotonic() - instance.last_used > idle_timeout)
+    )
+    cold = instance is None or expired
+    if expired:
+        instance.module.DB_POOL.close()
+    if cold:
+        instance = instances[name] = Instance(name)
+
+    started = time.perf_counter()
+    response = instance.module.handler(event, None)
+    elapsed = (time.perf_counter() - started) * 1000.0
+    instance.served += 1
+    instance.last_used = time.monotonic()
+    return response, cold, elapsed + (instance.import_ms if cold else 0.0)
+
+
+def make_handler(executor: Executor, functions: set, recycle_after: int, idle_timeout: float):
+    class FunctionRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def _dispatch(self) -> None:
+            url = urlsplit(self.path)
+            name = url.path.strip('/').split('/')[0]
+            if name not in functions:
+                self._reply(404, {'Content-Type': 'application/json'}, json.dumps({'error': 'Unknown function'}))
+                return
+
+            length = int(self.headers.get('Content-Length') or 0)
+            event = {
+                'httpMethod': self.command,
+                'path': url.path,
+                'headers': dict(self.headers.items()),
+                'queryStringParameters': dict(parse_qsl(url.query)),
+                'body': self.rfile.read(length).decode() if length else '',
+                'isBase64Encoded': False
+            }
+
+            response, cold, elapsed = executor.submit(invoke, name, event, recycle_after, idle_timeout).result()
+            headers = dict(response.get('headers') or {})
+            headers['X-Cold-Start'] = '1' if cold else '0'
+            headers['X-Handler-Ms'] = f'{elapsed:.3f}'
+            body = response.get('body') or ''
+            if response.get('isBase64Encoded'):
+                body = base64.b64decode(body)
+            self._reply(response.get('statusCode', 200), headers, body)
+
+        def _reply(self, status: int, headers: Dict[str, str], body: Any) -> None:
+            payload = body if isinstance(body, bytes) else body.encode()
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = do_POST = do_PUT = do_OPTIONS = _dispatch
+
+    return FunctionRequestHandler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--mode', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--recycle-after', type=int, default=0,
+                        help='requests an instance serves before it is replaced (0 keeps it warm)')
+    parser.add_argument('--idle-timeout', type=float, default=0,
+                        help='seconds idle after which an instance is replaced (0 keeps it warm)')
+    args = parser.parse_args()
+
+    with open(os.path.join(BACKEND_DIR, 'func2url.json')) as f:
+        functions = set(json.load(f))
+
+    pool_class = ThreadPoolExecutor if args.mode == 'thread' else ProcessPoolExecutor
+    with pool_class(max_workers=args.workers) as executor:
+        server = ThreadingHTTPServer(
+            (args.host, args.port),
+            make_handler(executor, functions, args.recycle_after, args.idle_timeout)
+        )
+        print(f'Serving {", ".join(sorted(functions))} on http://{args.host}:{args.port}/<function> '
+              f'({args.mode} pool, {args.workers} workers)')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+-- Notify warm function instances that cached settings are stale
+CREATE OR REPLACE FUNCTION notify_settings_updated() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('settings_updated', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER settings_updated_notify
+    AFTER INSERT OR UPDATE OR DELETE ON settings
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE notify_settings_updated();
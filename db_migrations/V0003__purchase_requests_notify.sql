@@ -0,0 +1,12 @@
+-- Wake admin long-poll requests when a purchase request is created or resolved
+CREATE OR REPLACE FUNCTION notify_purchase_request_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('purchase_requests', NEW.id::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER purchase_requests_notify
+    AFTER INSERT OR UPDATE OF status ON purchase_requests
+    FOR EACH ROW
+    EXECUTE PROCEDURE notify_purchase_request_changed();
@@ -0,0 +1,11 @@
+-- Store the participant count on each lottery instead of counting on every listing
+ALTER TABLE lotteries ADD COLUMN participant_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE lotteries l
+SET participant_count = c.total
+FROM (
+    SELECT lottery_id, COUNT(*) AS total
+    FROM lottery_participants
+    GROUP BY lottery_id
+) c
+WHERE c.lottery_id = l.id;
@@ -0,0 +1,13 @@
+-- Notify warm function instances which user's cached balance is stale
+CREATE OR REPLACE FUNCTION notify_balance_updated() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('balance_updated', NEW.user_id::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER balance_updated_notify
+    AFTER UPDATE OF crypto_balance ON user_balances
+    FOR EACH ROW
+    WHEN (OLD.crypto_balance IS DISTINCT FROM NEW.crypto_balance)
+    EXECUTE PROCEDURE notify_balance_updated();
@@ -0,0 +1,79 @@
+-- Every price change and trade price, appended as it happens
+CREATE TABLE price_ticks (
+    id SERIAL PRIMARY KEY,
+    price DECIMAL(10,2) NOT NULL,
+    volume DECIMAL(10,4) NOT NULL DEFAULT 0,
+    source VARCHAR(10) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- OHLC/volume buckets rolled up from price_ticks on insert, one row per interval and bucket start
+CREATE TABLE price_candles (
+    interval VARCHAR(2) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    open DECIMAL(10,2) NOT NULL,
+    high DECIMAL(10,2) NOT NULL,
+    low DECIMAL(10,2) NOT NULL,
+    close DECIMAL(10,2) NOT NULL,
+    close_at TIMESTAMP NOT NULL,
+    volume DECIMAL(14,4) NOT NULL DEFAULT 0,
+    trades INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (interval, bucket)
+);
+
+CREATE OR REPLACE FUNCTION rollup_price_tick() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO price_candles AS c (interval, bucket, open, high, low, close, close_at, volume, trades)
+    SELECT i.interval, date_trunc(i.unit, NEW.created_at), NEW.price, NEW.price, NEW.price, NEW.price,
+           NEW.created_at, NEW.volume, CASE WHEN NEW.source = 'set_price' THEN 0 ELSE 1 END
+    FROM (VALUES ('1m', 'minute'), ('1h', 'hour'), ('1d', 'day')) AS i(interval, unit)
+    ON CONFLICT (interval, bucket) DO UPDATE
+    SET high = GREATEST(c.high, EXCLUDED.high),
+        low = LEAST(c.low, EXCLUDED.low),
+        close = CASE WHEN EXCLUDED.close_at >= c.close_at THEN EXCLUDED.close ELSE c.close END,
+        close_at = GREATEST(c.close_at, EXCLUDED.close_at),
+        volume = c.volume + EXCLUDED.volume,
+        trades = c.trades + EXCLUDED.trades;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER price_ticks_rollup
+    AFTER INSERT ON price_ticks
+    FOR EACH ROW
+    EXECUTE PROCEDURE rollup_price_tick();
+
+CREATE OR REPLACE FUNCTION record_trade_tick() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO price_ticks (price, volume, source, created_at)
+    VALUES (NEW.price, NEW.amount, NEW.type, COALESCE(NEW.created_at, CURRENT_TIMESTAMP));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER transactions_price_tick
+    AFTER INSERT ON transactions
+    FOR EACH ROW
+    EXECUTE PROCEDURE record_trade_tick();
+
+CREATE OR REPLACE FUNCTION record_price_change_tick() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO price_ticks (price, source, created_at)
+    VALUES (NEW.value::numeric, 'set_price', COALESCE(NEW.updated_at, CURRENT_TIMESTAMP));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER settings_price_tick
+    AFTER UPDATE OF value ON settings
+    FOR EACH ROW
+    WHEN (NEW.key = 'current_price' AND OLD.value IS DISTINCT FROM NEW.value)
+    EXECUTE PROCEDURE record_price_change_tick();
+
+-- Seed history from the existing ledger, then the price in effect now
+INSERT INTO price_ticks (price, volume, source, created_at)
+SELECT price, amount, type, created_at FROM transactions ORDER BY id;
+
+INSERT INTO price_ticks (price, source, created_at)
+SELECT value::numeric, 'set_price', COALESCE(updated_at, CURRENT_TIMESTAMP)
+FROM settings WHERE key = 'current_price';
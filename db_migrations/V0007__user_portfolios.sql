@@ -0,0 +1,31 @@
+-- Per-user trading totals, updated in the same transaction as each buy and sell
+CREATE TABLE user_portfolios (
+    user_id INTEGER PRIMARY KEY,
+    bought_amount NUMERIC NOT NULL DEFAULT 0,
+    bought_cost NUMERIC NOT NULL DEFAULT 0,
+    sold_amount NUMERIC NOT NULL DEFAULT 0,
+    sold_proceeds NUMERIC NOT NULL DEFAULT 0,
+    fees_paid NUMERIC NOT NULL DEFAULT 0,
+    realized_pnl NUMERIC NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Realized P&L of a sell is measured against the average buy price up to that sell
+INSERT INTO user_portfolios (user_id, bought_amount, bought_cost, sold_amount, sold_proceeds, fees_paid, realized_pnl)
+SELECT user_id,
+       COALESCE(SUM(amount) FILTER (WHERE type = 'buy'), 0),
+       COALESCE(SUM(amount * price) FILTER (WHERE type = 'buy'), 0),
+       COALESCE(SUM(amount) FILTER (WHERE type = 'sell'), 0),
+       COALESCE(SUM(amount * price) FILTER (WHERE type = 'sell'), 0),
+       COALESCE(SUM(commission), 0),
+       COALESCE(SUM(amount * price - commission - amount * COALESCE(buy_cost / NULLIF(buy_amount, 0), 0))
+                FILTER (WHERE type = 'sell'), 0)
+FROM (
+    SELECT user_id, type, amount, price, commission,
+           SUM(amount) FILTER (WHERE type = 'buy') OVER w AS buy_amount,
+           SUM(amount * price) FILTER (WHERE type = 'buy') OVER w AS buy_cost
+    FROM transactions
+    WHERE user_id IS NOT NULL
+    WINDOW w AS (PARTITION BY user_id ORDER BY id)
+) ledger
+GROUP BY user_id;
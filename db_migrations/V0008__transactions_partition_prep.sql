@@ -0,0 +1,21 @@
+-- Step 1 of moving transactions onto monthly partitions without a long lock.
+-- Every row written before the cutover stays in the current table, which V0010
+-- attaches as the partition below the cutover; a NOT VALID check only takes a
+-- brief lock here and is validated concurrently in V0009
+CREATE TABLE transactions_partition_cutover (
+    cutover TIMESTAMP NOT NULL
+);
+
+-- At least a week ahead, so V0009 and V0010 are deployed before it passes
+INSERT INTO transactions_partition_cutover (cutover)
+VALUES (date_trunc('month', LOCALTIMESTAMP + INTERVAL '7 days') + INTERVAL '1 month');
+
+DO $$
+BEGIN
+    EXECUTE format(
+        'ALTER TABLE transactions ADD CONSTRAINT transactions_before_cutover
+             CHECK (created_at IS NOT NULL AND created_at < %L) NOT VALID',
+        (SELECT cutover FROM transactions_partition_cutover)
+    );
+END;
+$$;
@@ -0,0 +1,5 @@
+-- Step 2b: build the (id, created_at) key V0010 turns into the legacy partition's
+-- primary key, so attaching needs no index build. CONCURRENTLY cannot run inside a
+-- transaction block, so this migration holds nothing else and runs outside one
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS transactions_id_created_at_key
+    ON transactions (id, created_at);
@@ -0,0 +1,4 @@
+-- Step 2: scan the existing rows while inserts keep running. VALIDATE CONSTRAINT
+-- takes SHARE UPDATE EXCLUSIVE, so writes go on; with the check validated,
+-- attaching the table in V0010 needs no scan
+ALTER TABLE transactions VALIDATE CONSTRAINT transactions_before_cutover;
@@ -0,0 +1,95 @@
+-- Step 3: swap in a parent partitioned by month on created_at. The old table
+-- becomes the partition below the cutover; its check validated in V0009
+-- and (id, created_at) index from V0009_1 let ATTACH skip both the scan and the
+-- index build, so every lock taken here is brief. The old single-column key
+-- gives way to the parent's (id, created_at) key; ids still come from one sequence
+ALTER TABLE transactions RENAME TO transactions_legacy;
+ALTER TABLE transactions_legacy DROP CONSTRAINT transactions_pkey;
+ALTER TABLE transactions_legacy ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE transactions_legacy
+    ADD CONSTRAINT transactions_legacy_pkey PRIMARY KEY USING INDEX transactions_id_created_at_key;
+DROP TRIGGER transactions_price_tick ON transactions_legacy;
+
+CREATE TABLE transactions (
+    id INTEGER NOT NULL DEFAULT nextval('transactions_id_seq'),
+    user_id INTEGER,
+    type VARCHAR(10) NOT NULL,
+    amount DECIMAL(10,4) NOT NULL,
+    price DECIMAL(10,2) NOT NULL,
+    commission DECIMAL(10,2) DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id;
+CREATE INDEX transactions_user_id_idx ON transactions (user_id);
+
+DO $$
+BEGIN
+    EXECUTE format(
+        'ALTER TABLE transactions ATTACH PARTITION transactions_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+        (SELECT cutover FROM transactions_partition_cutover)
+    );
+END;
+$$;
+
+ALTER TABLE transactions_legacy DROP CONSTRAINT transactions_before_cutover;
+DROP TABLE transactions_partition_cutover;
+
+-- Creates transactions_yYYYYmMM for this month and the next months_ahead;
+-- months still below the legacy cutover are skipped
+CREATE OR REPLACE FUNCTION create_transactions_partitions(months_ahead INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    month_start TIMESTAMP;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        month_start := date_trunc('month', LOCALTIMESTAMP) + make_interval(months => i);
+        partition_name := 'transactions_y' || to_char(month_start, 'YYYY') || 'm' || to_char(month_start, 'MM');
+        CONTINUE WHEN to_regclass(partition_name) IS NOT NULL;
+        BEGIN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF transactions FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month_start, month_start + INTERVAL '1 month'
+            );
+            created := created + 1;
+        EXCEPTION WHEN invalid_object_definition THEN
+            NULL;
+        END;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_transactions_partitions(3);
+
+-- Catches rows if maintenance ever falls behind; kept empty so creating a month is cheap
+CREATE TABLE transactions_default PARTITION OF transactions DEFAULT;
+
+CREATE TRIGGER transactions_price_tick
+    AFTER INSERT ON transactions
+    FOR EACH ROW
+    EXECUTE PROCEDURE record_trade_tick();
+
+-- Partitions past retention are folded into chunks of compact JSON arrays,
+-- which TOAST stores compressed, and then dropped
+CREATE TABLE transactions_archive (
+    month TIMESTAMP NOT NULL,
+    chunk INTEGER NOT NULL,
+    row_count INTEGER NOT NULL,
+    min_id INTEGER NOT NULL,
+    max_id INTEGER NOT NULL,
+    rows JSONB NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (month, chunk)
+);
+
+-- The full ledger, live and archived, for rebuilds that must see every trade
+CREATE VIEW transactions_ledger AS
+SELECT id, user_id, type, amount, price, commission, created_at
+FROM transactions
+UNION ALL
+SELECT (r->>0)::integer, (r->>1)::integer, r->>2, (r->>3)::numeric, (r->>4)::numeric,
+       (r->>5)::numeric, (r->>6)::timestamp
+FROM transactions_archive a, jsonb_array_elements(a.rows) r;
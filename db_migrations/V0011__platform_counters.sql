@@ -0,0 +1,129 @@
+-- Rollup counters behind admin?action=stats. Each total is spread over 16 shard
+-- rows picked by backend pid, so concurrent writers rarely contend on one row;
+-- a reading sums at most 16 rows per counter whatever the table sizes
+CREATE TABLE platform_counters (
+    name VARCHAR(30) NOT NULL,
+    shard SMALLINT NOT NULL,
+    value NUMERIC NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, shard)
+);
+
+CREATE OR REPLACE FUNCTION bump_platform_counter(counter_name TEXT, delta NUMERIC) RETURNS void AS $$
+BEGIN
+    IF delta IS NULL OR delta = 0 THEN
+        RETURN;
+    END IF;
+    INSERT INTO platform_counters AS c (name, shard, value)
+    VALUES (counter_name, pg_backend_pid() % 16, delta)
+    ON CONFLICT (name, shard) DO UPDATE SET value = c.value + EXCLUDED.value;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement triggers read transition tables, so a multi-row write such as the
+-- click flush bumps each counter once
+CREATE OR REPLACE FUNCTION count_users_inserted() RETURNS trigger AS $$
+BEGIN
+    PERFORM bump_platform_counter('users', (SELECT COUNT(*) FROM new_rows));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER users_counters
+    AFTER INSERT ON users
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_users_inserted();
+
+CREATE OR REPLACE FUNCTION count_balances_inserted() RETURNS trigger AS $$
+BEGIN
+    PERFORM bump_platform_counter('supply', (SELECT SUM(crypto_balance) FROM new_rows));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION count_balances_updated() RETURNS trigger AS $$
+BEGIN
+    PERFORM bump_platform_counter('supply',
+        (SELECT COALESCE(SUM(crypto_balance), 0) FROM new_rows) - (SELECT COALESCE(SUM(crypto_balance), 0) FROM old_rows));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER user_balances_insert_counters
+    AFTER INSERT ON user_balances
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_balances_inserted();
+
+CREATE TRIGGER user_balances_update_counters
+    AFTER UPDATE ON user_balances
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_balances_updated();
+
+CREATE OR REPLACE FUNCTION count_transactions_inserted() RETURNS trigger AS $$
+DECLARE
+    totals RECORD;
+BEGIN
+    FOR totals IN
+        SELECT type, COUNT(*) AS trades, SUM(amount) AS amount, SUM(amount * price) AS value,
+               SUM(commission) AS commission
+        FROM new_rows
+        GROUP BY type
+    LOOP
+        PERFORM bump_platform_counter(totals.type || '_count', totals.trades);
+        PERFORM bump_platform_counter(totals.type || '_amount', totals.amount);
+        PERFORM bump_platform_counter(totals.type || '_value', totals.value);
+        PERFORM bump_platform_counter('commission', totals.commission);
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER transactions_counters
+    AFTER INSERT ON transactions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_transactions_inserted();
+
+CREATE OR REPLACE FUNCTION count_purchase_requests_inserted() RETURNS trigger AS $$
+BEGIN
+    PERFORM bump_platform_counter('pending_requests',
+        (SELECT COUNT(*) FROM new_rows WHERE status = 'pending'));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION count_purchase_requests_updated() RETURNS trigger AS $$
+BEGIN
+    PERFORM bump_platform_counter('pending_requests',
+        (SELECT COUNT(*) FROM new_rows WHERE status = 'pending') - (SELECT COUNT(*) FROM old_rows WHERE status = 'pending'));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER purchase_requests_insert_counters
+    AFTER INSERT ON purchase_requests
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_purchase_requests_inserted();
+
+CREATE TRIGGER purchase_requests_update_counters
+    AFTER UPDATE ON purchase_requests
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_purchase_requests_updated();
+
+-- Seed from the tables as they stand; writes that commit while this runs are
+-- picked up by the next admin reconcile_stats
+INSERT INTO platform_counters (name, shard, value)
+SELECT name, 0, value
+FROM (
+    SELECT 'users' AS name, COUNT(*)::numeric AS value FROM users
+    UNION ALL SELECT 'supply', COALESCE(SUM(crypto_balance), 0) FROM user_balances
+    UNION ALL SELECT 'pending_requests', COUNT(*) FROM purchase_requests WHERE status = 'pending'
+    UNION ALL SELECT 'commission', COALESCE(SUM(commission), 0) FROM transactions_ledger
+    UNION ALL SELECT type || '_count', COUNT(*) FROM transactions_ledger GROUP BY type
+    UNION ALL SELECT type || '_amount', SUM(amount) FROM transactions_ledger GROUP BY type
+    UNION ALL SELECT type || '_value', SUM(amount * price) FROM transactions_ledger GROUP BY type
+) seed;
@@ -0,0 +1,9 @@
+-- Token buckets shared by all function instances when RATE_LIMIT_SHARED=1.
+-- Unlogged: losing them on a crash only resets everyone to a full bucket
+CREATE UNLOGGED TABLE rate_limit_buckets (
+    user_id INTEGER NOT NULL,
+    action VARCHAR(30) NOT NULL,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, action)
+);
@@ -0,0 +1,23 @@
+-- Limit orders for the trading order book. The open rows are the book: each trading
+-- instance matches in memory, rebuilds from them on a cold start and catches up on
+-- other instances' writes through version, bumped from one sequence on every change
+CREATE SEQUENCE orders_version_seq;
+
+CREATE TABLE orders (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    side VARCHAR(4) NOT NULL CHECK (side IN ('buy', 'sell')),
+    price DECIMAL(10,2) NOT NULL CHECK (price > 0),
+    amount DECIMAL(10,4) NOT NULL CHECK (amount > 0),
+    remaining DECIMAL(10,4) NOT NULL CHECK (remaining >= 0 AND remaining <= amount),
+    status VARCHAR(10) NOT NULL DEFAULT 'open' CHECK (status IN ('open', 'filled', 'cancelled')),
+    version BIGINT NOT NULL DEFAULT nextval('orders_version_seq'),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER SEQUENCE orders_version_seq OWNED BY orders.version;
+
+CREATE INDEX idx_orders_version ON orders(version);
+CREATE INDEX idx_orders_open ON orders(id) WHERE status = 'open';
+CREATE INDEX idx_orders_user_id ON orders(user_id);
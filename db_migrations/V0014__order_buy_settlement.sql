@@ -0,0 +1,5 @@
+-- Buys on the order book are paid off-platform like purchase requests: a buy order
+-- carries the buyer's payment reference, and each of its fills becomes a pending
+-- purchase request that credits the buyer only once an admin approves it
+ALTER TABLE orders ADD COLUMN signature TEXT;
+ALTER TABLE purchase_requests ADD COLUMN order_id INTEGER;
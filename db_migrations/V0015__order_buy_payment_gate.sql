@@ -0,0 +1,12 @@
+-- Buy orders are paid off-platform, so they are gated before they reach the book
+-- rather than per fill: placing one files a purchase request of kind 'order' at the
+-- limit price, and once an admin approves it the trading engine enters the order,
+-- settling both sides of every fill in its batch. order_id is set at that point
+ALTER TABLE purchase_requests
+    ADD COLUMN kind VARCHAR(10) NOT NULL DEFAULT 'purchase' CHECK (kind IN ('purchase', 'order'));
+
+CREATE INDEX idx_purchase_requests_order_release ON purchase_requests(id)
+    WHERE kind = 'order' AND status = 'approved' AND order_id IS NULL;
+
+-- The payment reference lives on the purchase request
+ALTER TABLE orders DROP COLUMN signature;
@@ -0,0 +1,3 @@
+-- A payment reference pays for exactly one buy order
+CREATE UNIQUE INDEX idx_purchase_requests_order_signature ON purchase_requests(signature)
+    WHERE kind = 'order';
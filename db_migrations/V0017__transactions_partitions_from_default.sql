@@ -0,0 +1,44 @@
+-- Rows that landed in transactions_default while maintenance was behind made
+-- creating their month fail with check_violation. Such a month is now built
+-- beside the table, the rows are moved over and it is attached, all in the
+-- caller's transaction. Only a DELETE on the partition and an INSERT into the
+-- detached table run, so no insert trigger sees the moved rows a second time
+CREATE OR REPLACE FUNCTION create_transactions_partitions(months_ahead INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    month_start TIMESTAMP;
+    month_end TIMESTAMP;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        month_start := date_trunc('month', LOCALTIMESTAMP) + make_interval(months => i);
+        month_end := month_start + INTERVAL '1 month';
+        partition_name := 'transactions_y' || to_char(month_start, 'YYYY') || 'm' || to_char(month_start, 'MM');
+        CONTINUE WHEN to_regclass(partition_name) IS NOT NULL;
+        BEGIN
+            IF EXISTS (SELECT 1 FROM transactions_default WHERE created_at >= month_start AND created_at < month_end) THEN
+                EXECUTE format('CREATE TABLE %I (LIKE transactions INCLUDING DEFAULTS)', partition_name);
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM transactions_default WHERE created_at >= %L AND created_at < %L RETURNING *)
+                     INSERT INTO %I SELECT * FROM moved',
+                    month_start, month_end, partition_name
+                );
+                EXECUTE format(
+                    'ALTER TABLE transactions ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, month_start, month_end
+                );
+                RAISE NOTICE 'moved default-partition rows into %', partition_name;
+            ELSE
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF transactions FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, month_start, month_end
+                );
+            END IF;
+            created := created + 1;
+        EXCEPTION WHEN invalid_object_definition THEN
+            NULL;
+        END;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
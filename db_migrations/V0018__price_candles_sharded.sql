@@ -0,0 +1,35 @@
+-- Every trade upserted the same three current-bucket rows (1m, 1h, 1d), so all
+-- writers of transactions queued on them. Each bucket is now spread over 16
+-- shard rows picked by backend pid, like platform_counters, and merged when
+-- read. open_at lets a reading pick the open of the earliest shard
+ALTER TABLE price_candles
+    ADD COLUMN shard SMALLINT NOT NULL DEFAULT 0,
+    ADD COLUMN open_at TIMESTAMP;
+
+UPDATE price_candles SET open_at = bucket;
+
+ALTER TABLE price_candles
+    ALTER COLUMN open_at SET NOT NULL,
+    ALTER COLUMN shard DROP DEFAULT,
+    DROP CONSTRAINT price_candles_pkey,
+    ADD PRIMARY KEY (interval, bucket, shard);
+
+CREATE OR REPLACE FUNCTION rollup_price_tick() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO price_candles AS c (interval, bucket, shard, open, open_at, high, low, close, close_at, volume, trades)
+    SELECT i.interval, date_trunc(i.unit, NEW.created_at), pg_backend_pid() % 16, NEW.price, NEW.created_at,
+           NEW.price, NEW.price, NEW.price, NEW.created_at, NEW.volume,
+           CASE WHEN NEW.source = 'set_price' THEN 0 ELSE 1 END
+    FROM (VALUES ('1m', 'minute'), ('1h', 'hour'), ('1d', 'day')) AS i(interval, unit)
+    ON CONFLICT (interval, bucket, shard) DO UPDATE
+    SET open = CASE WHEN EXCLUDED.open_at < c.open_at THEN EXCLUDED.open ELSE c.open END,
+        open_at = LEAST(c.open_at, EXCLUDED.open_at),
+        high = GREATEST(c.high, EXCLUDED.high),
+        low = LEAST(c.low, EXCLUDED.low),
+        close = CASE WHEN EXCLUDED.close_at >= c.close_at THEN EXCLUDED.close ELSE c.close END,
+        close_at = GREATEST(c.close_at, EXCLUDED.close_at),
+        volume = c.volume + EXCLUDED.volume,
+        trades = c.trades + EXCLUDED.trades;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
@@ -18,6 +18,7 @@ import {
 
 const ADMIN_API = 'https://functions.poehali.dev/9c029e11-2967-4277-9d91-17aece5c7c23';
 const ADMIN_PASSWORD = 'EE%adminA%%';
+const LONG_POLL_SECONDS = 25;
 
 interface User {
   id: number;
@@ -51,6 +52,7 @@ interface PurchaseRequest {
   signature: string;
   status: string;
   createdAt: string;
+  kind: 'purchase' | 'order';
 }
 
 export default function AdminPage() {
@@ -66,21 +68,34 @@ export default function AdminPage() {
   const [newLottery, setNewLottery] = useState({ prize: '' });
   const [loading, setLoading] = useState(false);
 
+  const lastRequestId = useRef(0);
+
   useEffect(() => {
     if (isAuthenticated) {
-      loadData();
-      const interval = setInterval(loadPurchaseRequests, 3000);
-      return () => clearInterval(interval);
+      let cancelled = false;
+      loadData().then(async () => {
+        while (!cancelled) {
+          await waitForPurchaseRequests();
+        }
+      });
+      return () => {
+        cancelled = true;
+      };
     }
   }, [isAuthenticated]);
 
   const loadData = async () => {
-    await Promise.all([
-      loadUsers(),
-      loadPromotions(),
-      loadLotteries(),
-      loadPurchaseRequests()
-    ]);
+    try {
+      const data = await apiCall('overview');
+      const requests: PurchaseRequest[] = data.requests || [];
+      lastRequestId.current = Math.max(lastRequestId.current, ...requests.map((r) => r.id));
+      setUsers(data.users || []);
+      setPromotions(data.promotions || []);
+      setLotteries(data.lotteries || []);
+      setPurchaseRequests(requests);
+    } catch (error) {
+      console.error('Error loading overview:', error);
+    }
   };
 
   const apiCall = async (action: string, method: string = 'GET', body?: any) => {
@@ -126,12 +141,42 @@ export default function AdminPage() {
   const loadPurchaseRequests = async () => {
     try {
       const data = await apiCall('purchase_requests');
-      setPurchaseRequests(data.requests || []);
+      const requests: PurchaseRequest[] = data.requests || [];
+      lastRequestId.current = Math.max(lastRequestId.current, ...requests.map((r) => r.id));
+      setPurchaseRequests(requests);
     } catch (error) {
       console.error('Error loading purchase requests:', error);
     }
   };
 
+  const waitForPurchaseRequests = async () => {
+    try {
+      const response = await fetch(
+        `${ADMIN_API}?action=purchase_requests&wait=${LONG_POLL_SECONDS}&afterId=${lastRequestId.current}`,
+        { headers: { 'X-Admin-Password': ADMIN_PASSWORD } }
+      );
+      if (response.status === 204) return;
+      if (!response.ok) throw new Error(`HTTP ${response.status}`);
+      const data = await response.json();
+      const changed: PurchaseRequest[] = data.requests || [];
+      lastRequestId.current = Math.max(lastRequestId.current, ...changed.map((r) => r.id));
+      setPurchaseRequests((current) => {
+        const byId = new Map(current.map((r) => [r.id, r]));
+        for (const request of changed) {
+          if (request.status === 'pending') {
+            byId.set(request.id, request);
+          } else {
+            byId.delete(request.id);
+          }
+        }
+        return [...byId.values()].sort((a, b) => b.createdAt.localeCompare(a.createdAt));
+      });
+    } catch (error) {
+      console.error('Error waiting for purchase requests:', error);
+      await new Promise((resolve) => setTimeout(resolve, 3000));
+    }
+  };
+
   const handleLogin = () => {
     if (passwordInput === ADMIN_PASSWORD) {
       setIsAuthenticated(true);
@@ -243,6 +288,22 @@ export default function AdminPage() {
     }
   };
 
+  const handleBulkDecision = async (approved: boolean) => {
+    setLoading(true);
+    try {
+      const decisions = purchaseRequests.map((req) => ({ requestId: req.id, approved }));
+      const data = await apiCall('', 'POST', { action: 'approve_purchases', decisions });
+      const done = (data.results || []).filter((r: { status: string }) => r.status !== 'not_found').length;
+      toast.success(approved ? `Одобрено заявок: ${done}` : `Отклонено заявок: ${done}`);
+      await loadPurchaseRequests();
+      await loadUsers();
+    } catch (error) {
+      toast.error('Ошибка');
+    } finally {
+      setLoading(false);
+    }
+  };
+
   const handleRemoveCrypto = async (userId: number, amount: string) => {
     const amountNum = parseFloat(amount);
     if (!amountNum || amountNum <= 0) {
@@ -370,6 +431,28 @@ export default function AdminPage() {
               </CardTitle>
             </CardHeader>
             <CardContent className="space-y-4">
+              {purchaseRequests.length > 1 && (
+                <div className="flex gap-2">
+                  <Button 
+                    onClick={() => handleBulkDecision(true)}
+                    variant="outline"
+                    className="flex-1"
+                    disabled={loading}
+                  >
+                    <Icon name="CheckCheck" size={18} className="mr-2" />
+                    Одобрить все
+                  </Button>
+                  <Button 
+                    onClick={() => handleBulkDecision(false)}
+                    variant="outline"
+                    className="flex-1"
+                    disabled={loading}
+                  >
+                    <Icon name="X" size={18} className="mr-2" />
+                    Отклонить все
+                  </Button>
+                </div>
+              )}
               {purchaseRequests.map(req => (
                 <div key={req.id} className="p-4 bg-background rounded-lg border border-border space-y-3">
                   <div className="flex justify-between items-start">
@@ -382,7 +465,7 @@ export default function AdminPage() {
                         {new Date(req.createdAt).toLocaleString('ru-RU')}
                       </p>
                     </div>
-                    <Badge>Ожидает</Badge>
+                    <Badge>{req.kind === 'order' ? 'Лимитная заявка' : 'Ожидает'}</Badge>
                   </div>
                   <div className="p-3 bg-muted rounded text-sm">
                     <p className="text-xs text-muted-foreground mb-1">Подпись:</p>
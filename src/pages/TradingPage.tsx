@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
@@ -9,6 +9,10 @@ import { toast } from 'sonner';
 
 const TRADING_API = 'https://functions.poehali.dev/33e371c1-fb58-4d19-98df-0c919b65223c';
 const LOTTERY_API = 'https://functions.poehali.dev/f1935aa4-18f9-404c-b1b6-a7205459af6a';
+const CLICK_BATCH_MS = 1000;
+// Per-request caps of add_clicks on the server (CLICK_MAX_AMOUNT, CLICK_MAX_CLICKS)
+const CLICK_MAX_AMOUNT = 1000;
+const CLICK_MAX_CLICKS = 1000;
 
 interface Transaction {
   id: number;
@@ -45,67 +49,86 @@ export default function TradingPage({ userId, username, onLogout }: TradingPageP
   const [clicks, setClicks] = useState(0);
   const [isClicking, setIsClicking] = useState(false);
 
+  const snapshotVersion = useRef('');
+  const pendingClicks = useRef({ clicks: 0, amount: 0 });
+  const clickFlushTimer = useRef<ReturnType<typeof setTimeout> | null>(null);
+
   useEffect(() => {
-    loadData();
-    const transactionsInterval = setInterval(loadTransactions, 5000);
-    const balanceInterval = setInterval(loadBalance, 3000);
-    const priceInterval = setInterval(loadPrice, 5000);
-    const lotteriesInterval = setInterval(loadLotteries, 10000);
+    loadSnapshot();
+    const snapshotInterval = setInterval(loadSnapshot, 3000);
     return () => {
-      clearInterval(transactionsInterval);
-      clearInterval(balanceInterval);
-      clearInterval(priceInterval);
-      clearInterval(lotteriesInterval);
+      clearInterval(snapshotInterval);
+      flushClicks();
     };
   }, []);
 
-  const loadData = async () => {
-    await Promise.all([
-      loadPrice(),
-      loadBalance(),
-      loadTransactions(),
-      loadLotteries()
-    ]);
-  };
-
-  const loadPrice = async () => {
+  const loadSnapshot = async () => {
     try {
-      const response = await fetch(`${TRADING_API}?action=price`);
+      const response = await fetch(
+        `${TRADING_API}?action=snapshot&userId=${userId}&version=${snapshotVersion.current}`
+      );
+      if (response.status === 304) return;
       const data = await response.json();
+      snapshotVersion.current = data.version;
       setPrice(data.price);
       setCommission(data.commission);
-    } catch (error) {
-      console.error('Error loading price:', error);
-    }
-  };
-
-  const loadBalance = async () => {
-    try {
-      const response = await fetch(`${TRADING_API}?action=balance&userId=${userId}`);
-      const data = await response.json();
       setCryptoBalance(data.cryptoBalance);
-    } catch (error) {
-      console.error('Error loading balance:', error);
-    }
-  };
-
-  const loadTransactions = async () => {
-    try {
-      const response = await fetch(`${TRADING_API}?action=transactions`);
-      const data = await response.json();
       setTransactions(data.transactions);
+      setLotteries(data.lotteries);
     } catch (error) {
-      console.error('Error loading transactions:', error);
+      console.error('Error loading snapshot:', error);
     }
   };
 
-  const loadLotteries = async () => {
+  const flushClicks = async () => {
+    clickFlushTimer.current = null;
+    const pending = pendingClicks.current;
+    if (!pending.clicks) return;
+    // A request stays within the server's caps; whatever is left goes in the next
+    // batch, keeping at least one click to carry the remaining amount
+    let clicks = Math.min(pending.clicks, CLICK_MAX_CLICKS);
+    const amount = Math.min(pending.amount, CLICK_MAX_AMOUNT);
+    if (clicks === pending.clicks && amount < pending.amount && clicks > 1) clicks -= 1;
+    const batch = { clicks, amount };
+    const rest = clicks < pending.clicks
+      ? { clicks: pending.clicks - clicks, amount: pending.amount - amount }
+      : { clicks: 0, amount: 0 };
+    if (!rest.clicks && pending.amount > amount) {
+      // A single click worth more than one request can carry is never accepted
+      setCryptoBalance((balance) => balance - (pending.amount - amount));
+    }
+    pendingClicks.current = rest;
+    if (rest.clicks && !clickFlushTimer.current) {
+      clickFlushTimer.current = setTimeout(flushClicks, CLICK_BATCH_MS);
+    }
     try {
-      const response = await fetch(LOTTERY_API);
-      const data = await response.json();
-      setLotteries(data.lotteries);
+      const response = await fetch(TRADING_API, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          action: 'add_clicks',
+          userId,
+          amount: batch.amount,
+          clicks: batch.clicks
+        })
+      });
+      if (response.status === 429) {
+        // Over the rate limit: keep the clicks and send them once the server allows
+        pendingClicks.current = {
+          clicks: pendingClicks.current.clicks + batch.clicks,
+          amount: pendingClicks.current.amount + batch.amount
+        };
+        const retryAfter = Number(response.headers.get('Retry-After')) || 1;
+        if (clickFlushTimer.current) clearTimeout(clickFlushTimer.current);
+        clickFlushTimer.current = setTimeout(flushClicks, retryAfter * 1000);
+      } else if (!response.ok) {
+        // Refused clicks were never credited, so the optimistic balance is taken back
+        setCryptoBalance((balance) => balance - batch.amount);
+        toast.error('Не удалось засчитать клики');
+      }
     } catch (error) {
-      console.error('Error loading lotteries:', error);
+      setCryptoBalance((balance) => balance - batch.amount);
+      console.error('Click error:', error);
     }
   };
 
@@ -189,8 +212,7 @@ export default function TradingPage({ userId, username, onLogout }: TradingPageP
       const total = amountNum * price - commissionAmount;
       toast.success(`Продано ${amountNum} EE%A за ${total.toFixed(2)} ₽ (комиссия: ${commissionAmount.toFixed(2)} ₽)`);
       setAmount('');
-      await loadBalance();
-      await loadTransactions();
+      await loadSnapshot();
     } catch (error) {
       toast.error(error instanceof Error ? error.message : 'Ошибка соединения');
     } finally {
@@ -218,7 +240,7 @@ export default function TradingPage({ userId, username, onLogout }: TradingPageP
       }
 
       toast.success('Вы участвуете в розыгрыше!');
-      await loadLotteries();
+      await loadSnapshot();
     } catch (error) {
       toast.error(error instanceof Error ? error.message : 'Ошибка соединения');
     }
@@ -273,30 +295,18 @@ export default function TradingPage({ userId, username, onLogout }: TradingPageP
 
           <Card 
             className="bg-gradient-to-br from-primary to-secondary cursor-pointer transition-transform hover:scale-105 active:scale-95"
-            onClick={async () => {
+            onClick={() => {
               if (isClicking) return;
               setIsClicking(true);
               const newClicks = clicks + 1;
               setClicks(newClicks);
               const earned = newClicks * 0.02;
-              
-              try {
-                const response = await fetch(TRADING_API, {
-                  method: 'POST',
-                  headers: { 'Content-Type': 'application/json' },
-                  body: JSON.stringify({
-                    action: 'add_clicks',
-                    userId,
-                    amount: earned
-                  })
-                });
-                if (response.ok) {
-                  await loadBalance();
-                }
-              } catch (error) {
-                console.error('Click error:', error);
+              pendingClicks.current.clicks += 1;
+              pendingClicks.current.amount += earned;
+              setCryptoBalance((balance) => balance + earned);
+              if (!clickFlushTimer.current) {
+                clickFlushTimer.current = setTimeout(flushClicks, CLICK_BATCH_MS);
               }
-              
               setTimeout(() => setIsClicking(false), 100);
             }}
           >
@@ -0,0 +1,54 @@
+import os
+import sys
+import uuid
+from typing import Any, Callable
+
+import psycopg2
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bench'))
+
+from common import load_function  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def trading() -> Any:
+    return load_function('trading')
+
+
+@pytest.fixture(scope='session')
+def admin() -> Any:
+    return load_function('admin')
+
+
+@pytest.fixture
+def db() -> Any:
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        pytest.skip('DATABASE_URL must point at a scratch Postgres database with db_migrations applied')
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def trading_conn(trading: Any, db: Any) -> Any:
+    conn = trading.DB_POOL.acquire(os.environ['DATABASE_URL'])
+    yield conn
+    trading.DB_POOL.release(conn)
+
+
+@pytest.fixture
+def make_user(db: Any) -> Callable[[float], int]:
+    '''
+    Returns: a factory creating a user with the given crypto balance, each with a unique username
+    '''
+    def create(balance: float = 0) -> int:
+        with db.cursor() as cur:
+            cur.execute("INSERT INTO users (username) VALUES (%s) RETURNING id", (f'test_{uuid.uuid4().hex[:12]}',))
+            user_id = cur.fetchone()[0]
+            cur.execute("INSERT INTO user_balances (user_id, crypto_balance) VALUES (%s, %s)", (user_id, balance))
+        return user_id
+
+    return create
@@ -0,0 +1,60 @@
+import json
+import re
+
+import psycopg2
+
+from common import ADMIN_PASSWORD, make_event
+
+HEADERS = {'X-Admin-Password': ADMIN_PASSWORD}
+
+
+def long_poll(admin, wait='0.2'):
+    return admin.handler(make_event('GET', {'action': 'purchase_requests', 'wait': wait,
+                                            'afterId': str(2 ** 31 - 1)}, None, HEADERS), None)
+
+
+def test_long_poll_rejects_malformed_parameters(admin, db):
+    for query in ({'wait': 'inf'}, {'wait': 'nan'}, {'wait': '1', 'afterId': 'x'}):
+        response = admin.handler(make_event('GET', dict(query, action='purchase_requests'), None, HEADERS), None)
+        assert response['statusCode'] == 400
+
+
+def test_failed_listener_poll_answers_503_and_reconnects(admin, db, monkeypatch):
+    listener = admin.PURCHASE_REQUEST_LISTENER
+    poll = listener._poll
+
+    def dropped(dsn, timeout):
+        listener._connect(dsn).close()
+        raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+    monkeypatch.setattr(listener, '_poll', dropped)
+    response = long_poll(admin)
+    assert response['statusCode'] == 503
+    assert json.loads(response['body'])['error']
+
+    monkeypatch.setattr(listener, '_poll', poll)
+    reconnects = listener.snapshot()['reconnects']
+    assert long_poll(admin)['statusCode'] == 204
+    assert listener.snapshot()['reconnects'] == reconnects + 1
+
+
+def test_bulk_decisions_need_integer_request_ids(admin, db):
+    for decisions in ([7], [{'requestId': '7'}], [{'requestId': 7.5}], [{'requestId': True}], [{'requestId': 2 ** 31}],
+                      {'requestId': 7}, []):
+        response = admin.handler(make_event('POST', {}, {'action': 'approve_purchases', 'decisions': decisions},
+                                            HEADERS), None)
+        assert response['statusCode'] == 400, decisions
+
+    response = admin.handler(make_event('POST', {}, {'action': 'approve_purchases',
+                                                     'decisions': [{'requestId': 2 ** 31 - 1, 'approved': True}]},
+                                        HEADERS), None)
+    assert json.loads(response['body'])['results'] == [{'requestId': 2 ** 31 - 1, 'status': 'not_found'}]
+
+
+def test_overview_trace_counts_the_sections_loaded_by_workers(admin, db):
+    response = admin.handler(make_event('GET', {'action': 'overview'}, None, HEADERS), None)
+    assert response['statusCode'] == 200
+    assert set(json.loads(response['body'])) == set(admin.OVERVIEW_SECTIONS)
+    # One statement per section, whichever connection ran it
+    round_trips = re.search(r'(\d+) round trips', response['headers']['Server-Timing'])
+    assert int(round_trips.group(1)) >= len(admin.OVERVIEW_SECTIONS)
@@ -0,0 +1,31 @@
+from decimal import Decimal
+
+
+def test_miss_read_before_a_write_through_does_not_cache_its_stale_value(trading, trading_conn, make_user,
+                                                                         monkeypatch):
+    user_id = make_user(5)
+    cache = trading.BalanceCache(max_size=10, ttl=60)
+    execute = trading.PREPARED.execute
+
+    def read_then_write_through(cur, name, args=()):
+        # The balance row is read, then this instance writes the user's new
+        # balance through the cache before the miss gets to fill it
+        execute(cur, name, args)
+        cache.put(user_id, Decimal('7'))
+
+    monkeypatch.setattr(trading.PREPARED, 'execute', read_then_write_through)
+    assert cache.get(trading_conn, user_id) == Decimal('5')
+    monkeypatch.setattr(trading.PREPARED, 'execute', execute)
+
+    assert cache.get(trading_conn, user_id) == Decimal('7')
+    assert cache.snapshot()['staleFills'] == 1
+
+
+def test_miss_read_fills_the_cache_when_nothing_was_written_meanwhile(trading, trading_conn, make_user):
+    user_id = make_user(5)
+    cache = trading.BalanceCache(max_size=10, ttl=60)
+    cache.invalidate(user_id)
+
+    assert cache.get(trading_conn, user_id) == Decimal('5')
+    assert cache.get(trading_conn, user_id) == Decimal('5')
+    assert cache.snapshot()['hits'] == 1
@@ -0,0 +1,26 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import psycopg2
+
+from common import make_event
+
+
+def test_candle_shards_from_different_writers_merge_into_one_candle(trading, db):
+    # A minute no other test writes to; each connection is its own backend,
+    # so the ticks usually land on different shard rows of the same bucket
+    minute = datetime(2001, 1, 1, 0, 0) + timedelta(minutes=int.from_bytes(os.urandom(2), 'big'))
+    ticks = [(10, 2, 30), (12, 1, 10), (9, 3, 50), (11, 1, 20)]
+    for price, volume, second in ticks:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        with conn, conn.cursor() as cur:
+            cur.execute("INSERT INTO price_ticks (price, volume, source, created_at) VALUES (%s, %s, 'buy', %s)",
+                        (price, volume, minute + timedelta(seconds=second)))
+        conn.close()
+
+    response = trading.handler(make_event('GET', {'action': 'candles', 'interval': '1m', 'from': minute.isoformat(),
+                                                  'to': minute.isoformat()}), None)
+    assert json.loads(response['body'])['candles'] == [{
+        'time': minute.isoformat(), 'open': 12.0, 'high': 12.0, 'low': 9.0, 'close': 9.0, 'volume': 7.0, 'trades': 4
+    }]
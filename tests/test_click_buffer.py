@@ -0,0 +1,50 @@
+from decimal import Decimal
+
+import pytest
+
+from common import make_event
+
+
+def test_click_accrual_caps(trading):
+    assert trading.click_accrual({'amount': '1000', 'clicks': 1000}) == (Decimal('1000.0000'), 1000)
+    assert trading.click_accrual({'amount': '1000.0001', 'clicks': 1}) is None
+    assert trading.click_accrual({'amount': '1', 'clicks': 1001}) is None
+    assert trading.click_accrual({'amount': '0.00001', 'clicks': 1}) is None
+    assert trading.click_accrual({'amount': 'NaN', 'clicks': 1}) is None
+
+
+def test_add_clicks_over_cap_is_refused(trading, make_user):
+    response = trading.handler(make_event('POST', None, {'action': 'add_clicks', 'userId': make_user(0),
+                                                         'amount': 1000.5, 'clicks': 10}), None)
+    assert response['statusCode'] == 400
+
+
+def test_flush_drops_only_the_user_whose_balance_overflows(trading, trading_conn, db, make_user):
+    full, other = make_user(999_999), make_user(0)
+    buffer = trading.ClickBuffer(max_pending=100, flush_interval=60)
+    buffer.add(full, Decimal('5'), 1)
+    buffer.add(other, Decimal('2.5'), 1)
+
+    buffer.flush(trading_conn)
+
+    with db.cursor() as cur:
+        cur.execute("SELECT user_id, crypto_balance FROM user_balances WHERE user_id IN (%s, %s) ORDER BY user_id",
+                    (full, other))
+        assert cur.fetchall() == [(full, Decimal('999999.0000')), (other, Decimal('2.5000'))]
+    stats = buffer.snapshot()
+    assert stats['droppedUsers'] == 1
+    assert stats['pendingUsers'] == 0
+    assert stats['failedFlushes'] == 0
+
+
+def test_flush_requeues_everything_when_the_connection_fails(trading, trading_conn, make_user):
+    user_id = make_user(0)
+    buffer = trading.ClickBuffer(max_pending=100, flush_interval=60)
+    buffer.add(user_id, Decimal('1'), 1)
+    trading_conn.close()
+
+    with pytest.raises(Exception):
+        buffer.flush(trading_conn)
+
+    assert buffer.pending_for(user_id) == Decimal('1')
+    assert buffer.snapshot()['failedFlushes'] == 1
@@ -0,0 +1,28 @@
+import json
+from datetime import datetime, timedelta
+
+from common import make_event
+
+
+def test_feed_floor_follows_only_full_feeds(trading):
+    floor = trading.FeedFloor(timedelta(minutes=5))
+    start = datetime(2026, 1, 1)
+    floor.observe([start + timedelta(seconds=n) for n in range(trading.FEED_LIMIT - 1)])
+    assert floor.get() is None
+
+    floor.observe([start + timedelta(seconds=n) for n in range(trading.FEED_LIMIT)])
+    assert floor.get() == start - timedelta(minutes=5)
+
+    # A full feed reaching further back, like one from a lagging instance, never lowers it
+    floor.observe([start - timedelta(days=1) + timedelta(seconds=n) for n in range(trading.FEED_LIMIT)])
+    assert floor.get() == start - timedelta(minutes=5)
+
+
+def test_feed_endpoints_agree_on_the_newest_trades(trading, db):
+    latest = trading.handler(make_event('GET', {'action': 'transactions'}), None)
+    snapshot = trading.handler(make_event('GET', {'action': 'snapshot', 'userId': '1'}), None)
+    latest_ids = [t['id'] for t in json.loads(latest['body'])['transactions']]
+    assert latest_ids == [t['id'] for t in json.loads(snapshot['body'])['transactions']]
+    if latest_ids:
+        since = trading.handler(make_event('GET', {'action': 'transactions', 'sinceId': str(latest_ids[-1])}), None)
+        assert [t['id'] for t in json.loads(since['body'])['transactions']] == latest_ids[:-1]
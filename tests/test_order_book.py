@@ -0,0 +1,107 @@
+import json
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from common import ADMIN_PASSWORD, make_event
+
+# Far below any realistic ask, so these orders only meet each other
+PRICE = 0.05
+
+
+def payment():
+    return f'test payment {uuid.uuid4().hex}'
+
+
+def call(module, method, body=None, query=None, headers=None):
+    response = module.handler(make_event(method, query, body, headers), None)
+    return response['statusCode'], json.loads(response['body'] or 'null')
+
+
+def balance(db, user_id):
+    with db.cursor() as cur:
+        cur.execute("SELECT crypto_balance FROM user_balances WHERE user_id = %s", (user_id,))
+        return cur.fetchone()[0]
+
+
+def decide(admin, request_id, approved):
+    return call(admin, 'POST', {'action': 'approve_purchase', 'requestId': request_id, 'approved': approved},
+                headers={'X-Admin-Password': ADMIN_PASSWORD})
+
+
+@pytest.fixture
+def resting_ask(trading, db, make_user):
+    seller = make_user(10)
+    status, placed = call(trading, 'POST', {'action': 'place_order', 'userId': seller, 'side': 'sell',
+                                            'price': PRICE, 'amount': 2})
+    assert status == 201 and placed['status'] == 'open'
+    yield seller, placed['orderId']
+    call(trading, 'POST', {'action': 'cancel_order', 'userId': seller, 'orderId': placed['orderId']})
+
+
+def test_buy_order_waits_for_payment_approval(trading, db, make_user, resting_ask):
+    buyer = make_user(0)
+    status, body = call(trading, 'POST', {'action': 'place_order', 'userId': buyer, 'side': 'buy',
+                                          'price': PRICE, 'amount': 1, 'signature': payment()})
+    assert status == 202 and body['status'] == 'pending'
+
+    call(trading, 'GET', query={'action': 'order_book'})
+    assert balance(db, buyer) == 0
+
+
+def test_approved_buy_order_settles_both_sides(trading, admin, db, make_user, resting_ask):
+    seller, ask_id = resting_ask
+    buyer = make_user(0)
+    _, body = call(trading, 'POST', {'action': 'place_order', 'userId': buyer, 'side': 'buy',
+                                     'price': PRICE, 'amount': 1, 'signature': payment()})
+
+    assert decide(admin, body['requestId'], True)[0] == 200
+    # Approval releases the order; nothing is credited until it fills
+    assert balance(db, buyer) == 0
+
+    call(trading, 'GET', query={'action': 'order_book'})
+    assert balance(db, buyer) == Decimal('1')
+    assert balance(db, seller) == Decimal('8')
+    with db.cursor() as cur:
+        cur.execute("""SELECT o.status, o.remaining FROM purchase_requests pr JOIN orders o ON o.id = pr.order_id
+                       WHERE pr.id = %s""", (body['requestId'],))
+        assert cur.fetchone() == ('filled', Decimal('0'))
+        cur.execute("SELECT remaining FROM orders WHERE id = %s", (ask_id,))
+        assert cur.fetchone()[0] == Decimal('1')
+        cur.execute("SELECT user_id, type, amount FROM transactions WHERE user_id IN (%s, %s) ORDER BY id",
+                    (buyer, seller))
+        assert cur.fetchall() == [(buyer, 'buy', Decimal('1')), (seller, 'sell', Decimal('1'))]
+
+
+def test_rejected_buy_order_never_reaches_the_book(trading, admin, db, make_user, resting_ask):
+    seller, ask_id = resting_ask
+    buyer = make_user(0)
+    _, body = call(trading, 'POST', {'action': 'place_order', 'userId': buyer, 'side': 'buy',
+                                     'price': PRICE, 'amount': 1, 'signature': payment()})
+
+    assert decide(admin, body['requestId'], False)[0] == 200
+
+    call(trading, 'GET', query={'action': 'order_book'})
+    assert balance(db, buyer) == 0
+    # The seller's escrow is untouched and the ask keeps resting in full
+    assert balance(db, seller) == Decimal('8')
+    with db.cursor() as cur:
+        cur.execute("SELECT status, order_id FROM purchase_requests WHERE id = %s", (body['requestId'],))
+        assert cur.fetchone() == ('rejected', None)
+        cur.execute("SELECT status, remaining FROM orders WHERE id = %s", (ask_id,))
+        assert cur.fetchone() == ('open', Decimal('2'))
+
+
+def test_buy_order_without_signature_is_refused(trading, make_user):
+    status, _ = call(trading, 'POST', {'action': 'place_order', 'userId': make_user(0), 'side': 'buy',
+                                       'price': PRICE, 'amount': 1})
+    assert status == 400
+
+
+def test_buy_order_signature_pays_for_one_order(trading, make_user):
+    buyer = make_user(0)
+    order = {'action': 'place_order', 'userId': buyer, 'side': 'buy', 'price': PRICE, 'amount': 1,
+             'signature': payment()}
+    assert call(trading, 'POST', order)[0] == 202
+    assert call(trading, 'POST', order)[0] == 409